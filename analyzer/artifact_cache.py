@@ -0,0 +1,97 @@
+import hashlib
+import json
+import os
+import time
+from typing import Iterable, Optional
+
+from analyzer.disk_store import LruStore, atomic_write
+
+DEFAULT_MAX_BYTES = 4 * 1024 * 1024 * 1024
+DEFAULT_NEGATIVE_TTL_SECONDS = 7 * 24 * 3600
+# Kinds of negative entries: the project doesn't exist, it has no sdist,
+# or it has neither a wheel nor an sdist
+NOT_FOUND = "not-found"
+NO_SDIST = "no-sdist"
+NO_ARCHIVE = "no-archive"
+
+
+class ArtifactCache:
+    """An on-disk store of downloaded archives keyed by their sha256 digest.
+
+    Archives are only stored under the digest PyPI lists for them, and are
+    checked against it, so a stored archive never needs revalidating.
+    Reading an archive refreshes its modification time and the least
+    recently used archives are evicted once the store grows past
+    max_bytes. The store also remembers distributions known to have no
+    archive or no project on PyPI, until negative_ttl seconds have passed.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        negative_ttl: float = DEFAULT_NEGATIVE_TTL_SECONDS,
+    ):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.negative_ttl = negative_ttl
+        self._archives = LruStore(os.path.join(cache_dir, "sha256"), max_bytes)
+        os.makedirs(os.path.join(cache_dir, "negative"), exist_ok=True)
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.cache_dir, "sha256", digest[:2], digest)
+
+    def _negative_path(self, name: str, kind: str) -> str:
+        key = hashlib.sha256(f"{kind}\0{name}".encode()).hexdigest()
+        return os.path.join(self.cache_dir, "negative", f"{key}.json")
+
+    def lookup(self, digest: str) -> Optional[str]:
+        """Returns the path of the stored archive with this digest, or None if it isn't stored."""
+        path = self._path(digest)
+        return path if self._archives.touch(path) else None
+
+    def store(self, digest: str, source_path: str) -> None:
+        """Copies an archive into the store, raising ValueError if it doesn't match its digest."""
+        with open(source_path, "rb") as source:
+            self._store(digest, iter(lambda: source.read(1024 * 1024), b""))
+
+    def store_bytes(self, digest: str, content: bytes) -> None:
+        """Like store, for an archive held in memory."""
+        self._store(digest, [content])
+
+    def _store(self, digest: str, chunks: Iterable[bytes]) -> None:
+        try:
+            with self._archives.write(self._path(digest)) as f:
+                sha256 = hashlib.sha256()
+                for chunk in chunks:
+                    sha256.update(chunk)
+                    f.write(chunk)
+                if sha256.hexdigest() != digest:
+                    raise ValueError(f"Archive does not match its sha256 digest {digest}.")
+        except OSError as e:
+            print(f"Warning: could not store archive: {e}")
+
+    def negative(self, name: str, kind: str) -> Optional[str]:
+        """Returns why a distribution couldn't be fetched, if that was recorded less than negative_ttl ago."""
+        try:
+            with open(self._negative_path(name, kind), "r") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry["name"] != name or time.time() - entry["recorded_at"] >= self.negative_ttl:
+            return None
+        reason: str = entry["reason"]
+        return reason
+
+    def add_negative(self, name: str, kind: str, reason: str) -> None:
+        """Records that a distribution doesn't exist or has no archive, so it isn't looked up again for a while."""
+        entry = {"name": name, "reason": reason, "recorded_at": time.time()}
+        try:
+            with atomic_write(self._negative_path(name, kind)) as f:
+                f.write(json.dumps(entry).encode())
+        except OSError as e:
+            print(f"Warning: could not record missing archive: {e}")
+
+    def evict(self) -> None:
+        """Deletes the least recently used archives until the store is back under budget."""
+        self._archives.evict()
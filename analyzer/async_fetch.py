@@ -0,0 +1,356 @@
+import asyncio
+import hashlib
+import json
+import queue
+import threading
+import time
+from typing import Any, Generator, Mapping, NamedTuple, Optional
+
+import aiohttp
+
+from analyzer import http_client, package_analyzer
+from analyzer.artifact_cache import NOT_FOUND
+from analyzer.package_source import SIMPLE_ACCEPT, ArchiveDirectory, SimpleIndex, resolve_urls
+from analyzer.package_analyzer import (
+    PYPI_JSON_URL,
+    PYPI_PROJECT_URL,
+    Artifact,
+    DistributionMetadata,
+    cache_archive,
+    cached_archive,
+    describe_distribution,
+    local_archive,
+    missing_archive_kind,
+    missing_reason,
+    note_missing,
+    read_archive_sources,
+)
+from analyzer.rate_control import CircuitOpenError
+from analyzer.typeshed_checker import check_typeshed
+
+# Packages fetched at once, and finished packages waiting for the coverage stage
+fetch_concurrency = 64
+# Failures that stop the run, as connection errors do in the sequential and pipeline paths: the
+# request controller's open circuit, and connection errors and timeouts that outlasted their retries.
+# They're caught first, since CircuitOpenError and timeouts are OSErrors too.
+CONNECTION_ERRORS = (CircuitOpenError, aiohttp.ClientError, asyncio.TimeoutError)
+# Failures that cost one package its archive. OSError covers unreadable cached or local archives.
+FETCH_ERRORS = (ValueError, OSError)
+
+
+class FetchedPackage(NamedTuple):
+    """Everything analyze_package downloads for one package, fetched ahead of time."""
+
+    name: str
+    # Distribution name (the package, or the package with "-stubs") -> (archive, its content)
+    archives: dict[str, tuple[Artifact, bytes]]
+    # Distribution name -> why its archive couldn't be fetched
+    errors: dict[str, str]
+    # The -stubs project page when the package isn't in typeshed, as find_stub_package returns it
+    stub_package_url: Optional[str]
+
+
+def configure_fetch_concurrency(concurrency: int) -> None:
+    """Sets how many packages the fetch stage works on at once."""
+    global fetch_concurrency
+    fetch_concurrency = concurrency
+
+
+async def _read(response: aiohttp.ClientResponse, max_bytes: Optional[int]) -> bytes:
+    if max_bytes is None:
+        return await response.read()
+    too_large = ValueError(
+        f"{response.url} is larger than the maximum archive size of {max_bytes} bytes.")
+    if (response.content_length or 0) > max_bytes:
+        raise too_large
+    body = bytearray()
+    async for chunk in response.content.iter_chunked(package_analyzer.DOWNLOAD_CHUNK_BYTES):
+        body += chunk
+        if len(body) > max_bytes:
+            raise too_large
+    return bytes(body)
+
+
+async def _get(
+    session: aiohttp.ClientSession, url: str, max_bytes: Optional[int] = None, headers: Optional[dict[str, str]] = None
+) -> tuple[int, bytes, Mapping[str, str]]:
+    """Returns a response's status, body and headers, retrying and pacing requests like http_client.get.
+
+    Bodies over max_bytes raise ValueError as soon as they're known to be.
+    """
+    attempt = 0
+    while True:
+        controller = http_client.request_controller
+        if controller is not None:
+            await controller.acquire_async()
+        started = time.monotonic()
+        released = False
+        try:
+            async with session.get(url, headers=headers) as response:
+                if controller is not None:
+                    controller.release(time.monotonic() - started, response.status)
+                    released = True
+                if response.status not in http_client.RETRY_STATUSES or attempt >= http_client.max_retries:
+                    return response.status, await _read(response, max_bytes), response.headers
+                delay = http_client.backoff_delay(
+                    attempt, response.headers.get("Retry-After", ""))
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+            if controller is not None and not released:
+                controller.release(time.monotonic() - started, None)
+                released = True
+            if attempt >= http_client.max_retries:
+                raise
+            delay = http_client.backoff_delay(attempt)
+        finally:
+            if controller is not None and not released:
+                # Cancelled, or failed some other way before the response arrived
+                controller.release(None, None)
+        await asyncio.sleep(delay)
+        attempt += 1
+
+
+async def _cached_get(
+    session: aiohttp.ClientSession, url: str, headers: Optional[dict[str, str]] = None
+) -> tuple[int, bytes]:
+    """Like http_client.cached_get, on the event loop, with the cache read and written in worker threads."""
+    cache = http_client.http_cache
+    if cache is None:
+        status, body, _ = await _get(session, url, headers=headers)
+        return status, body
+    cached = await asyncio.to_thread(cache.load, url)
+    if cached is not None and cache.is_fresh(cached):
+        return cached.status, cached.body
+    if cache.offline:
+        return 504, b""
+    status, body, response_headers = await _get(
+        session, url, headers={**(headers or {}), **cache.conditional_headers(cached)})
+    if status == 304 and cached is not None:
+        cached = await asyncio.to_thread(cache.refresh, url, cached)
+        return cached.status, cached.body
+    await asyncio.to_thread(cache.store, url, status, body, response_headers)
+    return status, body
+
+
+async def _get_metadata(session: aiohttp.ClientSession, name: str) -> Optional[dict[str, Any]]:
+    """Returns a distribution's PyPI JSON metadata, or None if the package source doesn't have it."""
+    source = package_analyzer.package_source
+    if isinstance(source, ArchiveDirectory):
+        return await asyncio.to_thread(source.metadata, name)
+    if isinstance(source, SimpleIndex):
+        url = source.page_url(name)
+        status, body = await _cached_get(session, url, {"Accept": SIMPLE_ACCEPT})
+    else:
+        url = PYPI_JSON_URL.format(name)
+        status, body = await _cached_get(session, url)
+    if status == 404:
+        return None
+    if status != 200:
+        raise ValueError(f"HTTP {status} fetching metadata for {name}.")
+    if isinstance(source, SimpleIndex):
+        return source.metadata(name, url, body)
+    data: dict[str, Any] = json.loads(body)
+    return resolve_urls(data, url)
+
+
+async def _resolve(session: aiohttp.ClientSession, name: str) -> DistributionMetadata:
+    """Returns a distribution's manifest entry, from the prefetched manifest, the negative cache or PyPI."""
+    if name in package_analyzer.metadata_manifest:
+        return package_analyzer.metadata_manifest[name]
+    reason = missing_reason(name, NOT_FOUND)
+    if reason is not None:
+        return DistributionMetadata(name, False, None, None, reason)
+    reason = missing_reason(name, missing_archive_kind())
+    if reason is not None:
+        return DistributionMetadata(name, True, None, None, reason)
+
+    entry = describe_distribution(name, await _get_metadata(session, name))
+    if not entry.found:
+        note_missing(name, NOT_FOUND, entry.error or "")
+    elif entry.archive is None:
+        note_missing(name, missing_archive_kind(), entry.error or "")
+    return entry
+
+
+def _read_stored_archive(artifact: Artifact) -> Optional[bytes]:
+    """Reads an archive the package source or the artifact cache has on disk, or returns None if neither does."""
+    path = local_archive(artifact) or cached_archive(artifact)
+    if path is None:
+        return None
+    with open(path, "rb") as f:
+        return f.read()
+
+
+async def _get_archive(session: aiohttp.ClientSession, entry: DistributionMetadata) -> tuple[Artifact, bytes]:
+    artifact = entry.archive
+    if artifact is None:
+        raise ValueError(entry.error)
+    stored = await asyncio.to_thread(_read_stored_archive, artifact)
+    if stored is not None:
+        return artifact, stored
+
+    status, content, _ = await _get(session, artifact.url, package_analyzer.max_archive_bytes)
+    if status != 200:
+        raise ValueError(f"HTTP {status} downloading {artifact.url}.")
+    if artifact.sha256 and hashlib.sha256(content).hexdigest() != artifact.sha256:
+        raise ValueError(f"{artifact.url} does not match its sha256 digest {artifact.sha256}.")
+    await asyncio.to_thread(cache_archive, artifact, content=content)
+    return artifact, content
+
+
+async def fetch_package(session: aiohttp.ClientSession, name: str, has_stub_package: bool) -> FetchedPackage:
+    """Downloads the archives analyze_package would for a package, making its requests concurrently.
+
+    That is the package's own archive and, when the package is listed as
+    having a stub package or isn't in typeshed, the -stubs metadata and
+    archive.
+    """
+    stub_name = f"{name}-stubs"
+    needs_stub_probe = not check_typeshed(name)
+    archives: dict[str, tuple[Artifact, bytes]] = {}
+    errors: dict[str, str] = {}
+    stub_package_url: Optional[str] = None
+
+    async def fetch_own() -> None:
+        try:
+            archives[name] = await _get_archive(session, await _resolve(session, name))
+        except CONNECTION_ERRORS:
+            raise
+        except FETCH_ERRORS as e:
+            errors[name] = str(e) or type(e).__name__
+
+    async def fetch_stubs() -> None:
+        nonlocal stub_package_url
+        try:
+            entry = await _resolve(session, stub_name)
+            if entry.found and needs_stub_probe:
+                stub_package_url = PYPI_PROJECT_URL.format(stub_name)
+            if entry.found or has_stub_package:
+                archives[stub_name] = await _get_archive(session, entry)
+        except CONNECTION_ERRORS:
+            raise
+        except FETCH_ERRORS as e:
+            errors[stub_name] = str(e) or type(e).__name__
+
+    if has_stub_package or needs_stub_probe:
+        await asyncio.gather(fetch_own(), fetch_stubs())
+    else:
+        await fetch_own()
+    return FetchedPackage(name, archives, errors, stub_package_url)
+
+
+def _client_session() -> aiohttp.ClientSession:
+    timeout = aiohttp.ClientTimeout(
+        sock_connect=http_client.timeout[0], sock_read=http_client.timeout[1])
+    connector = aiohttp.TCPConnector(limit=fetch_concurrency)
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+
+async def _fetch_all(
+    packages: list[tuple[str, bool]],
+    results: "queue.Queue[Optional[FetchedPackage]]",
+    slots: asyncio.Semaphore,
+) -> None:
+    async def fetch_one(session: aiohttp.ClientSession, name: str, has_stub_package: bool) -> None:
+        # The slot is released by the consumer once it takes the package
+        await slots.acquire()
+        results.put(await fetch_package(session, name, has_stub_package))
+
+    try:
+        async with _client_session() as session:
+            await asyncio.gather(*(
+                fetch_one(session, name, has_stub_package) for name, has_stub_package in packages))
+    finally:
+        results.put(None)
+
+
+def iter_fetched_packages(packages: list[tuple[str, bool]]) -> Generator[FetchedPackage, None, None]:
+    """Fetches (package name, has stub package) pairs on an event loop thread, yielding them as they finish.
+
+    At most fetch_concurrency packages are being downloaded or waiting to
+    be consumed at once, which bounds the archives held in memory while
+    the caller analyzes them. Connection errors are raised once the
+    packages fetched before them have been yielded, stopping the run.
+    """
+    results: "queue.Queue[Optional[FetchedPackage]]" = queue.Queue()
+    loop = asyncio.new_event_loop()
+    slots = asyncio.Semaphore(fetch_concurrency)
+    task = loop.create_task(_fetch_all(packages, results, slots))
+
+    def run() -> None:
+        try:
+            loop.run_until_complete(task)
+        except BaseException:
+            # Raised to the consumer below, unless it cancelled the task itself
+            pass
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    try:
+        while (fetched := results.get()) is not None:
+            yield fetched
+            loop.call_soon_threadsafe(slots.release)
+    finally:
+        # Stops any downloads still in flight if the consumer gave up early,
+        # letting the session close its connections
+        loop.call_soon_threadsafe(task.cancel)
+        thread.join()
+        loop.close()
+    task.result()
+
+
+async def _prefetch_all(names: list[str]) -> dict[str, DistributionMetadata]:
+    manifest: dict[str, DistributionMetadata] = {}
+    slots = asyncio.Semaphore(fetch_concurrency)
+
+    async def prefetch_one(session: aiohttp.ClientSession, name: str) -> None:
+        async with slots:
+            try:
+                manifest[name] = await _resolve(session, name)
+            except (*CONNECTION_ERRORS, *FETCH_ERRORS) as e:
+                # Left out of the manifest, so the analysis looks it up again
+                print(f"Warning: could not prefetch metadata for {name}: {str(e) or type(e).__name__}")
+
+    async with _client_session() as session:
+        await asyncio.gather(*(prefetch_one(session, name) for name in names))
+    return manifest
+
+
+def prefetch_metadata(packages: list[tuple[str, bool]]) -> dict[str, DistributionMetadata]:
+    """Resolves the metadata of (package name, has stub package) pairs concurrently, ahead of the analysis.
+
+    The manifest covers every distribution fetch_package would look up,
+    including the -stubs projects it would probe for. It keeps only each
+    distribution's version and chosen archive, so it stays small however
+    many packages there are.
+    """
+    names: list[str] = []
+    for name, has_stub_package in packages:
+        names.append(name)
+        if has_stub_package or not check_typeshed(name):
+            names.append(f"{name}-stubs")
+    start = time.perf_counter()
+    manifest = asyncio.run(_prefetch_all(names))
+    print(f"Prefetched metadata for {len(manifest)} distributions in {time.perf_counter() - start:.1f}s.")
+    return manifest
+
+
+def read_fetched_sources(
+    fetched: FetchedPackage, name: str, artifacts: Optional[dict[str, Artifact]] = None
+) -> Optional[tuple[dict[str, bytes], bool]]:
+    """Reads the Python files of one of a fetched package's archives, like extract_sources.
+
+    Returns None if the fetch stage didn't try to download this distribution.
+    """
+    try:
+        if name in fetched.errors:
+            raise ValueError(fetched.errors[name])
+        if name not in fetched.archives:
+            return None
+        artifact, content = fetched.archives[name]
+        sources = read_archive_sources(artifact.url, content)
+        if artifacts is not None:
+            artifacts[name] = artifact
+        return sources
+    except (ValueError, OSError) as e:
+        print(f"Warning: {e}")
+        return {}, False
@@ -1,153 +1,377 @@
 import ast
+import heapq
+import multiprocessing
 import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Any, Iterator, NamedTuple, Optional, cast
+
+from analyzer.parse_cache import ParseCache
+from analyzer.token_scanner import scan_source
+
+# Bump whenever the records produced for the same source change, so cached records are not reused
+ANALYZER_VERSION = "1"
+
+# Per function: (param count, annotated param count, has return annotation)
+FunctionRecord = tuple[int, int, bool]
+# Per file: function name qualified within its module -> FunctionRecord
+FileRecord = dict[str, FunctionRecord]
+
+
+class OversizedFileRecord(FileRecord):
+    """A FileRecord for a file over the parse budget, found by the token scanner instead of an AST."""
+
+
+# Fields holding statement lists, or the except handlers and match cases that hold them
+BODY_FIELDS = frozenset(("body", "handlers", "orelse", "finalbody", "cases"))
+
+# Files whose combined size is below this are parsed in-process, since
+# shipping them to worker processes would cost more than it saves
+parallel_parse_min_bytes = 2 * 1024 * 1024
+# Number of parse worker processes; None uses one per CPU
+parse_workers: Optional[int] = None
+# Number of chunks handed to each worker, so one slow chunk doesn't hold up the rest
+CHUNKS_PER_WORKER = 4
+
+# Optional on-disk cache of file records, shared across runs
+parse_cache: Optional[ParseCache] = None
+# Find functions with the tokenizer instead of building an AST
+fast_scan = False
+
+# Files over either budget are never handed to ast.parse, whose tree for a
+# multi-megabyte generated module can take hundreds of MB. They go to the
+# streaming token scanner instead and are reported as oversized files.
+max_parse_bytes = 2 * 1024 * 1024
+max_parse_nodes = 1_000_000
+# Bytes that mark roughly one AST node each; twice their count is within a
+# factor of two of the real node count on real-world code
+NODE_MARKERS = (b",", b"(", b"[", b"{", b"=", b".", b":", b"\n")
+
+_parse_pool: Optional[ProcessPoolExecutor] = None
+_parse_pool_lock = threading.Lock()
+
+
+class CoverageCounts(NamedTuple):
+    total_params: int
+    annotated_params: int
+    total_returns: int
+    annotated_returns: int
+    skipped_files: int
+    oversized_files: int
+
+
+def iter_function_defs(tree: ast.AST) -> Iterator[tuple[ast.FunctionDef, Optional[str]]]:
+    """Yields each function with the class it's directly defined in, if any, in ast.walk order.
+
+    Functions can only appear in statement bodies, so expressions are never
+    visited. Traversal is breadth-first like ast.walk so that the first of
+    several same-named functions is the one ast.walk would find first.
+    """
+    queue: deque[ast.AST] = deque([tree])
+    while queue:
+        node = queue.popleft()
+        class_name = node.name if isinstance(node, ast.ClassDef) else None
+        for field, value in ast.iter_fields(node):
+            if field not in BODY_FIELDS or not isinstance(value, list):
+                continue
+            for child in cast(list[object], value):
+                if not isinstance(child, (ast.stmt, ast.excepthandler, ast.match_case)):
+                    continue
+                if isinstance(child, ast.FunctionDef):
+                    yield child, class_name
+                queue.append(child)
+
+
+def analyze_source(source: bytes, filename: str) -> Optional[FileRecord]:
+    """Parses a file's content once and records every function in it, or returns None if it can't be parsed."""
+    try:
+        tree = ast.parse(source.decode('utf-8', errors='ignore'), filename=filename)
+    except (SyntaxError, UnicodeDecodeError):
+        return None
+
+    file_record: FileRecord = {}
+    for node, class_name in iter_function_defs(tree):
+        # The module name is prepended when records are merged
+        func_name = f"{class_name}.{node.name}" if class_name else node.name
+
+        # Skip if already analyzed
+        if func_name in file_record:
+            continue
+
+        # Exclude 'self' and 'cls' from parameters
+        params = [
+            arg for arg in node.args.args if arg.arg not in ('self', 'cls')]
+        file_record[func_name] = (
+            len(params),
+            sum(1 for arg in params if arg.annotation is not None),
+            node.returns is not None,
+        )
+    return file_record
+
+
+def analyze_file(file: str) -> Optional[FileRecord]:
+    with open(file, 'rb') as f:
+        return analyze_source(f.read(), file)
+
+
+def configure_parse_cache(cache_dir: str, max_bytes: Optional[int] = None) -> None:
+    """Enables the on-disk parse cache for this process."""
+    global parse_cache
+    if max_bytes is None:
+        parse_cache = ParseCache(cache_dir, ANALYZER_VERSION)
+    else:
+        parse_cache = ParseCache(cache_dir, ANALYZER_VERSION, max_bytes)
+
+
+def configure_parse_workers(workers: Optional[int] = None, parallel_min_bytes: Optional[int] = None) -> None:
+    """Sets the number of parse worker processes, and the total size of files below which they're parsed in-process."""
+    global parse_workers, parallel_parse_min_bytes
+    if workers is not None:
+        parse_workers = workers
+    if parallel_min_bytes is not None:
+        parallel_parse_min_bytes = parallel_min_bytes
+
+
+def configure_parse_budget(max_bytes: int, max_nodes: int) -> None:
+    """Sets the size and estimated node count above which files skip ast.parse."""
+    global max_parse_bytes, max_parse_nodes
+    max_parse_bytes = max_bytes
+    max_parse_nodes = max_nodes
+
+
+def estimate_node_count(source: bytes) -> int:
+    """Estimates how many AST nodes a file would parse into, without parsing it."""
+    return 2 * sum(source.count(marker) for marker in NODE_MARKERS)
+
+
+def is_oversized(source: bytes) -> bool:
+    """Checks whether a file is over the parse budget and should be scanned instead."""
+    return len(source) > max_parse_bytes or estimate_node_count(source) > max_parse_nodes
 
 
-def get_fully_qualified_name(node: ast.FunctionDef, module: str, parent_map: dict[ast.AST, ast.AST]) -> str:
-    parent = parent_map.get(node)
-    if isinstance(parent, ast.ClassDef):
-        return f"{module}.{parent.name}.{node.name}"
-    return f"{module}.{node.name}"
+def configure_fast_scan(enabled: bool = True) -> None:
+    """Switches this process between the AST engine and the tokenizer-based scanner."""
+    global fast_scan
+    fast_scan = enabled
+
+
+def analysis_settings() -> dict[str, Any]:
+    """Returns the settings that change which engine reads a file, and so the records a report is computed from."""
+    return {"fast_scan": fast_scan, "max_parse_bytes": max_parse_bytes, "max_parse_nodes": max_parse_nodes}
 
-
-def build_parent_map(tree: ast.AST) -> dict[ast.AST, ast.AST]:
-    parent_map: dict[ast.AST, ast.AST] = {}
-    for node in ast.walk(tree):
-        for child in ast.iter_child_nodes(node):
-            parent_map[child] = node
-    return parent_map
-
-
-def calculate_parameter_coverage(files: list[str]) -> tuple[int, int, int]:
-    total_params: int = 0
-    annotated_params: int = 0
-    skipped_files: int = 0
-
-    # To track annotations and parameters per function
-    function_param_counts: dict[str, tuple[int, int]] = {}
+
+def compare_fast_scan(files: list[str]) -> list[str]:
+    """Runs both engines on each file and describes every record they disagree on."""
+    disagreements: list[str] = []
+    for file in files:
+        with open(file, 'rb') as f:
+            source = f.read()
+        ast_record = analyze_source(source, file)
+        scan_record = scan_source(source, file)
+        if ast_record is None or scan_record is None:
+            if ast_record != scan_record:
+                engine = "AST engine" if ast_record is None else "fast scan"
+                disagreements.append(f"{file}: only the {engine} skipped the file")
+            continue
+        for name in sorted(ast_record.keys() | scan_record.keys()):
+            if ast_record.get(name) != scan_record.get(name):
+                disagreements.append(
+                    f"{file}: {name}: AST engine {ast_record.get(name)}, fast scan {scan_record.get(name)}")
+    return disagreements
+
+
+def _record_from_json(value: Any) -> Optional[FileRecord]:
+    if value is None:
+        return None
+    return {name: (params, annotated, bool(has_return)) for name, (params, annotated, has_return) in value.items()}
+
+
+def get_parse_pool() -> ProcessPoolExecutor:
+    """Returns the process pool shared by every package analyzed in this process."""
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is None:
+            # Workers are spawned rather than forked since callers may be running in threads
+            _parse_pool = ProcessPoolExecutor(
+                max_workers=parse_workers,
+                mp_context=multiprocessing.get_context("spawn"))
+        return _parse_pool
+
+
+def _analyze_sources(sources: list[tuple[str, bytes]], fast_scan: bool = False) -> list[Optional[FileRecord]]:
+    analyze = scan_source if fast_scan else analyze_source
+    return [analyze(source, filename) for filename, source in sources]
+
+
+def split_files_by_size(files: list[str], sizes: dict[str, int], n_chunks: int) -> list[list[str]]:
+    """Splits files into at most n_chunks chunks of roughly equal total size, largest files first."""
+    heap: list[tuple[int, int]] = [(0, i) for i in range(min(n_chunks, len(files)))]
+    chunks: list[list[str]] = [[] for _ in heap]
+    for file in sorted(files, key=lambda f: sizes[f], reverse=True):
+        chunk_size, i = heapq.heappop(heap)
+        chunks[i].append(file)
+        heapq.heappush(heap, (chunk_size + sizes[file], i))
+    return chunks
+
+
+def collect_file_records(files: list[str], file_records: dict[str, Optional[FileRecord]]) -> None:
+    """Reads and analyzes the files that have no record yet."""
+    sources: dict[str, bytes] = {}
+    for file in files:
+        if file not in file_records and file not in sources:
+            with open(file, 'rb') as f:
+                sources[file] = f.read()
+    collect_source_records(sources, file_records)
+
+
+def collect_source_records(sources: dict[str, bytes], file_records: dict[str, Optional[FileRecord]]) -> None:
+    """Analyzes file contents keyed by path, using the parse cache and process pool when available.
+
+    Files over the parse budget are always scanned in-process with the token
+    scanner, and their records are marked as OversizedFileRecord.
+    """
+    oversized = {file for file, source in sources.items() if is_oversized(source)}
+    cache_keys: dict[str, str] = {}
+    pending: dict[str, bytes] = {}
+    records: dict[str, Optional[FileRecord]] = {}
+    for file, source in sources.items():
+        if parse_cache is not None:
+            cache_keys[file] = parse_cache.key(
+                source, "fast-scan" if fast_scan or file in oversized else "")
+            try:
+                records[file] = _record_from_json(
+                    parse_cache.load(cache_keys[file]))
+                continue
+            except KeyError:
+                pass
+        if file in oversized:
+            records[file] = scan_source(source, file)
+            if parse_cache is not None:
+                parse_cache.store(cache_keys[file], records[file])
+        else:
+            pending[file] = source
+
+    max_workers = parse_workers or os.cpu_count() or 1
+    sizes = {file: len(source) for file, source in pending.items()}
+    analyzed: dict[str, Optional[FileRecord]]
+    if max_workers < 2 or len(pending) < 2 or sum(sizes.values()) < parallel_parse_min_bytes:
+        analyzed = dict(zip(pending, _analyze_sources(
+            list(pending.items()), fast_scan)))
+    else:
+        chunks = split_files_by_size(
+            list(pending), sizes, max_workers * CHUNKS_PER_WORKER)
+        results = get_parse_pool().map(
+            partial(_analyze_sources, fast_scan=fast_scan),
+            [[(file, pending[file]) for file in chunk] for chunk in chunks])
+        analyzed = {}
+        for chunk, chunk_records in zip(chunks, results):
+            analyzed.update(zip(chunk, chunk_records))
+
+    for file, record in analyzed.items():
+        records[file] = record
+        if parse_cache is not None:
+            parse_cache.store(cache_keys[file], record)
+
+    for file, record in records.items():
+        if file in oversized and record is not None:
+            record = OversizedFileRecord(record)
+        file_records[file] = record
+
+
+def merge_function_records(
+    files: list[str], file_records: dict[str, Optional[FileRecord]]
+) -> dict[str, tuple[str, FunctionRecord]]:
+    """Merges already collected file records into one record per function.
+
+    Functions are keyed by "module.name" and mapped to the file they were
+    taken from. A function in a .pyi file overrides the same function in a
+    .py file; otherwise the first file that defines it wins.
+    """
+    functions: dict[str, tuple[str, FunctionRecord]] = {}
     functions_covered_by_pyi: set[str] = set()
-
     for file in files:
-        try:
-            module_name = os.path.splitext(os.path.basename(file))[0]
-            with open(file, 'r', encoding='utf-8', errors='ignore') as f:
-                tree = ast.parse(f.read(), filename=file)
-                parent_map = build_parent_map(tree)
-
-                # Use a set to track already analyzed functions
-                analyzed_functions: set[str] = set()
-
-                for node in ast.walk(tree):
-                    if isinstance(node, ast.FunctionDef):
-                        func_name = get_fully_qualified_name(
-                            node, module_name, parent_map)
-
-                        # Skip if already analyzed
-                        if func_name in analyzed_functions:
-                            continue
-
-                        analyzed_functions.add(func_name)
-
-                        # Exclude 'self' and 'cls' from parameters
-                        params = [
-                            arg for arg in node.args.args if arg.arg not in ('self', 'cls')]
-                        param_count = len(params)
-                        annotation_count = sum(
-                            1 for arg in params if arg.annotation is not None)
-
-                        # Handle .pyi files and function overwriting
-                        if file.endswith(".pyi"):
-                            functions_covered_by_pyi.add(func_name)
-                            function_param_counts[func_name] = (
-                                param_count, annotation_count)
-                        elif func_name not in functions_covered_by_pyi:
-                            if func_name not in function_param_counts:
-                                function_param_counts[func_name] = (
-                                    param_count, annotation_count)
-
-        except (SyntaxError, UnicodeDecodeError):
-            skipped_files += 1
+        file_record = file_records[file]
+        if file_record is None:
+            continue
+
+        module_name = os.path.splitext(os.path.basename(file))[0]
+        for name, counts in file_record.items():
+            func_name = f"{module_name}.{name}"
+
+            # Handle .pyi files and function overwriting
+            if file.endswith(".pyi"):
+                functions_covered_by_pyi.add(func_name)
+                functions[func_name] = (file, counts)
+            elif func_name not in functions_covered_by_pyi:
+                if func_name not in functions:
+                    functions[func_name] = (file, counts)
+    return functions
+
+
+def calculate_coverage_counts(
+    files: list[str], file_records: Optional[dict[str, Optional[FileRecord]]] = None
+) -> CoverageCounts:
+    """Tallies parameter and return annotations across files, parsing each file at most once.
+
+    Records are looked up in and added to `file_records`, so callers that
+    compute several overlapping file sets can share one dict between calls.
+    """
+    if file_records is None:
+        file_records = {}
+    collect_file_records(files, file_records)
 
-    # Sum up the final counts
-    total_params = sum(counts[0] for counts in function_param_counts.values())
-    annotated_params = sum(counts[1]
-                           for counts in function_param_counts.values())
-
-    return total_params, annotated_params, skipped_files
-
-
-def calculate_return_type_coverage(files: list[str]) -> tuple[int, int, int]:
-    total_functions: int = 0
-    annotated_functions: int = 0
     skipped_files: int = 0
-
-    # To track return type annotations per function
-    function_return_counts: dict[str, tuple[int, int]] = {}
-    functions_covered_by_pyi: set[str] = set()
-
+    oversized_files: int = 0
     for file in files:
-        try:
-            module_name = os.path.splitext(os.path.basename(file))[0]
-            with open(file, 'r', encoding='utf-8', errors='ignore') as f:
-                tree = ast.parse(f.read(), filename=file)
-                parent_map = build_parent_map(tree)
-
-                # Use a set to track already analyzed functions
-                analyzed_functions: set[str] = set()
-
-                for node in ast.walk(tree):
-                    if isinstance(node, ast.FunctionDef):
-                        func_name = get_fully_qualified_name(
-                            node, module_name, parent_map)
-
-                        # Skip if already analyzed
-                        if func_name in analyzed_functions:
-                            continue
-
-                        analyzed_functions.add(func_name)
-
-                        # Skip the __init__ method
-                        if node.name == "__init__":
-                            continue
-
-                        # Handle .pyi files and function overwriting
-                        if file.endswith(".pyi"):
-                            functions_covered_by_pyi.add(func_name)
-                            function_return_counts[func_name] = (
-                                1, 1 if node.returns is not None else 0)
-                        elif func_name not in functions_covered_by_pyi:
-                            if func_name not in function_return_counts:
-                                function_return_counts[func_name] = (
-                                    1,
-                                    1 if node.returns is not None else 0
-                                )
-
-        except (SyntaxError, UnicodeDecodeError):
+        if file_records[file] is None:
             skipped_files += 1
+        elif isinstance(file_records[file], OversizedFileRecord):
+            oversized_files += 1
+
+    total_params = 0
+    annotated_params = 0
+    total_returns = 0
+    annotated_returns = 0
+    for func_name, (_, (param_count, annotation_count, has_return)) in merge_function_records(
+        files, file_records
+    ).items():
+        total_params += param_count
+        annotated_params += annotation_count
+        # The __init__ method is excluded from return type coverage
+        if func_name.rpartition(".")[2] != "__init__":
+            total_returns += 1
+            annotated_returns += has_return
+
+    return CoverageCounts(
+        total_params, annotated_params, total_returns, annotated_returns, skipped_files, oversized_files
+    )
 
-    # Sum up the final counts
-    total_functions = sum(counts[0]
-                          for counts in function_return_counts.values())
-    annotated_functions = sum(counts[1]
-                              for counts in function_return_counts.values())
 
-    return total_functions, annotated_functions, skipped_files
+def calculate_parameter_coverage(files: list[str]) -> tuple[int, int, int]:
+    counts = calculate_coverage_counts(files)
+    return counts.total_params, counts.annotated_params, counts.skipped_files
 
 
-def calculate_overall_coverage(files: list[str]) -> dict[str, float]:
-    total_params, annotated_params, param_skipped = calculate_parameter_coverage(
-        files)
-    total_functions, annotated_functions, return_skipped = calculate_return_type_coverage(
-        files)
+def calculate_return_type_coverage(files: list[str]) -> tuple[int, int, int]:
+    counts = calculate_coverage_counts(files)
+    return counts.total_returns, counts.annotated_returns, counts.skipped_files
+
 
-    total_skipped: int = max(param_skipped, return_skipped)
+def calculate_overall_coverage(
+    files: list[str], file_records: Optional[dict[str, Optional[FileRecord]]] = None
+) -> dict[str, float]:
+    counts = calculate_coverage_counts(files, file_records)
 
     return {
-        "parameter_coverage": calculuate_coverage(annotated_params, total_params),
+        "parameter_coverage": calculuate_coverage(counts.annotated_params, counts.total_params),
         "return_type_coverage": calculuate_coverage(
-            annotated_functions, total_functions
+            counts.annotated_returns, counts.total_returns
         ),
-        "skipped_files": total_skipped,
-        "surface_area": total_params + total_functions,
+        "skipped_files": counts.skipped_files,
+        "oversized_files": counts.oversized_files,
+        "surface_area": counts.total_params + counts.total_returns,
     }
 
 
@@ -0,0 +1,108 @@
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import BinaryIO, Generator
+
+# After eviction a store is trimmed to this fraction of its maximum size
+EVICTION_TARGET = 0.8
+# Temp files older than this were left behind by a writer that died
+STALE_TEMP_SECONDS = 3600
+
+
+@contextmanager
+def atomic_write(path: str) -> Generator[BinaryIO, None, None]:
+    """Opens a temp file next to path that replaces path when the block finishes.
+
+    Readers see either the old file or the whole new one, never a partial
+    write. If the block raises, the temp file is removed and path is left
+    as it was.
+    """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            yield f
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+class LruStore:
+    """A directory of files kept under max_bytes by deleting the least recently used ones first.
+
+    Files are written atomically with write, so any number of threads and
+    processes can share the directory. Use is tracked by modification
+    time, which touch refreshes.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._size = sum(size for _, size, _ in self._entries())
+
+    def touch(self, path: str) -> bool:
+        """Marks a file as just used, returning False if it isn't there."""
+        try:
+            os.utime(path)
+        except OSError:
+            return False
+        return True
+
+    @contextmanager
+    def write(self, path: str) -> Generator[BinaryIO, None, None]:
+        """Like atomic_write, then evicts files if the store has grown past max_bytes."""
+        with atomic_write(path) as f:
+            yield f
+            size = f.tell()
+            try:
+                # A file being rewritten only adds the difference in size
+                size -= os.stat(path).st_size
+            except FileNotFoundError:
+                pass
+
+        with self._lock:
+            self._size += size
+            over_budget = self._size > self.max_bytes
+        if over_budget:
+            self.evict()
+
+    def _entries(self) -> list[tuple[float, int, str]]:
+        entries: list[tuple[float, int, str]] = []
+        for root, _, files in os.walk(self.directory):
+            for file in files:
+                path = os.path.join(root, file)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                if file.endswith(".tmp"):
+                    # Leave temp files alone while another writer may still be using them
+                    if stat.st_mtime > time.time() - STALE_TEMP_SECONDS:
+                        continue
+                    entries.append((0.0, stat.st_size, path))
+                else:
+                    entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def evict(self) -> None:
+        """Deletes the least recently used files until the store is back under budget."""
+        with self._lock:
+            entries = sorted(self._entries())
+            size = sum(entry_size for _, entry_size, _ in entries)
+            target = self.max_bytes * EVICTION_TARGET
+            for _, entry_size, path in entries:
+                if size <= target:
+                    break
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    # Already evicted by another process
+                    pass
+                size -= entry_size
+            self._size = size
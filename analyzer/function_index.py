@@ -0,0 +1,162 @@
+import os
+import sqlite3
+import threading
+from typing import NamedTuple, Optional
+
+from analyzer.coverage_calculator import FunctionRecord
+
+# Bumped when the tables change; an index with another version is rebuilt from scratch
+SCHEMA_VERSION = 2
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS packages (
+    name TEXT PRIMARY KEY,
+    -- Download rank in the run that indexed the package
+    rank INTEGER
+);
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    package TEXT NOT NULL REFERENCES packages (name),
+    -- Path inside the distribution archive
+    path TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS functions (
+    file_id INTEGER NOT NULL REFERENCES files (id),
+    -- Dotted name within its module, such as Class.method
+    qualname TEXT NOT NULL,
+    name TEXT NOT NULL,
+    public INTEGER NOT NULL,
+    params INTEGER NOT NULL,
+    annotated_params INTEGER NOT NULL,
+    has_return INTEGER NOT NULL,
+    -- Share of the parameters and return that are annotated, as counted in the report
+    coverage REAL NOT NULL,
+    missing INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_by_package ON files (package);
+CREATE INDEX IF NOT EXISTS functions_by_file ON functions (file_id);
+CREATE INDEX IF NOT EXISTS functions_by_coverage ON functions (coverage, missing DESC);
+CREATE INDEX IF NOT EXISTS functions_by_name ON functions (name, coverage);
+"""
+
+SELECT_FUNCTIONS = """
+SELECT files.package, packages.rank, files.path, functions.qualname,
+       functions.params, functions.annotated_params, functions.has_return
+FROM functions
+JOIN files ON files.id = functions.file_id
+JOIN packages ON packages.name = files.package
+"""
+
+function_index: Optional["FunctionIndex"] = None
+
+
+class IndexedFunction(NamedTuple):
+    package: str
+    rank: Optional[int]
+    path: str
+    qualname: str
+    params: int
+    annotated_params: int
+    has_return: bool
+
+
+def is_public(path: str, qualname: str) -> bool:
+    """Checks that no module or name on the way to a function is underscore-private. Dunder names are public."""
+    parts = [os.path.splitext(part)[0] for part in path.split("/")] + qualname.split(".")
+    return not any(
+        part.startswith("_") and not (part.startswith("__") and part.endswith("__"))
+        for part in parts
+    )
+
+
+class FunctionIndex:
+    """An SQLite store of every function record, for queries across packages without re-analysis.
+
+    Each package's functions are replaced in one transaction, so the index
+    can be filled from several threads or processes and read while it's
+    being written. A writer waits up to 60 seconds for another to finish.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        with self._connection:
+            version: int = self._connection.execute("PRAGMA user_version").fetchone()[0]
+            if version != SCHEMA_VERSION:
+                for table in ("functions", "files", "packages"):
+                    self._connection.execute(f"DROP TABLE IF EXISTS {table}")
+                self._connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self._connection.executescript(SCHEMA)
+
+    def add_package(
+        self, package: str, rank: Optional[int], functions: list[tuple[str, str, FunctionRecord]]
+    ) -> None:
+        """Replaces the functions indexed for a package with (path, qualname, record) entries."""
+        file_ids: dict[str, int] = {}
+        with self._lock, self._connection:
+            self._connection.execute(
+                "DELETE FROM functions WHERE file_id IN (SELECT id FROM files WHERE package = ?)",
+                (package,))
+            self._connection.execute(
+                "DELETE FROM files WHERE package = ?", (package,))
+            self._connection.execute(
+                "INSERT OR REPLACE INTO packages (name, rank) VALUES (?, ?)", (package, rank))
+            rows: list[tuple[int, str, str, bool, int, int, bool, float, int]] = []
+            for path, qualname, (params, annotated_params, has_return) in functions:
+                if path not in file_ids:
+                    file_ids[path] = self._connection.execute(
+                        "INSERT INTO files (package, path) VALUES (?, ?)", (package, path)
+                    ).lastrowid or 0
+                name = qualname.rpartition(".")[2]
+                # The __init__ method is excluded from return type coverage
+                slots = params + (name != "__init__")
+                annotated = annotated_params + (name != "__init__" and has_return)
+                rows.append((
+                    file_ids[path], qualname, name, is_public(path, qualname),
+                    params, annotated_params, has_return,
+                    annotated / slots if slots else 1.0, slots - annotated,
+                ))
+            self._connection.executemany(
+                "INSERT INTO functions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def _select(self, where: str, args: tuple[object, ...]) -> list[IndexedFunction]:
+        with self._lock:
+            rows = self._connection.execute(SELECT_FUNCTIONS + where, args).fetchall()
+        return [
+            IndexedFunction(package, rank, path, qualname, params, annotated_params, bool(has_return))
+            for package, rank, path, qualname, params, annotated_params, has_return in rows
+        ]
+
+    def least_annotated(
+        self, limit: int = 100, max_rank: Optional[int] = None, public_only: bool = True
+    ) -> list[IndexedFunction]:
+        """Returns the functions with the lowest annotation coverage, most missing annotations first.
+
+        With max_rank, only packages ranked that high or higher are searched.
+        """
+        return self._select(
+            "WHERE functions.public >= ? AND (? IS NULL OR packages.rank <= ?) "
+            "ORDER BY functions.coverage, functions.missing DESC LIMIT ?",
+            (int(public_only), max_rank, max_rank, limit))
+
+    def unannotated(self, name: str, max_rank: Optional[int] = None) -> list[IndexedFunction]:
+        """Returns every function or method with this name that has no annotations at all."""
+        return self._select(
+            "WHERE functions.name = ? AND functions.coverage = 0 "
+            "AND (? IS NULL OR packages.rank <= ?) ORDER BY packages.rank",
+            (name, max_rank, max_rank))
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+def configure_function_index(path: str) -> None:
+    """Records every analyzed package's functions in the index at path."""
+    global function_index
+    function_index = FunctionIndex(path)
+
+
+def get_function_index() -> Optional[FunctionIndex]:
+    return function_index
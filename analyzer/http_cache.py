@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+import time
+import zlib
+from typing import Mapping, NamedTuple, Optional
+
+from analyzer.disk_store import atomic_write
+
+DEFAULT_TTL_SECONDS = 3600
+# Statuses worth remembering: a 404 answers "is there a -stubs package?" as well as a 200 does
+CACHEABLE_STATUSES = frozenset((200, 404))
+
+
+class CachedResponse(NamedTuple):
+    status: int
+    body: bytes
+    etag: Optional[str]
+    last_modified: Optional[str]
+    # When the response was last fetched or revalidated, in seconds since the epoch
+    fetched_at: float
+
+
+class HttpCache:
+    """An on-disk cache of HTTP responses keyed by URL, revalidated with ETag and Last-Modified.
+
+    Responses younger than ttl are served without a request. Older ones are
+    revalidated with If-None-Match and If-Modified-Since, so an unchanged
+    response costs a 304 instead of its body. With offline set, cached
+    responses are served however old they are and nothing is fetched.
+    Bodies are stored zlib-compressed, and entries are written atomically
+    so threads and processes can share a cache directory.
+    """
+
+    def __init__(self, cache_dir: str, ttl: float = DEFAULT_TTL_SECONDS, offline: bool = False):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.offline = offline
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, url: str) -> str:
+        key = hashlib.sha256(url.encode()).hexdigest()
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def load(self, url: str) -> Optional[CachedResponse]:
+        """Returns the cached response for url, fresh or not, or None if there is none."""
+        try:
+            with open(self._path(url), "rb") as f:
+                header = json.loads(f.readline())
+                body = zlib.decompress(f.read())
+        except (OSError, ValueError, zlib.error):
+            # Missing, or left unreadable by a writer that died
+            return None
+        if header["url"] != url:
+            return None
+        return CachedResponse(
+            header["status"], body, header["etag"], header["last_modified"], header["fetched_at"])
+
+    def is_fresh(self, cached: CachedResponse) -> bool:
+        return self.offline or time.time() - cached.fetched_at < self.ttl
+
+    def conditional_headers(self, cached: Optional[CachedResponse]) -> dict[str, str]:
+        """Returns the headers that ask the server to answer 304 if the cached response is still current."""
+        headers: dict[str, str] = {}
+        if cached is not None and cached.status == 200:
+            if cached.etag:
+                headers["If-None-Match"] = cached.etag
+            if cached.last_modified:
+                headers["If-Modified-Since"] = cached.last_modified
+        return headers
+
+    def store(self, url: str, status: int, body: bytes, headers: Mapping[str, str]) -> Optional[CachedResponse]:
+        """Caches a response if its status is cacheable, returning the entry that was stored."""
+        if status not in CACHEABLE_STATUSES:
+            return None
+        cached = CachedResponse(
+            status, body, headers.get("ETag"), headers.get("Last-Modified"), time.time())
+        self._write(url, cached)
+        return cached
+
+    def refresh(self, url: str, cached: CachedResponse) -> CachedResponse:
+        """Marks a cached response as just revalidated, after the server answered 304."""
+        cached = cached._replace(fetched_at=time.time())
+        self._write(url, cached)
+        return cached
+
+    def _write(self, url: str, cached: CachedResponse) -> None:
+        path = self._path(url)
+        header = {
+            "url": url,
+            "status": cached.status,
+            "etag": cached.etag,
+            "last_modified": cached.last_modified,
+            "fetched_at": cached.fetched_at,
+        }
+        try:
+            with atomic_write(path) as f:
+                f.write(json.dumps(header).encode() + b"\n")
+                f.write(zlib.compress(cached.body))
+        except OSError as e:
+            print(f"Warning: could not write HTTP cache entry: {e}")
@@ -0,0 +1,180 @@
+import json
+import random
+import threading
+import time
+from typing import Any, NamedTuple, Optional, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from analyzer.http_cache import DEFAULT_TTL_SECONDS, HttpCache
+from analyzer.rate_control import DEFAULT_BURST, RequestController
+
+# Connections kept open per host; parallel runs use up to this many threads at once
+pool_size = 32
+# Seconds to connect, then seconds between bytes of the response
+timeout = (10.0, 60.0)
+max_retries = 4
+# The n-th retry waits a random time up to BACKOFF_BASE * 2**n seconds, capped at BACKOFF_MAX
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+RETRY_STATUSES = frozenset((429, 500, 502, 503, 504))
+
+# Conditional-request cache for metadata such as PyPI JSON, but not archives
+http_cache: Optional[HttpCache] = None
+# Paces every request from threads and the async fetch stage alike
+request_controller: Optional[RequestController] = RequestController()
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+class ReplayedResponse(NamedTuple):
+    """A response cached_get answers from the cache, with the parts of requests.Response callers use."""
+
+    url: str
+    status_code: int
+    content: bytes
+
+    def json(self) -> Any:
+        return json.loads(self.content)
+
+    def raise_for_status(self) -> None:
+        """Raises requests.HTTPError for a 4xx or 5xx status, like requests.Response.raise_for_status."""
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"HTTP {self.status_code} Error: {self.url}")
+
+
+def configure_http(
+    connections_per_host: Optional[int] = None,
+    read_timeout: Optional[float] = None,
+    retries: Optional[int] = None,
+) -> None:
+    """Sets the connection pool size, read timeout and retry count for every HTTP request."""
+    global pool_size, timeout, max_retries, _session
+    with _session_lock:
+        if connections_per_host is not None:
+            pool_size = connections_per_host
+            # Rebuilt with the new pool size on next use
+            _session = None
+        if read_timeout is not None:
+            timeout = (timeout[0], read_timeout)
+        if retries is not None:
+            max_retries = retries
+
+
+def configure_http_cache(cache_dir: str, ttl: Optional[float] = None, offline: bool = False) -> None:
+    """Caches responses from cached_get in cache_dir, serving them without a request for ttl seconds."""
+    global http_cache
+    http_cache = HttpCache(
+        cache_dir, ttl if ttl is not None else DEFAULT_TTL_SECONDS, offline)
+
+
+def configure_rate_control(
+    rate: Optional[float] = None, max_concurrency: Optional[int] = None, enabled: bool = True
+) -> None:
+    """Sets the requests per second and the most requests in flight, or with enabled off sends requests unpaced.
+
+    A rate of 0 leaves the rate unlimited while keeping the adaptive
+    concurrency limit and the circuit breaker.
+    """
+    global request_controller
+    if not enabled:
+        request_controller = None
+        return
+    current = request_controller or RequestController()
+    request_controller = RequestController(
+        current.rate if rate is None else rate or None,
+        DEFAULT_BURST,
+        current.max_concurrency if max_concurrency is None else max_concurrency,
+    )
+
+
+def get_session() -> requests.Session:
+    """Returns the session shared by all threads, creating it on first use.
+
+    Its adapters keep up to pool_size connections per host alive, so
+    requests after the first to PyPI or its file host skip the TCP and TLS
+    handshakes.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def backoff_delay(attempt: int, retry_after: str = "") -> float:
+    """Returns how long to wait before retry number `attempt`, honoring a Retry-After header."""
+    if retry_after.isdigit():
+        return min(float(retry_after), BACKOFF_MAX)
+    # Full jitter, so threads that failed together don't retry together
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+def get(url: str, **kwargs: Any) -> requests.Response:
+    """Sends a GET request through the shared session, retrying connection errors, 429s and 5xx responses.
+
+    Once the retries run out, the last response is returned, or the last
+    connection error is raised. Each attempt waits its turn with
+    request_controller, which raises CircuitOpenError instead while the
+    host keeps failing.
+    """
+    kwargs.setdefault("timeout", timeout)
+    session = get_session()
+    attempt = 0
+    while True:
+        controller = request_controller
+        if controller is not None:
+            controller.acquire()
+        started = time.monotonic()
+        try:
+            response = session.get(url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            if controller is not None:
+                controller.release(time.monotonic() - started, None)
+            if attempt >= max_retries:
+                raise
+            time.sleep(backoff_delay(attempt))
+        except BaseException:
+            if controller is not None:
+                controller.release(None, None)
+            raise
+        else:
+            if controller is not None:
+                # Time to the response headers, however long the body takes
+                controller.release(response.elapsed.total_seconds(), response.status_code)
+            if response.status_code not in RETRY_STATUSES or attempt >= max_retries:
+                return response
+            delay = backoff_delay(attempt, response.headers.get("Retry-After", ""))
+            # Hand the connection back to the pool before sleeping
+            response.close()
+            time.sleep(delay)
+        attempt += 1
+
+
+def cached_get(url: str, headers: Optional[dict[str, str]] = None) -> Union[requests.Response, ReplayedResponse]:
+    """Like get, but answered from http_cache when possible and revalidated when stale.
+
+    Responses are cached by URL alone, so any headers must be the same
+    every time a URL is requested. In offline mode a URL that was never
+    cached gets a 504 response, as for an only-if-cached request.
+    """
+    if http_cache is None:
+        return get(url, headers=headers) if headers else get(url)
+    cached = http_cache.load(url)
+    if cached is not None and http_cache.is_fresh(cached):
+        return ReplayedResponse(url, cached.status, cached.body)
+    if http_cache.offline:
+        return ReplayedResponse(url, 504, b"")
+
+    response = get(url, headers={**(headers or {}), **http_cache.conditional_headers(cached)})
+    if response.status_code == 304 and cached is not None:
+        cached = http_cache.refresh(url, cached)
+        return ReplayedResponse(url, cached.status, cached.body)
+    http_cache.store(url, response.status_code, response.content, response.headers)
+    return response
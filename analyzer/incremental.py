@@ -0,0 +1,82 @@
+import json
+from typing import Any, Optional
+
+import requests
+
+from analyzer.coverage_calculator import ANALYZER_VERSION, analysis_settings
+from analyzer.package_analyzer import Artifact, find_archive, find_stub_package
+from analyzer.typeshed_checker import check_typeshed, stub_files_digest
+
+
+def load_previous_report(json_file: str) -> dict[str, Any]:
+    """Reads the package report of the previous run, or returns {} if there isn't a readable one."""
+    try:
+        with open(json_file, "r") as f:
+            report: dict[str, Any] = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        print(f"Warning: could not read the previous report: {e}")
+        return {}
+    return report
+
+
+def artifact_key(artifact: Artifact) -> str:
+    # Archives from a directory source have no digest, but their path changes with their version
+    return artifact.sha256 or artifact.url
+
+
+def analysis_provenance(package_name: str, artifacts: dict[str, Artifact]) -> dict[str, Any]:
+    """Describes everything a package's report was computed from, to tell later whether it's still current."""
+    return {
+        "artifacts": {name: artifact_key(artifact) for name, artifact in artifacts.items()},
+        "typeshed_stubs": stub_files_digest(package_name),
+        "analyzer_version": ANALYZER_VERSION,
+        "settings": analysis_settings(),
+    }
+
+
+def is_unchanged(package_name: str, previous: Optional[dict[str, Any]], has_stub_package: bool) -> bool:
+    """Checks whether a package's previous report was computed from the archives and stubs that would be analyzed now.
+
+    Only PyPI metadata is looked up, so with a metadata manifest nothing is
+    fetched. A lookup that fails counts as a change, so the package is
+    analyzed again.
+    """
+    provenance = previous.get("Provenance") if previous else None
+    if not provenance or provenance["analyzer_version"] != ANALYZER_VERSION:
+        return False
+    if provenance.get("settings") != analysis_settings():
+        return False
+    if provenance["typeshed_stubs"] != stub_files_digest(package_name):
+        return False
+
+    # The distributions analyze_package reads
+    distributions = [package_name]
+    if has_stub_package or (not check_typeshed(package_name) and find_stub_package(package_name)):
+        distributions.append(f"{package_name}-stubs")
+    artifacts: dict[str, str] = {}
+    for name in distributions:
+        try:
+            artifacts[name] = artifact_key(find_archive(name))
+        except ValueError:
+            # No archive then either, if the previous report has none
+            continue
+        except requests.RequestException:
+            return False
+    return artifacts == provenance["artifacts"]
+
+
+def carry_forward(
+    package_name: str,
+    previous: dict[str, Any],
+    rank: Optional[int],
+    download_count: Optional[int],
+    typeshed_data: Optional[dict[str, Any]],
+) -> dict[str, Any]:
+    """Copies an unchanged package's previous report, refreshing the fields that don't come from its archives."""
+    package_report = dict(previous)
+    package_report["DownloadCount"] = download_count
+    package_report["DownloadRanking"] = rank
+    package_report["TypeshedData"] = (typeshed_data or {}).get(package_name, {})
+    return package_report
@@ -0,0 +1,198 @@
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Generator, NamedTuple, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    package TEXT PRIMARY KEY,
+    rank INTEGER NOT NULL,
+    -- Estimated analysis cost; bigger jobs are leased first
+    cost INTEGER NOT NULL DEFAULT 0,
+    download_count INTEGER,
+    has_stub_package INTEGER NOT NULL,
+    -- The package's row of the typeshed CSV, as JSON
+    typeshed_data TEXT,
+    -- 'pending', 'leased' or 'done'
+    state TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    -- The finished package report, as JSON
+    report TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_by_cost ON jobs (state, cost DESC, rank);
+"""
+
+# A worker that stops renewing its lease for this long is presumed dead, and its job is handed out again
+DEFAULT_LEASE_SECONDS = 300.0
+# Jobs are given up on after this many leases, so a package that kills its worker can't stall the run
+DEFAULT_MAX_ATTEMPTS = 3
+
+
+class Job(NamedTuple):
+    package: str
+    rank: int
+    download_count: Optional[int]
+    has_stub_package: bool
+    typeshed_data: Optional[dict[str, Any]]
+    attempts: int
+
+
+class JobQueue:
+    """An SQLite queue of packages to analyze, shared by worker processes on one host.
+
+    Workers lease the most expensive job nobody holds, so no big package
+    is left running alone at the end, and renew the lease
+    while they work on it, and store the report when done. A job whose
+    lease expires, because its worker crashed or hung, goes to the next
+    worker that asks, up to max_attempts times in all.
+
+    The queue is an SQLite database in WAL mode, whose locking relies on
+    shared memory, so every worker must run on the host that has the file.
+    It can't be shared across hosts over a network filesystem.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        lease_seconds: float = DEFAULT_LEASE_SECONDS,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+    ):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        # Transactions are begun explicitly, so a lease can take the write lock before looking for a job
+        self._connection = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(SCHEMA)
+
+    @contextmanager
+    def _transaction(self) -> Generator[sqlite3.Connection, None, None]:
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._connection
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._connection.execute("COMMIT")
+
+    def enqueue(
+        self,
+        jobs: list[tuple[str, int, Optional[int], bool, Optional[dict[str, Any]]]],
+        costs: Optional[dict[str, int]] = None,
+    ) -> None:
+        """Replaces the queue with (package, rank, download count, has stub package, typeshed data) jobs.
+
+        Jobs are leased in descending order of their costs, then by rank;
+        without costs, by rank alone.
+        """
+        costs = costs or {}
+        with self._transaction() as connection:
+            connection.execute("DELETE FROM jobs")
+            connection.executemany(
+                "INSERT INTO jobs (package, rank, cost, download_count, has_stub_package, typeshed_data) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (package, rank, costs.get(package, 0), download_count, has_stub_package,
+                     json.dumps(typeshed_data) if typeshed_data is not None else None)
+                    for package, rank, download_count, has_stub_package, typeshed_data in jobs
+                ])
+
+    def lease(self, worker: str, now: Optional[float] = None) -> Optional[Job]:
+        """Hands the most expensive unclaimed or abandoned job to worker, or returns None if there's none right now."""
+        now = time.time() if now is None else now
+        with self._transaction() as connection:
+            row = connection.execute(
+                "SELECT package, rank, download_count, has_stub_package, typeshed_data, attempts FROM jobs "
+                "WHERE (state = 'pending' OR (state = 'leased' AND lease_expires < ?)) AND attempts < ? "
+                "ORDER BY cost DESC, rank LIMIT 1",
+                (now, self.max_attempts)).fetchone()
+            if row is None:
+                return None
+            package, rank, download_count, has_stub_package, typeshed_data, attempts = row
+            connection.execute(
+                "UPDATE jobs SET state = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1 "
+                "WHERE package = ?",
+                (worker, now + self.lease_seconds, package))
+        return Job(
+            package, rank, download_count, bool(has_stub_package),
+            json.loads(typeshed_data) if typeshed_data is not None else None, attempts + 1)
+
+    def renew(self, job: Job, worker: str) -> bool:
+        """Extends worker's lease on a job, returning False if the lease was lost to another worker."""
+        with self._transaction() as connection:
+            cursor = connection.execute(
+                "UPDATE jobs SET lease_expires = ? WHERE package = ? AND worker = ? AND state = 'leased'",
+                (time.time() + self.lease_seconds, job.package, worker))
+            return cursor.rowcount > 0
+
+    @contextmanager
+    def keep_alive(self, job: Job, worker: str) -> Generator[None, None, None]:
+        """Renews worker's lease on a job from a background thread for as long as the block runs."""
+        stop = threading.Event()
+
+        def heartbeat() -> None:
+            while not stop.wait(self.lease_seconds / 3):
+                if not self.renew(job, worker):
+                    print(f"Warning: lost the lease on {job.package} to another worker.")
+                    return
+
+        thread = threading.Thread(target=heartbeat, daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def complete(self, job: Job, report: dict[str, Any]) -> None:
+        """Stores a job's report. A job already finished by a worker it was handed to after this one keeps its report."""
+        with self._transaction() as connection:
+            connection.execute(
+                "UPDATE jobs SET state = 'done', worker = NULL, lease_expires = NULL, report = ? "
+                "WHERE package = ? AND state != 'done'",
+                (json.dumps(report), job.package))
+
+    def release(self, job: Job, worker: str) -> None:
+        """Gives a job back unfinished, for another attempt."""
+        with self._transaction() as connection:
+            connection.execute(
+                "UPDATE jobs SET state = 'pending', worker = NULL, lease_expires = NULL "
+                "WHERE package = ? AND worker = ? AND state = 'leased'",
+                (job.package, worker))
+
+    def in_progress(self, now: Optional[float] = None) -> int:
+        """Counts the jobs other workers hold leases on that haven't expired."""
+        now = time.time() if now is None else now
+        with self._lock:
+            count: int = self._connection.execute(
+                "SELECT COUNT(*) FROM jobs WHERE state = 'leased' AND lease_expires >= ?", (now,)
+            ).fetchone()[0]
+        return count
+
+    def counts(self) -> dict[str, int]:
+        """Counts the jobs done, still to do, and given up on after max_attempts."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT state = 'done', state != 'done' AND attempts >= ?, COUNT(*) FROM jobs GROUP BY 1, 2",
+                (self.max_attempts,)).fetchall()
+        counts = {"done": 0, "remaining": 0, "failed": 0}
+        for done, failed, count in rows:
+            counts["done" if done else "failed" if failed else "remaining"] += count
+        return counts
+
+    def reports(self) -> dict[str, Any]:
+        """Returns the reports of the finished jobs, in rank order."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT package, report FROM jobs WHERE state = 'done' ORDER BY rank").fetchall()
+        return {package: json.loads(report) for package, report in rows}
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,52 @@
+import json
+import os
+import threading
+from typing import Any
+
+
+class ReportJournal:
+    """An append-only file of finished package reports, one JSON line each, so a crashed run can resume.
+
+    Every report is flushed and fsynced before record returns. A line cut
+    short by a crash mid-write is dropped when the journal is reopened.
+    Without resume, the journal is cleared and a new run starts.
+    """
+
+    def __init__(self, path: str, resume: bool = False):
+        self.path = path
+        self._lock = threading.Lock()
+        self.reports: dict[str, dict[str, Any]] = self._load() if resume else {}
+        self._file = open(path, "a" if resume else "w", encoding="utf-8")
+
+    def _load(self) -> dict[str, dict[str, Any]]:
+        reports: dict[str, dict[str, Any]] = {}
+        try:
+            with open(self.path, "rb") as f:
+                content = f.read()
+        except FileNotFoundError:
+            return reports
+        # Anything after the last newline was being written when the run stopped
+        complete = content[:content.rfind(b"\n") + 1]
+        for line in complete.splitlines():
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            reports[entry["package"]] = entry["report"]
+        if len(complete) < len(content):
+            with open(self.path, "r+b") as f:
+                f.truncate(len(complete))
+        return reports
+
+    def record(self, package_name: str, report: dict[str, Any]) -> None:
+        """Durably appends a finished package's report."""
+        line = json.dumps({"package": package_name, "report": report}) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.reports[package_name] = report
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
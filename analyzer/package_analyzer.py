@@ -1,77 +1,416 @@
+import hashlib
+import io
 import os
+import posixpath
 import tarfile
 import zipfile
-from typing import Any, Optional
+from typing import Any, BinaryIO, NamedTuple, Optional, Union
+from urllib.parse import urlparse
+from urllib.request import url2pathname
 
 import requests
+from packaging.utils import parse_wheel_filename
 
+from analyzer import http_client
+from analyzer.artifact_cache import (
+    DEFAULT_MAX_BYTES,
+    DEFAULT_NEGATIVE_TTL_SECONDS,
+    NO_ARCHIVE,
+    NO_SDIST,
+    NOT_FOUND,
+    ArtifactCache,
+)
+from analyzer.package_source import SIMPLE_ACCEPT, ArchiveDirectory, SimpleIndex, resolve_urls
 
-def find_stub_package(package_name: str) -> Optional[str]:
-    """Checks if a stub package exists for the given package on PyPI."""
-    stub_package_name = f"{package_name}-stubs"
-    pypi_url = f"https://pypi.org/pypi/{stub_package_name}/json"
-    response = requests.get(pypi_url)
+PYPI_JSON_URL = "https://pypi.org/pypi/{}/json"
+PYPI_PROJECT_URL = "https://pypi.org/project/{}/"
+# Archives larger than this are not downloaded
+max_archive_bytes = 512 * 1024 * 1024
+DOWNLOAD_CHUNK_BYTES = 1024 * 1024
+# Archives by digest, and distributions known to have none
+artifact_cache: Optional[ArtifactCache] = None
+# Analyze a wheel when the distribution has one, instead of its sdist
+prefer_wheels = False
+# Metadata resolved ahead of the analysis, by distribution name
+metadata_manifest: dict[str, "DistributionMetadata"] = {}
+# Where metadata and archives come from in place of PyPI's JSON API
+package_source: Union[SimpleIndex, ArchiveDirectory, None] = None
+
+
+def configure_max_archive_size(max_bytes: int) -> None:
+    """Sets the size above which archives are skipped instead of downloaded."""
+    global max_archive_bytes
+    max_archive_bytes = max_bytes
+
+
+def configure_package_source(source: str) -> None:
+    """Fetches packages from a simple index at a URL, or from a directory of archives, instead of PyPI."""
+    global package_source
+    if source.startswith(("http://", "https://")):
+        package_source = SimpleIndex(source)
+    elif os.path.isdir(source):
+        package_source = ArchiveDirectory(source)
+    else:
+        raise ValueError(f"Package source {source} is neither an index URL nor a directory.")
+
+
+def configure_prefer_wheels(prefer: bool) -> None:
+    """Sets whether a pure-Python or the smallest wheel is analyzed in place of the sdist when there is one."""
+    global prefer_wheels
+    prefer_wheels = prefer
+
+
+class Artifact(NamedTuple):
+    """A downloadable file of a distribution, as listed in its PyPI JSON metadata."""
+
+    url: str
+    sha256: Optional[str]
+    size: Optional[int]
+    # "sdist" or "bdist_wheel"
+    packagetype: str
+    # The release the file belongs to, if known
+    version: Optional[str] = None
+
+
+def is_source_member(name: str) -> bool:
+    """Checks whether an archive member is one the analysis reads: a .py, .pyi or py.typed file."""
+    return name.endswith((".py", ".pyi", "py.typed"))
+
+
+class DistributionMetadata(NamedTuple):
+    """What the analysis needs from a distribution's PyPI JSON metadata, without the rest of it."""
+
+    name: str
+    # False if PyPI has no project by this name
+    found: bool
+    version: Optional[str]
+    # The archive select_archive picks, or None with the reason in error
+    archive: Optional[Artifact]
+    error: Optional[str]
+
+
+def configure_metadata_manifest(manifest: dict[str, DistributionMetadata]) -> None:
+    """Answers metadata lookups for the distributions in manifest from it instead of from PyPI."""
+    global metadata_manifest
+    metadata_manifest = manifest
+
+
+def manifest_entries(package_name: str) -> dict[str, DistributionMetadata]:
+    """Returns the metadata manifest's entries for a package and its -stubs project, as far as it lists them."""
+    return {
+        name: metadata_manifest[name]
+        for name in (package_name, f"{package_name}-stubs") if name in metadata_manifest
+    }
+
+
+def manifest_archive_sizes() -> dict[str, int]:
+    """Returns the size of each distribution's archive to analyze, as far as the metadata manifest lists them."""
+    return {
+        name: entry.archive.size
+        for name, entry in metadata_manifest.items()
+        if entry.archive is not None and entry.archive.size
+    }
+
+
+def configure_artifact_cache(
+    cache_dir: str, max_bytes: Optional[int] = None, negative_ttl: Optional[float] = None
+) -> None:
+    """Keeps downloaded archives, and distributions found to have none, in cache_dir across runs."""
+    global artifact_cache
+    artifact_cache = ArtifactCache(
+        cache_dir,
+        max_bytes if max_bytes is not None else DEFAULT_MAX_BYTES,
+        negative_ttl if negative_ttl is not None else DEFAULT_NEGATIVE_TTL_SECONDS,
+    )
 
-    if response.status_code == 200:
-        return f"https://pypi.org/project/{stub_package_name}/"
+
+def missing_reason(name: str, kind: str) -> Optional[str]:
+    """Returns why a distribution recently couldn't be fetched, if the artifact cache remembers it.
+
+    kind is NOT_FOUND for projects missing from PyPI, or the
+    missing_archive_kind() for projects without an archive to analyze.
+    """
+    return artifact_cache.negative(name, kind) if artifact_cache is not None else None
+
+
+def note_missing(name: str, kind: str, reason: str) -> None:
+    if artifact_cache is not None:
+        artifact_cache.add_negative(name, kind, reason)
+
+
+def local_archive(artifact: Artifact) -> Optional[str]:
+    """Returns the path of an archive the package source has on disk, or None if it has to be downloaded."""
+    if artifact.url.startswith("file:"):
+        return url2pathname(urlparse(artifact.url).path)
     return None
 
 
-def download_package(package_name: str, temp_dir: str) -> str:
-    """Downloads the specified package from PyPI and extracts it to a temporary directory."""
-    # Fetch the package metadata from PyPI
-    pypi_url = f"https://pypi.org/pypi/{package_name}/json"
-    response = requests.get(pypi_url)
+def cached_archive(artifact: Artifact) -> Optional[str]:
+    """Returns the path of an already downloaded copy of an archive, if the artifact cache has one."""
+    if artifact_cache is None or not artifact.sha256:
+        return None
+    return artifact_cache.lookup(artifact.sha256)
+
+
+def cache_archive(artifact: Artifact, path: Optional[str] = None, content: Optional[bytes] = None) -> None:
+    """Adds a downloaded archive, on disk at path or in memory as content, to the artifact cache."""
+    if artifact_cache is None or not artifact.sha256:
+        return
+    if path is not None:
+        artifact_cache.store(artifact.sha256, path)
+    elif content is not None:
+        artifact_cache.store_bytes(artifact.sha256, content)
+
+
+def get_metadata(package_name: str) -> Optional[dict[str, Any]]:
+    """Fetches a distribution's PyPI JSON metadata from the package source, or None if it doesn't have it."""
+    source = package_source
+    if isinstance(source, ArchiveDirectory):
+        return source.metadata(package_name)
+    if isinstance(source, SimpleIndex):
+        url = source.page_url(package_name)
+        response = http_client.cached_get(url, headers={"Accept": SIMPLE_ACCEPT})
+    else:
+        url = PYPI_JSON_URL.format(package_name)
+        response = http_client.cached_get(url)
+    if response.status_code == 404:
+        return None
     response.raise_for_status()
+    if isinstance(source, SimpleIndex):
+        return source.metadata(package_name, url, response.content)
 
     # The API returns a JSON response, so 'data' is a dictionary
     data: dict[str, Any] = response.json()
+    return resolve_urls(data, url)
+
 
+def find_stub_package(package_name: str) -> Optional[str]:
+    """Checks if a stub package exists for the given package on PyPI."""
+    stub_package_name = f"{package_name}-stubs"
+    if stub_package_name in metadata_manifest:
+        found = metadata_manifest[stub_package_name].found
+        return PYPI_PROJECT_URL.format(stub_package_name) if found else None
+    if missing_reason(stub_package_name, NOT_FOUND) is not None:
+        return None
+    try:
+        data = get_metadata(stub_package_name)
+    except requests.HTTPError:
+        return None
+
+    if data is not None:
+        return PYPI_PROJECT_URL.format(stub_package_name)
+    note_missing(stub_package_name, NOT_FOUND, f"Package '{stub_package_name}' not found on PyPI.")
+    return None
+
+
+def _artifact(url_info: dict[str, Any]) -> Artifact:
+    return Artifact(
+        url_info["url"], url_info.get("digests", {}).get("sha256"), url_info.get("size"),
+        url_info["packagetype"])
+
+
+def select_sdist(package_name: str, data: dict[str, Any]) -> Artifact:
+    """Picks the source distribution out of a package's PyPI JSON metadata, raising ValueError if there is none."""
     # 'urls' is a list of dictionaries containing information about the available distributions
     urls: list[dict[str, Any]] = data.get("urls", [])
 
-    sdist_url: str | None = None
     for url_info in urls:
         # 'url_info' is a dictionary, and we're accessing the 'packagetype' and 'url' keys
-        if url_info.get("packagetype") == "sdist":
-            sdist_url = url_info.get("url")
-            break
-
-    if not sdist_url:
-        raise ValueError(
-            f"Source distribution for package '{
-                package_name}' not found on PyPI."
-        )
-
-    # Download the source distribution
-    sdist_response = requests.get(sdist_url)
-    sdist_response.raise_for_status()
-
-    # Determine the archive type and extract
-    if sdist_url.endswith(".zip"):
-        archive_path = os.path.join(temp_dir, f"{package_name}.zip")
-        with open(archive_path, "wb") as archive_file:
-            archive_file.write(sdist_response.content)
+        if url_info.get("packagetype") == "sdist" and url_info.get("url"):
+            return _artifact(url_info)
+
+    raise ValueError(
+        f"Source distribution for package '{
+            package_name}' not found on PyPI."
+    )
+
+
+def is_pure_wheel(filename: str) -> bool:
+    """Checks whether a wheel's tags say it runs anywhere, i.e. it has no compiled code.
+
+    A filename that isn't named to the wheel spec doesn't count as pure.
+    """
+    try:
+        _, _, _, tags = parse_wheel_filename(filename)
+    except ValueError:
+        return False
+    return any(tag.abi == "none" and tag.platform == "any" for tag in tags)
+
+
+def select_wheel(data: dict[str, Any]) -> Optional[Artifact]:
+    """Picks the wheel to analyze out of a package's PyPI JSON metadata: the smallest pure-Python one, else the smallest."""
+    wheels = [
+        url_info for url_info in data.get("urls", [])
+        if url_info.get("packagetype") == "bdist_wheel" and url_info.get("url", "").endswith(".whl")
+    ]
+    if not wheels:
+        return None
+    # A platform wheel has the same Python files as any other, plus compiled code
+    wheel = min(wheels, key=lambda url_info: (
+        not is_pure_wheel(url_info.get("filename") or posixpath.basename(url_info["url"])),
+        url_info.get("size") or max_archive_bytes,
+    ))
+    return _artifact(wheel)
+
+
+def select_archive(package_name: str, data: dict[str, Any]) -> Artifact:
+    """Picks the archive to analyze: with prefer_wheels a wheel if there is one, otherwise the sdist."""
+    version = data.get("info", {}).get("version")
+    if prefer_wheels:
+        wheel = select_wheel(data)
+        if wheel is not None:
+            return wheel._replace(version=version)
+        try:
+            return select_sdist(package_name, data)._replace(version=version)
+        except ValueError:
+            raise ValueError(
+                f"No wheel or source distribution for package '{package_name}' on PyPI.") from None
+    return select_sdist(package_name, data)._replace(version=version)
+
+
+def describe_distribution(name: str, data: Optional[dict[str, Any]]) -> DistributionMetadata:
+    """Condenses a distribution's PyPI JSON metadata, or None if PyPI doesn't have it, into a manifest entry."""
+    if data is None:
+        return DistributionMetadata(name, False, None, None, f"Package '{name}' not found on PyPI.")
+    version: Optional[str] = data.get("info", {}).get("version")
+    try:
+        return DistributionMetadata(name, True, version, select_archive(name, data), None)
+    except ValueError as e:
+        return DistributionMetadata(name, True, version, None, str(e))
+
+
+def missing_archive_kind() -> str:
+    """Returns the kind of negative entry for a distribution without an archive select_archive accepts."""
+    return NO_ARCHIVE if prefer_wheels else NO_SDIST
+
+
+def find_archive(package_name: str) -> Artifact:
+    """Looks up the archive of the specified package to analyze on PyPI."""
+    if package_name in metadata_manifest:
+        entry = metadata_manifest[package_name]
+        if entry.archive is None:
+            raise ValueError(entry.error)
+        return entry.archive
+
+    reason = missing_reason(package_name, NOT_FOUND) or missing_reason(package_name, missing_archive_kind())
+    if reason is not None:
+        raise ValueError(reason)
+
+    # Fetch the package metadata from PyPI
+    data = get_metadata(package_name)
+    if data is None:
+        reason = f"Package '{package_name}' not found on PyPI."
+        note_missing(package_name, NOT_FOUND, reason)
+        raise ValueError(reason)
+    try:
+        return select_archive(package_name, data)
+    except ValueError as e:
+        note_missing(package_name, missing_archive_kind(), str(e))
+        raise
+
+
+def archive_suffix(archive_url: str) -> str:
+    """Returns the suffix of an archive format the analysis can read, raising ValueError for others."""
+    for suffix in (".zip", ".whl", ".tar.gz", ".tgz"):
+        if archive_url.endswith(suffix):
+            return suffix
+    raise ValueError(f"Unsupported archive format for {archive_url}.")
+
+
+def download_archive(archive_url: str, out: BinaryIO, sha256: Optional[str] = None) -> None:
+    """Streams an archive into out in chunks, raising ValueError once it's over max_archive_bytes.
+
+    With sha256, the archive is also checked against that digest.
+    """
+    too_large = ValueError(
+        f"{archive_url} is larger than the maximum archive size of {max_archive_bytes} bytes.")
+    digest = hashlib.sha256()
+    response = http_client.get(archive_url, stream=True)
+    try:
+        response.raise_for_status()
+        if int(response.headers.get("Content-Length") or 0) > max_archive_bytes:
+            raise too_large
+        size = 0
+        for chunk in response.iter_content(DOWNLOAD_CHUNK_BYTES):
+            size += len(chunk)
+            # Content-Length may be missing or wrong, so count as well
+            if size > max_archive_bytes:
+                raise too_large
+            digest.update(chunk)
+            out.write(chunk)
+    finally:
+        response.close()
+    if sha256 and digest.hexdigest() != sha256:
+        raise ValueError(f"{archive_url} does not match its sha256 digest {sha256}.")
+
+
+def fetch_archive(package_name: str) -> tuple[Artifact, bytes]:
+    """Downloads the archive of the specified package to analyze from PyPI, returning it and its content."""
+    artifact = find_archive(package_name)
+    path = local_archive(artifact) or cached_archive(artifact)
+    if path is not None:
+        with open(path, "rb") as f:
+            return artifact, f.read()
+    content = io.BytesIO()
+    download_archive(artifact.url, content, artifact.sha256)
+    cache_archive(artifact, content=content.getvalue())
+    return artifact, content.getvalue()
+
+
+def extract_archive(archive_path: str, archive_url: str, temp_dir: str) -> None:
+    """Extracts the Python files of an archive on disk into temp_dir."""
+    if archive_suffix(archive_url) in (".zip", ".whl"):
         with zipfile.ZipFile(archive_path, "r") as zip_ref:
-            zip_ref.extractall(temp_dir)
-    elif sdist_url.endswith((".tar.gz", ".tgz")):
-        archive_path = os.path.join(temp_dir, f"{package_name}.tar.gz")
-        with open(archive_path, "wb") as archive_file:
-            archive_file.write(sdist_response.content)
-        with tarfile.open(archive_path, "r:gz") as tar_ref:
-            # type: ignore reportDeprecated python 3.14
-            tar_ref.extractall(temp_dir)
+            for info in zip_ref.infolist():
+                if not info.is_dir() and is_source_member(info.filename):
+                    zip_ref.extract(info, temp_dir)
     else:
-        raise ValueError(f"Unsupported archive format for {sdist_url}.")
+        with tarfile.open(archive_path, "r|gz") as tar_ref:
+            for member in tar_ref:
+                if not member.isfile() or not is_source_member(member.name):
+                    continue
+                try:
+                    tar_ref.extract(member, temp_dir, filter="data")
+                except tarfile.FilterError:
+                    # Absolute paths and paths leaving temp_dir are skipped
+                    continue
+
+
+def download_package(
+    package_name: str, temp_dir: str, artifacts: Optional[dict[str, Artifact]] = None
+) -> str:
+    """Downloads the specified package from PyPI and extracts its Python files to a temporary directory.
+
+    The archive that was extracted is recorded in artifacts under the package name.
+    """
+    artifact = find_archive(package_name)
+    suffix = archive_suffix(artifact.url)
+
+    archive_path = local_archive(artifact) or cached_archive(artifact)
+    if archive_path is not None:
+        extract_archive(archive_path, artifact.url, temp_dir)
+    else:
+        # Stream the archive to disk, then extract
+        archive_path = os.path.join(temp_dir, f"{package_name}{suffix}")
+        with open(archive_path, "wb") as archive_file:
+            download_archive(artifact.url, archive_file, artifact.sha256)
+        cache_archive(artifact, path=archive_path)
+        extract_archive(archive_path, artifact.url, temp_dir)
+        # Only the extracted files are needed from here on
+        os.remove(archive_path)
+    if artifacts is not None:
+        artifacts[package_name] = artifact
 
     # Return the path to the extracted package
     return temp_dir
 
 
-def extract_files(package_name: str, temp_dir: str) -> tuple[list[str], bool]:
+def extract_files(
+    package_name: str, temp_dir: str, artifacts: Optional[dict[str, Artifact]] = None
+) -> tuple[list[str], bool]:
     """Extracts Python files from the downloaded package directory."""
     try:
-        package_dir = download_package(package_name, temp_dir)
+        package_dir = download_package(package_name, temp_dir, artifacts)
     except ValueError as e:
         print(f"Warning: {e}")
         return [], False
@@ -87,3 +426,55 @@ def extract_files(package_name: str, temp_dir: str) -> tuple[list[str], bool]:
                 has_py_typed_file = True
 
     return python_files, has_py_typed_file
+
+
+def read_archive_sources(archive_url: str, content: bytes) -> tuple[dict[str, bytes], bool]:
+    """Reads the Python files of an sdist or wheel without extracting it to disk.
+
+    Files are keyed by '<archive name>/<member path>', which stands in for
+    a path on disk when computing coverage.
+    """
+    archive_name = posixpath.basename(archive_url)
+    sources: dict[str, bytes] = {}
+    has_py_typed_file = False
+
+    if archive_url.endswith((".zip", ".whl")):
+        with zipfile.ZipFile(io.BytesIO(content), "r") as zip_ref:
+            for info in zip_ref.infolist():
+                if info.is_dir() or not is_source_member(info.filename):
+                    continue
+                if info.filename.endswith((".py", ".pyi")):
+                    sources[f"{archive_name}/{info.filename}"] = zip_ref.read(info)
+                if info.filename.endswith("py.typed"):
+                    has_py_typed_file = True
+    elif archive_url.endswith((".tar.gz", ".tgz")):
+        # Stream through the members in order, without seeking back
+        with tarfile.open(fileobj=io.BytesIO(content), mode="r|gz") as tar_ref:
+            for member in tar_ref:
+                if not member.isfile() or not is_source_member(member.name):
+                    continue
+                if member.name.endswith((".py", ".pyi")):
+                    member_file = tar_ref.extractfile(member)
+                    if member_file is not None:
+                        sources[f"{archive_name}/{member.name}"] = member_file.read()
+                if member.name.endswith("py.typed"):
+                    has_py_typed_file = True
+    else:
+        raise ValueError(f"Unsupported archive format for {archive_url}.")
+
+    return sources, has_py_typed_file
+
+
+def extract_sources(
+    package_name: str, artifacts: Optional[dict[str, Artifact]] = None
+) -> tuple[dict[str, bytes], bool]:
+    """Downloads a package and reads its Python files in memory, like extract_files without the disk."""
+    try:
+        artifact, content = fetch_archive(package_name)
+        sources = read_archive_sources(artifact.url, content)
+        if artifacts is not None:
+            artifacts[package_name] = artifact
+        return sources
+    except ValueError as e:
+        print(f"Warning: {e}")
+        return {}, False
@@ -0,0 +1,166 @@
+import json
+import os
+import threading
+from html.parser import HTMLParser
+from pathlib import Path
+from typing import Any, NamedTuple, Optional
+from urllib.parse import urldefrag, urljoin
+
+from packaging.utils import canonicalize_name, parse_sdist_filename, parse_wheel_filename
+from packaging.version import Version
+
+# PEP 691 JSON first, falling back to the PEP 503 HTML every index serves
+SIMPLE_ACCEPT = (
+    "application/vnd.pypi.simple.v1+json, "
+    "application/vnd.pypi.simple.v1+html;q=0.2, text/html;q=0.1"
+)
+
+
+class IndexFile(NamedTuple):
+    """A file listed for a project by a simple index or found in a directory."""
+
+    filename: str
+    url: str
+    sha256: Optional[str]
+    size: Optional[int]
+
+
+def parse_filename(filename: str) -> Optional[tuple[str, Version, str]]:
+    """Returns the normalized project name, version and PyPI packagetype of an archive, or None if it isn't one."""
+    try:
+        if filename.endswith(".whl"):
+            name, version, _, _ = parse_wheel_filename(filename)
+            return name, version, "bdist_wheel"
+        if filename.endswith(".tgz"):
+            filename = filename.removesuffix(".tgz") + ".tar.gz"
+        name, version = parse_sdist_filename(filename)
+        return name, version, "sdist"
+    except ValueError:
+        # Not an archive, or not named to the spec
+        return None
+
+
+def release_metadata(name: str, files: list[IndexFile]) -> Optional[dict[str, Any]]:
+    """Builds the parts of PyPI's JSON metadata the analysis reads from a project's files.
+
+    Like PyPI's, the metadata describes the latest final release, or the
+    latest pre-release if there's nothing else. Returns None if there are
+    no archives of this project among files.
+    """
+    releases: dict[Version, list[dict[str, Any]]] = {}
+    for file in files:
+        parsed = parse_filename(file.filename)
+        if parsed is None or parsed[0] != canonicalize_name(name):
+            continue
+        releases.setdefault(parsed[1], []).append({
+            "filename": file.filename,
+            "url": file.url,
+            "packagetype": parsed[2],
+            "digests": {"sha256": file.sha256} if file.sha256 else {},
+            "size": file.size,
+        })
+    if not releases:
+        return None
+    final = [version for version in releases if not version.is_prerelease]
+    version = max(final or releases)
+    return {"info": {"name": name, "version": str(version)}, "urls": releases[version]}
+
+
+def resolve_urls(data: dict[str, Any], metadata_url: str) -> dict[str, Any]:
+    """Makes the archive URLs in PyPI JSON metadata absolute, as mirrors of the JSON API may list them relative."""
+    for url_info in data.get("urls", []):
+        if "url" in url_info:
+            url_info["url"] = urljoin(metadata_url, url_info["url"])
+    return data
+
+
+class _LinkParser(HTMLParser):
+    def __init__(self) -> None:
+        super().__init__()
+        self.links: list[tuple[str, dict[str, Optional[str]]]] = []
+        self._href: Optional[str] = None
+        self._attrs: dict[str, Optional[str]] = {}
+        self._text = ""
+
+    def handle_starttag(self, tag: str, attrs: list[tuple[str, Optional[str]]]) -> None:
+        if tag == "a":
+            self._attrs = dict(attrs)
+            self._href = self._attrs.get("href")
+            self._text = ""
+
+    def handle_data(self, data: str) -> None:
+        if self._href is not None:
+            self._text += data
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag == "a" and self._href is not None:
+            self.links.append((self._text.strip(), self._attrs))
+            self._href = None
+
+
+class SimpleIndex:
+    """A PEP 503/691 simple repository API, such as a PyPI mirror or a local stand-in server."""
+
+    def __init__(self, index_url: str):
+        self.index_url = index_url.rstrip("/") + "/"
+
+    def page_url(self, name: str) -> str:
+        return urljoin(self.index_url, f"{canonicalize_name(name)}/")
+
+    def parse_page(self, page_url: str, body: bytes) -> list[IndexFile]:
+        """Reads the files listed on a project page, in either the JSON or the HTML format."""
+        files: list[IndexFile] = []
+        if body.lstrip().startswith(b"{"):
+            for file in json.loads(body)["files"]:
+                if file.get("yanked"):
+                    continue
+                url = urljoin(page_url, file["url"])
+                files.append(IndexFile(
+                    file["filename"], url, file.get("hashes", {}).get("sha256"), file.get("size")))
+            return files
+
+        parser = _LinkParser()
+        parser.feed(body.decode("utf-8", "replace"))
+        for text, attrs in parser.links:
+            if attrs.get("data-yanked") is not None:
+                continue
+            url, fragment = urldefrag(urljoin(page_url, attrs["href"] or ""))
+            sha256 = fragment.removeprefix("sha256=") if fragment.startswith("sha256=") else None
+            files.append(IndexFile(text or url.rsplit("/", 1)[-1], url, sha256, None))
+        return files
+
+    def metadata(self, name: str, page_url: str, body: bytes) -> Optional[dict[str, Any]]:
+        """Turns a project page into PyPI-style metadata, or None if it lists no archives."""
+        return release_metadata(name, self.parse_page(page_url, body))
+
+
+class ArchiveDirectory:
+    """A directory of downloaded archives, flat or with a subdirectory per project.
+
+    The directory is listed once, on the first lookup. Archives are
+    referred to by file: URLs and read in place.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._files: Optional[dict[str, list[IndexFile]]] = None
+
+    def _list(self) -> dict[str, list[IndexFile]]:
+        with self._lock:
+            if self._files is None:
+                files: dict[str, list[IndexFile]] = {}
+                for root, _, filenames in os.walk(self.directory):
+                    for filename in filenames:
+                        parsed = parse_filename(filename)
+                        if parsed is None:
+                            continue
+                        path = Path(root, filename).resolve()
+                        files.setdefault(parsed[0], []).append(
+                            IndexFile(filename, path.as_uri(), None, path.stat().st_size))
+                self._files = files
+            return self._files
+
+    def metadata(self, name: str) -> Optional[dict[str, Any]]:
+        """Returns PyPI-style metadata for the project's archives in the directory, or None if it has none."""
+        return release_metadata(name, self._list().get(canonicalize_name(name), []))
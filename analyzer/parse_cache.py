@@ -0,0 +1,63 @@
+import hashlib
+import json
+import os
+import sys
+from typing import Any
+
+from analyzer.disk_store import LruStore
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+class ParseCache:
+    """An on-disk cache of per-file analysis results, keyed by a hash of the file content.
+
+    Entries are JSON files in an LruStore, written atomically, so any number
+    of threads and processes can share one cache directory. Reading an entry
+    refreshes its modification time, and the least recently used entries are
+    evicted once the cache grows past max_bytes.
+    """
+
+    def __init__(self, cache_dir: str, version: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.version = version
+        self.max_bytes = max_bytes
+        self._store = LruStore(cache_dir, max_bytes)
+
+    def key(self, content: bytes, variant: str = "") -> str:
+        """Returns the cache key for a file's content under this cache's version and an optional variant.
+
+        The key includes the Python version, since which files ast.parse
+        accepts depends on the interpreter.
+        """
+        python = "%d.%d" % sys.version_info[:2]
+        digest = hashlib.sha256(f"{self.version}\0{python}\0{variant}\0".encode())
+        digest.update(content)
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def load(self, key: str) -> Any:
+        """Returns the value stored under key, raising KeyError if there is none."""
+        path = self._path(key)
+        try:
+            with open(path, "r") as f:
+                value = json.load(f)
+        except (OSError, ValueError):
+            # Missing, evicted by another process, or unreadable
+            raise KeyError(key)
+        self._store.touch(path)
+        return value
+
+    def store(self, key: str, value: Any) -> None:
+        """Stores a JSON-serializable value under key. Failing to write only prints a warning."""
+        try:
+            with self._store.write(self._path(key)) as f:
+                f.write(json.dumps(value, separators=(",", ":")).encode())
+        except OSError as e:
+            print(f"Warning: could not write parse cache entry: {e}")
+
+    def evict(self) -> None:
+        """Deletes the least recently used entries until the cache is back under budget."""
+        self._store.evict()
@@ -0,0 +1,127 @@
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator, TypeVar, Union
+
+import requests
+
+from analyzer import coverage_calculator
+from analyzer.async_fetch import FetchedPackage
+from analyzer.package_analyzer import Artifact, fetch_archive, find_stub_package
+from analyzer.typeshed_checker import check_typeshed
+
+# Threads downloading packages, set by configure_download_workers
+download_workers = 16
+# Downloaded packages waiting for the parse stage, per parse worker
+QUEUED_PER_PARSE_WORKER = 2
+
+Result = TypeVar("Result")
+
+
+class _Done:
+    """Marks the end of a queue."""
+
+
+def configure_download_workers(workers: int) -> None:
+    """Sets how many threads the pipeline downloads packages with."""
+    global download_workers
+    download_workers = workers
+
+
+def download_package_archives(name: str, has_stub_package: bool) -> FetchedPackage:
+    """Downloads the archives analyze_package would for a package, like async_fetch.fetch_package on a thread."""
+    archives: dict[str, tuple[Artifact, bytes]] = {}
+    errors: dict[str, str] = {}
+
+    def fetch(distribution: str) -> None:
+        try:
+            archives[distribution] = fetch_archive(distribution)
+        except (ValueError, requests.HTTPError) as e:
+            errors[distribution] = str(e)
+
+    fetch(name)
+    stub_package_url = None if check_typeshed(name) else find_stub_package(name)
+    if has_stub_package or stub_package_url:
+        fetch(f"{name}-stubs")
+    return FetchedPackage(name, archives, errors, stub_package_url)
+
+
+def run_pipeline(
+    packages: list[tuple[str, bool]], analyze: Callable[[FetchedPackage], Result]
+) -> Iterator[tuple[str, Result]]:
+    """Downloads (package name, has stub package) pairs and analyzes them in two stages, yielding results as they finish.
+
+    download_workers threads download archives into a queue holding at most
+    QUEUED_PER_PARSE_WORKER packages per parse worker; when it's full they
+    wait, which bounds the archives held in memory. One thread per parse
+    worker takes packages off the queue and calls analyze, whose parsing
+    runs in the shared process pool of coverage_calculator.parse_workers
+    processes. An exception in either stage stops the pipeline and is
+    raised here.
+    """
+    parse_workers = coverage_calculator.parse_workers or os.cpu_count() or 1
+    downloaded: "queue.Queue[Union[FetchedPackage, _Done]]" = queue.Queue(
+        maxsize=parse_workers * QUEUED_PER_PARSE_WORKER)
+    results: "queue.Queue[Union[tuple[str, Result], BaseException, _Done]]" = queue.Queue()
+    stop = threading.Event()
+
+    def put_downloaded(item: Union[FetchedPackage, _Done]) -> None:
+        # Waits for room, giving up if the pipeline is stopped
+        while not stop.is_set():
+            try:
+                downloaded.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def download(name: str, has_stub_package: bool) -> None:
+        if stop.is_set():
+            return
+        try:
+            put_downloaded(download_package_archives(name, has_stub_package))
+        except BaseException as e:
+            results.put(e)
+            stop.set()
+
+    def parse() -> None:
+        while not stop.is_set():
+            try:
+                fetched = downloaded.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if isinstance(fetched, _Done):
+                break
+            try:
+                results.put((fetched.name, analyze(fetched)))
+            except BaseException as e:
+                results.put(e)
+                stop.set()
+        results.put(_Done())
+
+    def download_all() -> None:
+        with ThreadPoolExecutor(max_workers=download_workers) as executor:
+            for name, has_stub_package in packages:
+                executor.submit(download, name, has_stub_package)
+        for _ in range(parse_workers):
+            put_downloaded(_Done())
+
+    threads = [threading.Thread(target=download_all, daemon=True)] + [
+        threading.Thread(target=parse, daemon=True) for _ in range(parse_workers)
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        finished = 0
+        while finished < parse_workers:
+            result = results.get()
+            if isinstance(result, _Done):
+                finished += 1
+            elif isinstance(result, BaseException):
+                raise result
+            else:
+                yield result
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
@@ -0,0 +1,184 @@
+import asyncio
+import threading
+import time
+from typing import Optional
+
+import requests
+
+# Requests per second, and how many may be sent at once after a quiet spell
+DEFAULT_RATE = 200.0
+DEFAULT_BURST = 50
+DEFAULT_MAX_CONCURRENCY = 64
+INITIAL_CONCURRENCY = 16
+# The concurrency limit is multiplied by this on congestion, at most once per DECREASE_INTERVAL seconds
+DECREASE_FACTOR = 0.5
+DECREASE_INTERVAL = 1.0
+# Latency above this multiple of the baseline counts as congestion
+LATENCY_TOLERANCE = 2.0
+# Latencies below this are all treated alike, so jitter on a fast network isn't congestion
+LATENCY_FLOOR = 0.02
+# Weight of each new sample in the latency average, and how fast the baseline follows it upwards
+LATENCY_SMOOTHING = 0.2
+BASELINE_DRIFT = 0.01
+# Consecutive failures that open the circuit, and how long it stays open before a probe
+DEFAULT_FAILURE_THRESHOLD = 10
+DEFAULT_OPEN_SECONDS = 30.0
+# Statuses meaning the server is shedding load
+OVERLOAD_STATUSES = frozenset((429, 503))
+# Longest a request waits for a free slot before checking again
+SLOT_WAIT_SECONDS = 1.0
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """Raised in place of sending a request while the host is failing, so a run stops quickly in an outage."""
+
+
+class RequestController:
+    """Paces outbound requests: a token bucket rate limit plus an adaptive concurrency limit.
+
+    The concurrency limit grows by one per limit's worth of healthy
+    responses and halves when responses are throttled (429, 503), fail to
+    arrive, or take more than LATENCY_TOLERANCE times the usual time to
+    start. After failure_threshold consecutive connection errors or 5xx
+    responses the circuit opens: requests raise CircuitOpenError for
+    open_seconds, then a single probe request decides whether it closes
+    again.
+
+    A request is in flight from acquire until release, which callers make
+    when the response headers arrive; latency is measured to that point,
+    so large bodies don't read as congestion. Threads and event loops can
+    share one controller.
+    """
+
+    def __init__(
+        self,
+        rate: Optional[float] = DEFAULT_RATE,
+        burst: int = DEFAULT_BURST,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+        open_seconds: float = DEFAULT_OPEN_SECONDS,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.limit = float(min(INITIAL_CONCURRENCY, max_concurrency))
+        self.in_flight = 0
+        self._tokens = float(burst)
+        self._refilled_at = time.monotonic()
+        self._latency: Optional[float] = None
+        self._baseline: Optional[float] = None
+        self._decreased_at = float("-inf")
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self._condition = threading.Condition()
+        self._async_waiters: list[tuple[asyncio.AbstractEventLoop, "asyncio.Future[None]"]] = []
+
+    @property
+    def circuit_open(self) -> bool:
+        return self._opened_at is not None
+
+    def try_acquire(self, now: Optional[float] = None) -> float:
+        """Takes a slot and a token and returns 0, or returns how long to wait before trying again.
+
+        Raises CircuitOpenError while the circuit is open.
+        """
+        now = time.monotonic() if now is None else now
+        with self._condition:
+            if self._opened_at is not None:
+                if now - self._opened_at < self.open_seconds or self._probing:
+                    raise CircuitOpenError("Too many consecutive request failures; not sending requests for now.")
+            if self.in_flight >= int(self.limit):
+                return SLOT_WAIT_SECONDS
+            if self.rate:
+                self._tokens = min(float(self.burst), self._tokens + (now - self._refilled_at) * self.rate)
+                self._refilled_at = now
+                if self._tokens < 1:
+                    return (1 - self._tokens) / self.rate
+                self._tokens -= 1
+            if self._opened_at is not None:
+                # Half open: this request probes whether the host is back
+                self._probing = True
+            self.in_flight += 1
+            return 0.0
+
+    def acquire(self) -> None:
+        """Blocks until a request may be sent."""
+        with self._condition:
+            while (delay := self.try_acquire()) > 0:
+                self._condition.wait(delay)
+
+    async def acquire_async(self) -> None:
+        """Like acquire, without blocking the event loop."""
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._condition:
+                delay = self.try_acquire()
+                if delay == 0:
+                    return
+                waiter: "asyncio.Future[None]" = loop.create_future()
+                self._async_waiters.append((loop, waiter))
+            try:
+                await asyncio.wait({waiter}, timeout=delay)
+            finally:
+                with self._condition:
+                    if (loop, waiter) in self._async_waiters:
+                        self._async_waiters.remove((loop, waiter))
+
+    def release(self, latency: Optional[float], status: Optional[int]) -> None:
+        """Frees a request's slot, recording how long its response took to start and its status.
+
+        status is None for a connection error or timeout. With latency None
+        the request was abandoned, and nothing is recorded.
+        """
+        now = time.monotonic()
+        with self._condition:
+            self.in_flight -= 1
+            if latency is not None:
+                self._record(now, latency, status)
+            elif self._probing:
+                self._probing = False
+            self._condition.notify_all()
+            for loop, waiter in self._async_waiters:
+                try:
+                    loop.call_soon_threadsafe(_wake, waiter)
+                except RuntimeError:
+                    # The waiter's loop has closed
+                    pass
+            self._async_waiters.clear()
+
+    def _record(self, now: float, latency: float, status: Optional[int]) -> None:
+        # Throttling slows requests down but isn't an outage, so it doesn't count towards the circuit breaker
+        failed = status is None or status >= 500
+        self._failures = self._failures + 1 if failed else 0
+        if self._opened_at is not None and self._probing:
+            self._probing = False
+            self._opened_at = now if failed else None
+        elif self._failures >= self.failure_threshold:
+            self._opened_at = now
+
+        congested = status is None or status in OVERLOAD_STATUSES
+        if not failed and not congested:
+            self._latency = latency if self._latency is None else (
+                self._latency + (latency - self._latency) * LATENCY_SMOOTHING)
+            if self._baseline is None or self._latency < self._baseline:
+                self._baseline = self._latency
+            else:
+                # Lets the baseline follow a lasting change in the network
+                self._baseline += (self._latency - self._baseline) * BASELINE_DRIFT
+            congested = self._latency > max(self._baseline, LATENCY_FLOOR) * LATENCY_TOLERANCE
+
+        if congested:
+            if now - self._decreased_at >= DECREASE_INTERVAL:
+                self.limit = max(1.0, self.limit * DECREASE_FACTOR)
+                self._decreased_at = now
+        elif not failed:
+            # Reached only by healthy responses
+            self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+
+
+def _wake(waiter: "asyncio.Future[None]") -> None:
+    if not waiter.done():
+        waiter.set_result(None)
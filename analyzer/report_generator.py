@@ -7,6 +7,12 @@ JSON_REPORT_FILE = "package_report.json"
 HISTORICAL_DATA_DIR = "historical_data"
 HISTORICAL_HTML_DIR = os.path.join(HISTORICAL_DATA_DIR, "html")
 HISTORICAL_JSON_DIR = os.path.join(HISTORICAL_DATA_DIR, "json")
+# How packages that weren't analyzed to the end are shown, by their AnalysisStatus
+ANALYSIS_STATUS_LABELS = {
+    "timeout": "Analysis timed out",
+    "memory-limit": "Analysis exceeded the memory limit",
+    "crashed": "Analysis crashed",
+}
 
 
 def archive_old_reports() -> None:
@@ -72,6 +78,9 @@ def generate_report(
     print(f"Has stubs package: {package_data['HasStubsPackage']}")
     print(f"Has typeshed stubs: {package_data['HasTypeShed']}")
     print(f"Has py.typed: {package_data['HasPyTypedFile']}")
+    artifact = package_data.get("AnalyzedArtifact")
+    if artifact:
+        print(f"Analyzed artifact: {artifact['filename']} ({artifact['packagetype']})")
     print(f"Non typeshed stubs package: {package_data['non_typeshed_stubs']}")
     print(f"Parameter Type Coverage: {
           coverage_data['parameter_coverage']:.2f}%")
@@ -239,6 +248,18 @@ def generate_report_html(package_report: dict[str, Any]) -> None:
             </tr>
     """
     for package_name, details in package_report.items():
+        if details.get("AnalysisStatus"):
+            # Gave up on the package for running out of time or memory
+            html_content += f"""
+            <tr>
+                <td>{details['DownloadRanking']}</td>
+                <td>{package_name}</td>
+                <td>{details['DownloadCount']}</td>
+                <td colspan="12" class="skipped-cell">{
+                    ANALYSIS_STATUS_LABELS.get(details['AnalysisStatus'], details['AnalysisStatus'])}</td>
+            </tr>
+        """
+            continue
         coverage_data = details["CoverageData"]
         typeshed_data = details.get("TypeshedData", {})
         parameter_coverage = round(coverage_data["parameter_coverage"], 2)
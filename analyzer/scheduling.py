@@ -0,0 +1,62 @@
+import heapq
+import statistics
+from typing import Any, Optional
+
+
+def parse_shard(spec: str) -> tuple[int, int]:
+    """Parses a shard given as 'i/N', the i-th of N shards counting from 1, raising ValueError if it isn't one."""
+    index, _, count = spec.partition("/")
+    try:
+        shard = int(index), int(count)
+    except ValueError:
+        raise ValueError(f"Shard '{spec}' is not of the form i/N.") from None
+    if not 1 <= shard[0] <= shard[1]:
+        raise ValueError(f"Shard '{spec}' is not between 1/N and N/N.")
+    return shard
+
+
+def estimated_costs(
+    names: list[str], previous_report: dict[str, Any], archive_sizes: Optional[dict[str, int]] = None
+) -> dict[str, int]:
+    """Estimates how long each package takes to analyze by the size of its archive.
+
+    Sizes are taken from archive_sizes, the archives that will be analyzed,
+    else from the archives analyzed in the previous report. Packages
+    without either are assumed to be of the median size. Without
+    archive_sizes, the estimate is the same on every machine with the same
+    previous report.
+    """
+    sizes: dict[str, int] = {}
+    for name in names:
+        artifact = previous_report.get(name, {}).get("AnalyzedArtifact")
+        if archive_sizes and archive_sizes.get(name):
+            sizes[name] = archive_sizes[name]
+        elif artifact and artifact.get("size"):
+            sizes[name] = artifact["size"]
+    default = int(statistics.median(sizes.values())) if sizes else 1
+    return {name: sizes.get(name, default) for name in names}
+
+
+def longest_first(names: list[str], costs: dict[str, int]) -> list[str]:
+    """Orders packages most expensive first, so a big one isn't started last and left running alone.
+
+    Packages of equal cost keep their order in names.
+    """
+    return sorted(names, key=lambda name: -costs[name])
+
+
+def partition(names: list[str], costs: dict[str, int], count: int) -> list[list[str]]:
+    """Splits packages into count shards of about equal total cost, the same way every time.
+
+    Packages are dealt out most expensive first, each to the shard with the
+    least work so far; packages of equal cost keep their order in names.
+    Each shard lists its packages in the order of names.
+    """
+    positions = {name: position for position, name in enumerate(names)}
+    shards: list[list[str]] = [[] for _ in range(count)]
+    loads = [(0, index) for index in range(count)]
+    for name in sorted(names, key=lambda name: -costs[name]):
+        load, index = heapq.heappop(loads)
+        shards[index].append(name)
+        heapq.heappush(loads, (load + costs[name], index))
+    return [sorted(shard, key=positions.__getitem__) for shard in shards]
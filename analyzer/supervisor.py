@@ -0,0 +1,202 @@
+import multiprocessing
+import multiprocessing.context
+import os
+import threading
+import time
+from multiprocessing.connection import Connection
+from typing import Any, Callable, NamedTuple, Optional
+
+# Statuses of a package analyzed in a worker process
+OK = "ok"
+TIMED_OUT = "timeout"
+OVER_MEMORY_LIMIT = "memory-limit"
+CRASHED = "crashed"
+
+DEFAULT_TIMEOUT_SECONDS = 900.0
+DEFAULT_MAX_RSS_BYTES = 4 * 1024 * 1024 * 1024
+# Workers are replaced after this many packages, so fragmentation and leaks don't build up
+DEFAULT_TASKS_PER_WORKER = 100
+# How often a running package's time and memory are checked
+POLL_SECONDS = 0.1
+# How long a worker being recycled gets to exit before it's killed
+EXIT_SECONDS = 5.0
+
+# None analyzes packages in the calling process
+isolation: Optional["IsolationLimits"] = None
+
+_local = threading.local()
+_supervisors: list["Supervisor"] = []
+_supervisors_lock = threading.Lock()
+
+
+class IsolationLimits(NamedTuple):
+    timeout: Optional[float]
+    max_rss_bytes: Optional[int]
+    tasks_per_worker: Optional[int]
+    # Run in each new worker process before its first package, to configure it like this one
+    initializer: Optional[Callable[..., None]]
+    initargs: tuple[Any, ...]
+
+
+class Outcome(NamedTuple):
+    status: str
+    # The function's return value, if status is OK
+    result: Any
+    # Why the function didn't finish, otherwise
+    detail: Optional[str]
+
+
+def configure_isolation(
+    timeout: Optional[float] = DEFAULT_TIMEOUT_SECONDS,
+    max_rss_bytes: Optional[int] = DEFAULT_MAX_RSS_BYTES,
+    tasks_per_worker: Optional[int] = DEFAULT_TASKS_PER_WORKER,
+    initializer: Optional[Callable[..., None]] = None,
+    initargs: tuple[Any, ...] = (),
+) -> None:
+    """Analyzes each package in a supervised worker process, within a wall-clock timeout and an RSS limit."""
+    global isolation
+    isolation = IsolationLimits(timeout, max_rss_bytes, tasks_per_worker, initializer, initargs)
+
+
+def _serve(connection: Connection, initializer: Optional[Callable[..., None]], initargs: tuple[Any, ...]) -> None:
+    if initializer is not None:
+        initializer(*initargs)
+    while True:
+        task = connection.recv()
+        if task is None:
+            return
+        func, args, kwargs = task
+        try:
+            connection.send((True, func(*args, **kwargs)))
+        except Exception as e:
+            try:
+                connection.send((False, e))
+            except Exception:
+                # The exception couldn't be pickled
+                connection.send((False, RuntimeError(repr(e))))
+
+
+def process_rss(pid: int) -> Optional[int]:
+    """Returns the resident memory of a process in bytes, or None without /proc."""
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return resident_pages * os.sysconf("SC_PAGE_SIZE")
+
+
+class Supervisor:
+    """Runs functions one at a time in a worker process, killing it if one runs too long or uses too much memory.
+
+    The worker is started on first use, replaced after tasks_per_worker
+    functions, and replaced after being killed. An exception raised by the
+    function is raised again here. RSS is only checked where /proc is
+    available.
+    """
+
+    def __init__(self, limits: IsolationLimits):
+        self.limits = limits
+        self._process: Optional[multiprocessing.context.SpawnProcess] = None
+        self._connection: Optional[Connection] = None
+        self._tasks = 0
+
+    def _start(self) -> Connection:
+        if self._process is None or self._connection is None:
+            # Spawned rather than forked, like the parse processes, since callers may be running in threads
+            context = multiprocessing.get_context("spawn")
+            self._connection, child_connection = context.Pipe()
+            # Daemonic, so it's stopped if this process exits without closing it;
+            # daemonic processes can't start processes of their own
+            process = context.Process(
+                target=_serve, args=(child_connection, self.limits.initializer, self.limits.initargs),
+                daemon=True)
+            process.start()
+            child_connection.close()
+            self._process = process
+            self._tasks = 0
+        return self._connection
+
+    def _kill(self) -> None:
+        if self._process is not None:
+            self._process.kill()
+            self._process.join()
+        self._discard()
+
+    def _discard(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+        self._process = None
+        self._connection = None
+
+    def run(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Outcome:
+        connection = self._start()
+        assert self._process is not None and self._process.pid is not None
+        connection.send((func, args, kwargs))
+        started = time.monotonic()
+        while not connection.poll(POLL_SECONDS):
+            if not self._process.is_alive():
+                exitcode = self._process.exitcode
+                self._kill()
+                return Outcome(CRASHED, None, f"Worker process exited with code {exitcode}.")
+            elapsed = time.monotonic() - started
+            if self.limits.timeout is not None and elapsed > self.limits.timeout:
+                self._kill()
+                return Outcome(TIMED_OUT, None, f"Analysis took longer than {self.limits.timeout:g} seconds.")
+            rss = process_rss(self._process.pid) if self.limits.max_rss_bytes is not None else None
+            if rss is not None and self.limits.max_rss_bytes is not None and rss > self.limits.max_rss_bytes:
+                self._kill()
+                return Outcome(
+                    OVER_MEMORY_LIMIT, None,
+                    f"Analysis used {rss // (1024 * 1024)} MB, over the limit of "
+                    f"{self.limits.max_rss_bytes // (1024 * 1024)} MB.")
+        try:
+            succeeded, result = connection.recv()
+        except EOFError:
+            self._kill()
+            return Outcome(CRASHED, None, "Worker process exited without a result.")
+
+        self._tasks += 1
+        if self.limits.tasks_per_worker is not None and self._tasks >= self.limits.tasks_per_worker:
+            self.close()
+        if not succeeded:
+            raise result
+        return Outcome(OK, result, None)
+
+    def close(self) -> None:
+        """Stops the worker, if there is one."""
+        if self._process is None or self._connection is None:
+            return
+        try:
+            self._connection.send(None)
+        except OSError:
+            pass
+        self._process.join(EXIT_SECONDS)
+        if self._process.is_alive():
+            self._kill()
+        else:
+            self._discard()
+
+
+def get_supervisor() -> Optional[Supervisor]:
+    """Returns the calling thread's supervisor, or None if packages aren't analyzed in worker processes."""
+    if isolation is None:
+        return None
+    supervisor: Optional[Supervisor] = getattr(_local, "supervisor", None)
+    if supervisor is None or supervisor.limits != isolation:
+        supervisor = Supervisor(isolation)
+        _local.supervisor = supervisor
+    with _supervisors_lock:
+        # Registered again after close_supervisors, since its worker is restarted on use
+        if supervisor not in _supervisors:
+            _supervisors.append(supervisor)
+    return supervisor
+
+
+def close_supervisors() -> None:
+    """Stops every thread's worker process."""
+    with _supervisors_lock:
+        supervisors = list(_supervisors)
+        _supervisors.clear()
+    for supervisor in supervisors:
+        supervisor.close()
@@ -0,0 +1,171 @@
+import io
+import tokenize
+from typing import NamedTuple, Optional
+
+# Clauses that continue the compound statement above them instead of starting a new one
+CONTINUATION_CLAUSES = frozenset(("elif", "else", "except", "finally"))
+OPENING_BRACKETS = frozenset(("(", "[", "{"))
+CLOSING_BRACKETS = frozenset((")", "]", "}"))
+
+
+class _Block(NamedTuple):
+    # "class", "def" or "other"
+    kind: str
+    name: str
+    # AST depth of the statements in this block's body
+    body_depth: int
+
+
+def _scan_parameters(tokens: list[tokenize.TokenInfo], start: int) -> tuple[int, int, bool]:
+    """Counts the parameters in a function header given the index of the function's name token.
+
+    Mirrors the AST engine: only positional-or-keyword parameters count
+    (not positional-only, *args, keyword-only or **kwargs), and self and
+    cls are excluded.
+    """
+    i = start + 1
+    # Skip PEP 695 type parameters up to the opening parenthesis
+    depth = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if token.type == tokenize.OP:
+            if token.string == "(" and depth == 0:
+                break
+            if token.string in OPENING_BRACKETS:
+                depth += 1
+            elif token.string in CLOSING_BRACKETS:
+                depth -= 1
+        i += 1
+    i += 1
+
+    # (name, annotated) for each positional-or-keyword parameter seen so far
+    params: list[tuple[str, bool]] = []
+    keyword_only = False
+    at_segment_start = True
+    current: Optional[str] = None
+    open_lambdas = 0
+    depth = 1
+    while i < len(tokens) and depth > 0:
+        token = tokens[i]
+        i += 1
+        string = token.string
+        if token.type == tokenize.OP:
+            if string in OPENING_BRACKETS:
+                depth += 1
+            elif string in CLOSING_BRACKETS:
+                depth -= 1
+        elif token.type != tokenize.NAME:
+            # Strings and numbers, including the text parts of f-strings
+            at_segment_start = False
+            continue
+        if depth != 1:
+            continue
+
+        if at_segment_start:
+            at_segment_start = False
+            if string == "/":
+                # Everything before / is positional-only
+                params.clear()
+            elif string in ("*", "**"):
+                keyword_only = True
+            elif token.type == tokenize.NAME and not keyword_only:
+                current = string
+                params.append((string, False))
+            continue
+
+        if string == "lambda":
+            open_lambdas += 1
+        elif string == ":":
+            if open_lambdas:
+                open_lambdas -= 1
+            elif current is not None and params and params[-1] == (current, False):
+                params[-1] = (current, True)
+        elif string == "," and not open_lambdas:
+            at_segment_start = True
+            current = None
+
+    has_return = i < len(tokens) and tokens[i].string == "->"
+    counted = [annotated for name, annotated in params if name not in ("self", "cls")]
+    return len(counted), sum(counted), has_return
+
+
+def scan_source(source: bytes, filename: str) -> Optional[dict[str, tuple[int, int, bool]]]:
+    """Finds function headers with the tokenizer alone, without building an AST.
+
+    Returns the same records as the AST engine for valid code, or None if
+    the file can't be tokenized. Like the AST engine, a function nested in
+    an if, try or other block inside a class is not qualified with the
+    class name, and when names repeat the shallowest, then first, wins.
+    Tokens are streamed and only function headers are buffered, so memory
+    stays flat however large the file is.
+    """
+    blocks: list[_Block] = [_Block("module", "", 1)]
+    # (depth, position) of the function currently recorded under each name
+    positions: dict[str, tuple[int, int]] = {}
+    records: dict[str, tuple[int, int, bool]] = {}
+
+    # State of the current logical line, and the depth of the last compound
+    # statement in each enclosing block, which elif/else/except clauses extend
+    line_start = True
+    line_first = ""
+    line_block = _Block("other", "", 0)
+    owner_depth = 1
+    owner_depths: list[int] = []
+    # Tokens of the current line, kept only while it's a def or class header
+    header: list[tokenize.TokenInfo] = []
+
+    readline = io.StringIO(source.decode("utf-8", errors="ignore")).readline
+    try:
+        for position, token in enumerate(tokenize.generate_tokens(readline)):
+            token_type = token.type
+            if token_type in (tokenize.COMMENT, tokenize.NL, tokenize.ENDMARKER):
+                continue
+            if token_type == tokenize.NEWLINE:
+                if line_first == "def":
+                    name = header[1].string
+                    func_name = f"{blocks[-1].name}.{name}" if blocks[-1].kind == "class" else name
+                    func_position = (owner_depth, position)
+                    if func_name not in positions or func_position < positions[func_name]:
+                        positions[func_name] = func_position
+                        records[func_name] = _scan_parameters(header, 1)
+                elif line_first == "class":
+                    line_block = _Block("class", header[1].string, owner_depth + 1)
+                line_start = True
+                line_first = ""
+                header = []
+                continue
+            if token_type == tokenize.INDENT:
+                blocks.append(line_block)
+                owner_depths.append(owner_depth)
+                continue
+            if token_type == tokenize.DEDENT:
+                blocks.pop()
+                owner_depth = owner_depths.pop()
+                continue
+            if line_first in ("def", "class"):
+                header.append(token)
+                continue
+            if not line_start:
+                continue
+            line_start = False
+
+            string = token.string
+            if string in CONTINUATION_CLAUSES:
+                if string == "elif":
+                    # Each elif is an If nested in the orelse of the previous one
+                    owner_depth += 1
+                # An except body sits below its ExceptHandler node
+                body_depth = owner_depth + (2 if string == "except" else 1)
+                line_block = _Block("other", "", body_depth)
+                continue
+
+            owner_depth = blocks[-1].body_depth
+            if string in ("def", "class"):
+                line_first = string
+                header = [token]
+            # Async functions aren't counted, like the AST engine, but their bodies are scanned
+            line_block = _Block("def" if string in ("def", "async") else "other", "", owner_depth + 1)
+    except (tokenize.TokenError, SyntaxError):
+        return None
+
+    return records
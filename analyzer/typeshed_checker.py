@@ -1,4 +1,6 @@
+import hashlib
 import os
+from typing import Optional
 
 # Get the absolute path to the project root directory
 PROJECT_ROOT = os.path.dirname(os.path.dirname(__file__))
@@ -27,6 +29,22 @@ def find_stub_files(package_name: str) -> list[str]:
     return stub_files
 
 
+def stub_files_digest(package_name: str) -> Optional[str]:
+    """Returns a sha256 digest of the package's typeshed stubs, or None if typeshed has none.
+
+    It changes only when the package's own stubs do, unlike the typeshed commit.
+    """
+    typeshed_path = os.path.join(TYPESHED_DIR, "stubs", package_name)
+    if not os.path.exists(typeshed_path):
+        return None
+    digest = hashlib.sha256()
+    for stub_file in sorted(find_stub_files(package_name)):
+        digest.update(os.path.relpath(stub_file, typeshed_path).encode() + b"\0")
+        with open(stub_file, "rb") as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+
 def merge_files_with_stubs(package_files: list[str], typeshed_stubs: list[str]) -> list[str]:
     """Merge package files with typeshed stubs, preferring .pyi files from the package itself."""
     merged_files: list[str] = []  # Explicitly type the list as list[str]
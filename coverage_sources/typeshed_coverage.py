@@ -1,7 +1,7 @@
 import csv
 from typing import Any
 
-import requests
+from analyzer import http_client
 
 CSV_URL = "https://alexwaygood.github.io/typeshed-stats/stats_as_csv.csv"
 
@@ -14,7 +14,7 @@ def generate_coverage_percent(annotated: str, unannotated: str) -> float | str:
 
 def download_typeshed_csv() -> dict[str, dict[str, Any]]:
     """Download and parse the typeshed CSV file into a dictionary."""
-    response = requests.get(CSV_URL)
+    response = http_client.cached_get(CSV_URL)
     response.raise_for_status()  # Ensure the download was successful
 
     typeshed_data: dict[str, dict[str, Any]] = {}
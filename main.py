@@ -1,14 +1,63 @@
 import argparse
-import concurrent.futures
 import json
+import os
+import posixpath
 import shutil
+import socket
 import sys
 import tempfile
+import time
 from typing import Any, Optional
 
-from analyzer.coverage_calculator import calculate_overall_coverage
-from analyzer.package_analyzer import extract_files, find_stub_package
+from analyzer.async_fetch import (
+    FetchedPackage,
+    configure_fetch_concurrency,
+    iter_fetched_packages,
+    prefetch_metadata,
+    read_fetched_sources,
+)
+from analyzer.coverage_calculator import (
+    FileRecord,
+    calculate_overall_coverage,
+    collect_source_records,
+    compare_fast_scan,
+    configure_fast_scan,
+    configure_parse_budget,
+    configure_parse_cache,
+    configure_parse_workers,
+    merge_function_records,
+)
+from analyzer.function_index import FunctionIndex, IndexedFunction, configure_function_index, get_function_index
+from analyzer.http_client import configure_http, configure_http_cache, configure_rate_control
+from analyzer.incremental import analysis_provenance, carry_forward, is_unchanged, load_previous_report
+from analyzer.job_queue import DEFAULT_LEASE_SECONDS, JobQueue
+from analyzer.journal import ReportJournal
+from analyzer.package_analyzer import (
+    Artifact,
+    DistributionMetadata,
+    configure_artifact_cache,
+    configure_max_archive_size,
+    configure_metadata_manifest,
+    configure_package_source,
+    configure_prefer_wheels,
+    extract_files,
+    extract_sources,
+    find_stub_package,
+    manifest_archive_sizes,
+    manifest_entries,
+)
+from analyzer.pipeline import configure_download_workers, run_pipeline
 from analyzer.report_generator import generate_report, generate_report_html, update_main_html_with_links, archive_old_reports
+from analyzer.scheduling import estimated_costs, longest_first, parse_shard, partition
+from analyzer.supervisor import (
+    DEFAULT_MAX_RSS_BYTES,
+    DEFAULT_TASKS_PER_WORKER,
+    DEFAULT_TIMEOUT_SECONDS,
+    OK,
+    close_supervisors,
+    configure_isolation,
+    get_supervisor,
+)
 from analyzer.typeshed_checker import (
     check_typeshed,
     find_stub_files,
@@ -17,6 +66,10 @@ from analyzer.typeshed_checker import (
 from coverage_sources.typeshed_coverage import download_typeshed_csv
 
 JSON_REPORT_FILE = "package_report.json"
+# Reports of the packages analyzed so far in a top N run, for --resume
+JOURNAL_FILE = "package_report.journal"
+# How often an idle worker checks whether jobs held by other workers were finished or abandoned
+WORKER_POLL_SECONDS = 5.0
 TOP_PYPI_PACKAGES = "top-pypi-packages-30-days.min.json"
 STUB_PACKAGES = "stub_packages.json"
 
@@ -49,39 +102,87 @@ def analyze_package(
     typeshed_data: Optional[dict[str, Any]] = None,
     has_stub_package: bool = False,
     parallel: bool = False,
+    in_memory: bool = False,
+    fetched: Optional[FetchedPackage] = None,
 ) -> dict[str, Any]:
-    """Analyze a single package and generate a report."""
+    """Analyze a single package and generate a report.
+
+    With in_memory, archives are read without being extracted to disk.
+    Archives already downloaded by the fetch stage are passed in fetched,
+    and are always read in memory.
+    """
     package_report: dict[str, Any] = {
         "DownloadCount": download_count,
         "DownloadRanking": rank,
         "CoverageData": {},
     }
 
-    # Create a temporary directory
-    temp_dir = tempfile.mkdtemp()
-    stub_package_dir = tempfile.mkdtemp() if has_stub_package else None
+    # Shared across the non-test, with-tests and with-stubs variants so
+    # each file is parsed only once
+    file_records: dict[str, Optional[FileRecord]] = {}
+    temp_dirs: list[str] = []
+    # The archive each distribution was read from
+    artifacts: dict[str, Artifact] = {}
+
+    def fetch_files(name: str) -> tuple[list[str], bool]:
+        """Downloads a distribution, returning its Python files and whether it has a py.typed file."""
+        fetched_sources = read_fetched_sources(fetched, name, artifacts) if fetched else None
+        if fetched_sources is not None:
+            sources, has_py_typed = fetched_sources
+            collect_source_records(sources, file_records)
+            return list(sources), has_py_typed
+        if in_memory:
+            # Read straight from the archive; records are computed now since there's nothing on disk
+            sources, has_py_typed = extract_sources(name, artifacts)
+            collect_source_records(sources, file_records)
+            return list(sources), has_py_typed
+        temp_dir = tempfile.mkdtemp()
+        temp_dirs.append(temp_dir)
+        return extract_files(name, temp_dir, artifacts)
+
+    def relative_path(file: str) -> str:
+        """Returns a file's path inside its distribution archive."""
+        for temp_dir in temp_dirs:
+            if file.startswith(temp_dir + os.sep):
+                return os.path.relpath(file, temp_dir).replace(os.sep, "/")
+        # In-memory files are keyed by archive name, then member path
+        return file.partition("/")[2]
 
     try:
         print(f"Analyzing package: {package_name} rank {rank}")
 
         # Download and extract package files
-        files, has_py_typed_file = extract_files(package_name, temp_dir)
+        files, has_py_typed_file = fetch_files(package_name)
 
         # Separate test and non-test files
         non_test_files = separate_test_files(files)
 
+        artifact = artifacts.get(package_name)
+        package_report["AnalyzedArtifact"] = {
+            "filename": posixpath.basename(artifact.url),
+            "packagetype": artifact.packagetype,
+            "size": artifact.size,
+            "version": artifact.version,
+            "sha256": artifact.sha256,
+        } if artifact else None
+
         stub_has_py_typed_file = False
-        if stub_package_dir:
-            stub_package_files, stub_has_py_typed_file = extract_files(
-                package_name + "-stubs", stub_package_dir
-            )
+        if has_stub_package:
+            stub_package_files, stub_has_py_typed_file = fetch_files(
+                package_name + "-stubs")
             files = merge_files_with_stubs(files, stub_package_files)
             non_test_files = merge_files_with_stubs(
                 non_test_files, stub_package_files)
 
         package_report["HasPyTypedFile"] = has_py_typed_file or stub_has_py_typed_file
 
-        non_test_coverage = calculate_overall_coverage(non_test_files)
+        # The with-tests variant spans every package file, so computing it
+        # first hands the whole package to the parser in one batch
+        total_test_coverage = calculate_overall_coverage(files, file_records)
+        skipped_tests = total_test_coverage["skipped_files"]
+
+        non_test_coverage = calculate_overall_coverage(
+            non_test_files, file_records)
         parameter_coverage = non_test_coverage["parameter_coverage"]
         return_type_coverage = non_test_coverage["return_type_coverage"]
         skipped_files_non_tests = non_test_coverage["skipped_files"]
@@ -90,8 +191,13 @@ def analyze_package(
         package_report["CoverageData"]["return_type_coverage"] = return_type_coverage
         package_report["SurfaceArea"] = non_test_coverage["surface_area"]
 
-        total_test_coverage = calculate_overall_coverage(files)
-        skipped_tests = total_test_coverage["skipped_files"]
+        function_index = get_function_index()
+        if function_index is not None:
+            functions = merge_function_records(non_test_files, file_records)
+            function_index.add_package(package_name, rank, [
+                (relative_path(file), func_name.partition(".")[2], counts)
+                for func_name, (file, counts) in functions.items()
+            ])
 
         package_report["CoverageData"]["param_coverage_with_tests"] = (
             total_test_coverage["parameter_coverage"]
@@ -112,7 +218,7 @@ def analyze_package(
 
             # Calculate coverage with stubs
             total_test_coverage_stubs = calculate_overall_coverage(
-                merged_files)
+                merged_files, file_records)
             parameter_coverage_with_stubs = total_test_coverage_stubs[
                 "parameter_coverage"
             ]
@@ -120,37 +226,35 @@ def analyze_package(
                 "return_type_coverage"
             ]
             skipped_files_with_stubs = total_test_coverage["skipped_files"]
+            oversized_files_with_stubs = total_test_coverage_stubs["oversized_files"]
         else:
             # Check for PyPI stub package if no Typeshed stubs exist
-            stub_package_url = find_stub_package(package_name)
+            stub_package_url = (
+                fetched.stub_package_url if fetched else find_stub_package(package_name))
             if stub_package_url:
                 print(f"Found non-typeshed stub package: {stub_package_url}")
                 package_report["non_typeshed_stubs"] = stub_package_url
 
                 # Download and merge PyPI stub files
-                stub_temp_dir = tempfile.mkdtemp()
-                try:
-                    stub_files, _ = extract_files(
-                        f"{package_name}-stubs", stub_temp_dir)
-                    merged_files = merge_files_with_stubs(
-                        non_test_files, stub_files)
-
-                    # Calculate coverage with stubs
-                    total_test_coverage_stubs = calculate_overall_coverage(
-                        merged_files)
-                    parameter_coverage_with_stubs = total_test_coverage_stubs["parameter_coverage"]
-                    return_type_coverage_with_stubs = total_test_coverage_stubs[
-                        "return_type_coverage"]
-                    skipped_files_with_stubs = total_test_coverage["skipped_files"]
-                finally:
-                    print('temp file removed', stub_temp_dir)
-                    shutil.rmtree(stub_temp_dir)
+                stub_files, _ = fetch_files(f"{package_name}-stubs")
+                merged_files = merge_files_with_stubs(
+                    non_test_files, stub_files)
+
+                # Calculate coverage with stubs
+                total_test_coverage_stubs = calculate_overall_coverage(
+                    merged_files, file_records)
+                parameter_coverage_with_stubs = total_test_coverage_stubs["parameter_coverage"]
+                return_type_coverage_with_stubs = total_test_coverage_stubs[
+                    "return_type_coverage"]
+                skipped_files_with_stubs = total_test_coverage["skipped_files"]
+                oversized_files_with_stubs = total_test_coverage_stubs["oversized_files"]
             else:
                 print(f"No stubs found for {package_name} in Typeshed or PyPI.")
 
                 parameter_coverage_with_stubs = parameter_coverage
                 return_type_coverage_with_stubs = return_type_coverage
                 skipped_files_with_stubs = skipped_files_non_tests
+                oversized_files_with_stubs = non_test_coverage["oversized_files"]
 
         # Add typeshed data if available
         if typeshed_data and package_name in typeshed_data:
@@ -165,75 +269,289 @@ def analyze_package(
             "return_type_coverage_with_stubs"
         ] = return_type_coverage_with_stubs
 
+        # What the report was computed from, so an incremental run can tell whether it's still current
+        package_report["Provenance"] = analysis_provenance(package_name, artifacts)
+
         skipped_files_total = max(skipped_files_with_stubs, skipped_tests)
         package_report["CoverageData"]["skipped_files"] = skipped_files_total
+        # Files over the parse budget, analyzed by the token scanner rather than skipped
+        package_report["CoverageData"]["oversized_files"] = max(
+            oversized_files_with_stubs, total_test_coverage["oversized_files"])
 
         # Write CLI
         if not parallel:
             generate_report(package_report, package_name)
     finally:
-        # Clean up the temporary directory
-        shutil.rmtree(temp_dir)
-        if stub_package_dir:
-            shutil.rmtree(stub_package_dir)
+        # Clean up the temporary directories
+        for temp_dir in temp_dirs:
+            shutil.rmtree(temp_dir)
 
     return package_report
 
 
+def analyze_package_with_manifest(
+    package_name: str, manifest: dict[str, DistributionMetadata], **kwargs: Any
+) -> dict[str, Any]:
+    """Runs analyze_package in a worker process, answering metadata lookups from the given manifest entries."""
+    configure_metadata_manifest(manifest)
+    return analyze_package(package_name, **kwargs)
+
+
+def analyze_package_isolated(package_name: str, **kwargs: Any) -> dict[str, Any]:
+    """Runs analyze_package in this thread's supervised worker process, if packages are isolated.
+
+    The worker is sent the package's entries in the prefetched metadata
+    manifest, so it doesn't look them up again. A package that runs out of
+    time or memory, or kills its worker, gets a report with its
+    AnalysisStatus and AnalysisError in place of coverage.
+    """
+    supervisor = get_supervisor()
+    if supervisor is None:
+        return analyze_package(package_name, **kwargs)
+    outcome = supervisor.run(analyze_package_with_manifest, package_name, manifest_entries(package_name), **kwargs)
+    if outcome.status == OK:
+        report: dict[str, Any] = outcome.result
+        return report
+    print(f"Warning: gave up on {package_name}: {outcome.detail}")
+    typeshed_data: dict[str, dict[str, Any]] = kwargs.get("typeshed_data") or {}
+    return {
+        "DownloadCount": kwargs.get("download_count"),
+        "DownloadRanking": kwargs.get("rank"),
+        "AnalysisStatus": outcome.status,
+        "AnalysisError": outcome.detail,
+        "CoverageData": {},
+        "HasTypeShed": check_typeshed(package_name),
+        "HasStubsPackage": kwargs.get("has_stub_package", False),
+        "TypeshedData": typeshed_data.get(package_name, {}),
+    }
+
+
+def verify_fast_scan(path: str) -> int:
+    """Compares the fast scanner with the AST engine on every Python file under path."""
+    files = [
+        os.path.join(root, file)
+        for root, _, names in os.walk(path)
+        for file in names
+        if file.endswith((".py", ".pyi"))
+    ]
+    disagreements = compare_fast_scan(files)
+    for disagreement in disagreements:
+        print(disagreement)
+    print(f"Compared {len(files)} files: {len(disagreements)} disagreements.")
+    return len(disagreements)
+
+
+def query_function_index(
+    path: str,
+    least_annotated: Optional[int] = None,
+    unannotated: Optional[str] = None,
+    max_rank: Optional[int] = None,
+    include_private: bool = False,
+) -> list[IndexedFunction]:
+    """Prints the functions in a function index that match a query, one per line."""
+    index = FunctionIndex(path)
+    try:
+        if least_annotated:
+            functions = index.least_annotated(least_annotated, max_rank, public_only=not include_private)
+        else:
+            functions = index.unannotated(unannotated or "", max_rank)
+    finally:
+        index.close()
+    for function in functions:
+        returns = "annotated" if function.has_return else "unannotated"
+        print(f"{function.rank or '-':>5}  {function.package}  {function.path}  {function.qualname}  "
+              f"params {function.annotated_params}/{function.params} annotated, return {returns}")
+    print(f"{len(functions)} functions.")
+    return functions
+
+
 def get_packages_with_stubs() -> set[str]:
     with open(STUB_PACKAGES, "r") as f:
         data = json.load(f)
     return set(data)
 
 
-def analyze_package_concurrently(
-    package_data: dict[str, Any],
-    rank: int,
+def parallel_analyze_packages(
+    ranked_packages: dict[str, tuple[int, Optional[int]]],
     typeshed_data: dict[str, dict[str, Any]],
     packages_with_stubs: set[str],
-) -> tuple[str, dict[str, Any]] | None:
-    package_name = package_data["project"]
-    download_count = package_data["download_count"]
+    journal: Optional[ReportJournal] = None,
+) -> dict[str, Any]:
+    """Analyzes packages in a pipeline of download threads feeding the parse processes.
 
-    if package_name:  # Ensure package_name is not None
-        return package_name, analyze_package(
-            package_name,
+    ranked_packages maps each package to its rank and download count.
+    """
+
+    def analyze(fetched: FetchedPackage) -> dict[str, Any]:
+        rank, download_count = ranked_packages[fetched.name]
+        return analyze_package_isolated(
+            fetched.name,
             rank=rank,
             download_count=download_count,
             typeshed_data=typeshed_data,
-            has_stub_package=package_name in packages_with_stubs,
+            has_stub_package=fetched.name in packages_with_stubs,
             parallel=True,
+            fetched=fetched,
         )
-    return None
 
+    package_report: dict[str, Any] = {}
+    for name, report in run_pipeline(
+        [(name, name in packages_with_stubs) for name in ranked_packages], analyze
+    ):
+        package_report[name] = report
+        if journal:
+            journal.record(name, report)
+    sorted_pairs = sorted(
+        [pair for pair in package_report.items()], key=lambda x: x[1]["DownloadRanking"]
+    )
+    return {k: v for k, v in sorted_pairs}
 
-def parallel_analyze_packages(
-    top_packages: list[dict[str, Any]],
+
+def async_analyze_packages(
+    ranked_packages: dict[str, tuple[int, Optional[int]]],
     typeshed_data: dict[str, dict[str, Any]],
     packages_with_stubs: set[str],
+    journal: Optional[ReportJournal] = None,
 ) -> dict[str, Any]:
+    """Analyzes packages as the asyncio fetch stage finishes downloading them.
+
+    ranked_packages maps each package to its rank and download count.
+    """
     package_report: dict[str, Any] = {}
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        futures = {
-            executor.submit(
-                analyze_package_concurrently,
-                package_data,
-                rank,
-                typeshed_data,
-                packages_with_stubs,
-            ): package_data
-            for rank, package_data in enumerate(top_packages, start=1)
-        }
-        for future in concurrent.futures.as_completed(futures):
-            result = future.result()
-            if result:
-                package_name, analysis_result = result
-                package_report[package_name] = analysis_result
+    for fetched in iter_fetched_packages(
+        [(name, name in packages_with_stubs) for name in ranked_packages]
+    ):
+        rank, download_count = ranked_packages[fetched.name]
+        package_report[fetched.name] = analyze_package_isolated(
+            fetched.name,
+            rank=rank,
+            download_count=download_count,
+            typeshed_data=typeshed_data,
+            has_stub_package=fetched.name in packages_with_stubs,
+            fetched=fetched,
+        )
+        if journal:
+            journal.record(fetched.name, package_report[fetched.name])
     sorted_pairs = sorted(
         [pair for pair in package_report.items()], key=lambda x: x[1]["DownloadRanking"]
     )
-    package_report = {k: v for k, v in sorted_pairs}
-    return package_report
+    return {k: v for k, v in sorted_pairs}
+
+
+def enqueue_packages(job_queue: JobQueue, top_n: int) -> None:
+    """Fills the job queue with the top N packages, replacing whatever it held.
+
+    Jobs are leased biggest first, by the archive sizes in the current report.
+    """
+    typeshed_data = download_typeshed_csv()
+    packages_with_stubs = get_packages_with_stubs()
+    top_packages = load_and_sort_top_packages(TOP_PYPI_PACKAGES)[:top_n]
+    jobs = [
+        (package_data["project"], rank, package_data["download_count"],
+         package_data["project"] in packages_with_stubs, typeshed_data.get(package_data["project"]))
+        for rank, package_data in enumerate(top_packages, start=1)
+        if package_data["project"]
+    ]
+    names = [job[0] for job in jobs]
+    job_queue.enqueue(jobs, estimated_costs(names, load_previous_report(JSON_REPORT_FILE)))
+    print(f"Queued {len(jobs)} packages in {job_queue.path}.")
+
+
+def run_worker(job_queue: JobQueue, in_memory: bool = False) -> int:
+    """Analyzes packages leased from the job queue until it's empty, returning how many this worker analyzed.
+
+    While other workers still hold jobs, the worker waits rather than
+    exiting, to take over any whose lease expires.
+    """
+    worker = f"{socket.gethostname()}-{os.getpid()}"
+    analyzed = 0
+    while True:
+        job = job_queue.lease(worker)
+        if job is None:
+            if not job_queue.in_progress():
+                close_supervisors()
+                return analyzed
+            time.sleep(WORKER_POLL_SECONDS)
+            continue
+        try:
+            with job_queue.keep_alive(job, worker):
+                report = analyze_package_isolated(
+                    job.package,
+                    rank=job.rank,
+                    download_count=job.download_count,
+                    typeshed_data={job.package: job.typeshed_data} if job.typeshed_data else {},
+                    has_stub_package=job.has_stub_package,
+                    parallel=True,
+                    in_memory=in_memory,
+                )
+        except Exception as e:
+            print(f"Warning: analyzing {job.package} failed (attempt {job.attempts}): {e}")
+            job_queue.release(job, worker)
+            continue
+        except BaseException:
+            job_queue.release(job, worker)
+            raise
+        job_queue.complete(job, report)
+        analyzed += 1
+
+
+def assemble_reports(job_queue: JobQueue) -> dict[str, Any]:
+    """Returns the package report of a job queue's finished jobs, warning about any that aren't."""
+    counts = job_queue.counts()
+    if counts["remaining"] or counts["failed"]:
+        print(f"Warning: {counts['remaining']} packages are unfinished and "
+              f"{counts['failed']} failed; they're left out of the report.")
+    return job_queue.reports()
+
+
+def shard_path(path: str, shard: tuple[int, int]) -> str:
+    """Returns the file a shard writes in place of path, e.g. package_report.shard1-of-4.json."""
+    root, ext = os.path.splitext(path)
+    return f"{root}.shard{shard[0]}-of-{shard[1]}{ext}"
+
+
+def merge_shard_reports(shard_files: list[str]) -> dict[str, Any]:
+    """Combines the package reports written by shard runs into one, in rank order."""
+    package_report: dict[str, Any] = {}
+    for shard_file in shard_files:
+        with open(shard_file, "r") as f:
+            shard_report: dict[str, Any] = json.load(f)
+        for name in shard_report:
+            if name in package_report:
+                print(f"Warning: {name} is in more than one shard; using the report from {shard_file}.")
+        package_report.update(shard_report)
+    print(f"Merged {len(package_report)} packages from {len(shard_files)} shards.")
+    sorted_pairs = sorted(
+        [pair for pair in package_report.items()],
+        key=lambda x: (x[1]["DownloadRanking"] is None, x[1]["DownloadRanking"] or 0)
+    )
+    return {k: v for k, v in sorted_pairs}
+
+
+def write_reports(
+    package_report: dict[str, Any],
+    write_json: bool = False,
+    write_html: bool = False,
+    create_daily: bool = False,
+    json_report_file: Optional[str] = None,
+) -> None:
+    json_report_file = json_report_file or JSON_REPORT_FILE
+    # Archive old report in data section
+    if create_daily:
+        archive_old_reports()
+
+    # Conditionally write the JSON report
+    if write_json:
+        with open(json_report_file, "w") as json_file:
+            json.dump(package_report, json_file, indent=4)
+        print(f"{os.path.basename(json_report_file)} file generated.")
+
+    # Conditionally generate the HTML report
+    if write_html:
+        generate_report_html(package_report)
+        print("HTML report generated.")
+    if create_daily:
+        update_main_html_with_links()
 
 
 def main(
@@ -242,9 +560,22 @@ def main(
     write_json: bool = False,
     write_html: bool = False,
     parallel: bool = False,
-    create_daily: bool = False  # Add this parameter
+    create_daily: bool = False,  # Add this parameter
+    in_memory: bool = False,
+    async_fetch: bool = False,
+    prefetch: bool = False,
+    resume: bool = False,
+    incremental: bool = False,
+    shard: Optional[tuple[int, int]] = None,
 ) -> None:
+    """Analyzes a package or the top N packages and writes the reports.
+
+    With shard (i, N), only the i-th of N size-balanced shards of the top N
+    is analyzed, and its JSON report goes to a file of its own, for
+    --merge-shards to combine.
+    """
     package_report: dict[str, Any] = {}
+    json_report_file = shard_path(JSON_REPORT_FILE, shard) if shard else JSON_REPORT_FILE
 
     # Download the CSV file with typeshed stats
     typeshed_data = download_typeshed_csv()
@@ -257,41 +588,128 @@ def main(
             package_name,
             typeshed_data=typeshed_data,
             has_stub_package=package_name in packages_with_stubs,
+            in_memory=in_memory,
         )
     else:
         # Analyze top N packages
         sorted_packages = load_and_sort_top_packages(TOP_PYPI_PACKAGES)
         top_packages = sorted_packages[:top_n]
-        if parallel:
-            package_report = parallel_analyze_packages(
-                top_packages, typeshed_data, packages_with_stubs
-            )
+        # Package name -> (rank, download count), in rank order
+        ranked_packages: dict[str, tuple[int, Optional[int]]] = {
+            package_data["project"]: (rank, package_data["download_count"])
+            for rank, package_data in enumerate(top_packages, start=1)
+            if package_data["project"]
+        }
+        # Also read for its archive sizes, to schedule the biggest packages first
+        previous_report = load_previous_report(JSON_REPORT_FILE)
+        if shard:
+            names = list(ranked_packages)
+            selected = set(partition(names, estimated_costs(names, previous_report), shard[1])[shard[0] - 1])
+            ranked_packages = {
+                name: ranked for name, ranked in ranked_packages.items() if name in selected}
+            print(f"Shard {shard[0]}/{shard[1]}: {len(ranked_packages)} packages.")
+
+        # Each finished package is journaled, so a run that stops can be resumed
+        journal = ReportJournal(shard_path(JOURNAL_FILE, shard) if shard else JOURNAL_FILE, resume=resume)
+        if journal.reports:
+            print(f"Resuming: {len(journal.reports)} packages already analyzed.")
+        if prefetch or incremental:
+            # Resolve every package's metadata up front, concurrently; --incremental
+            # needs it for every package before analyzing any
+            configure_metadata_manifest(prefetch_metadata([
+                (name, name in packages_with_stubs)
+                for name in ranked_packages if name not in journal.reports
+            ]))
+        if incremental:
+            # Reports of packages with no new release or stubs are copied from the last run
+            unchanged = 0
+            for name, (rank, download_count) in ranked_packages.items():
+                if name in journal.reports:
+                    continue
+                if is_unchanged(name, previous_report.get(name), name in packages_with_stubs):
+                    journal.record(name, carry_forward(
+                        name, previous_report[name], rank, download_count, typeshed_data))
+                    unchanged += 1
+            print(f"Unchanged since the last report: {unchanged} packages.")
+
+        pending_packages = {
+            name: ranked for name, ranked in ranked_packages.items() if name not in journal.reports}
+        if async_fetch or parallel:
+            # Started biggest first, so no big package is left running alone at the end;
+            # the report is still put in rank order
+            names = list(pending_packages)
+            costs = estimated_costs(names, previous_report, manifest_archive_sizes())
+            pending_packages = {name: pending_packages[name] for name in longest_first(names, costs)}
+        if async_fetch:
+            async_analyze_packages(
+                pending_packages, typeshed_data, packages_with_stubs, journal)
+        elif parallel:
+            parallel_analyze_packages(
+                pending_packages, typeshed_data, packages_with_stubs, journal)
         else:
-            for rank, package_data in enumerate(top_packages, start=1):
-                name = package_data["project"]
-                download_count = package_data["download_count"]
-                package_report[name] = analyze_package(
+            for name, (rank, download_count) in pending_packages.items():
+                journal.record(name, analyze_package_isolated(
                     name,
                     rank=rank, download_count=download_count,
                     typeshed_data=typeshed_data,
-                    has_stub_package=package_name in packages_with_stubs,
-                )
-    # Archive old report in data section
-    if create_daily:
-        archive_old_reports()
-
-    # Conditionally write the JSON report
-    if write_json:
-        with open(JSON_REPORT_FILE, "w") as json_file:
-            json.dump(package_report, json_file, indent=4)
-        print("package_report.json file generated.")
-
-    # Conditionally generate the HTML report
-    if write_html:
-        generate_report_html(package_report)
-        print("HTML report generated.")
-    if create_daily:
-        update_main_html_with_links()
+                    has_stub_package=name in packages_with_stubs,
+                    in_memory=in_memory,
+                ))
+        journal.close()
+        close_supervisors()
+        package_report = {
+            name: journal.reports[name] for name in ranked_packages if name in journal.reports}
+
+    write_reports(package_report, write_json, write_html, create_daily, json_report_file)
+
+
+def configure(args: argparse.Namespace) -> None:
+    """Configures the analysis from the command line arguments."""
+    if args.fast_scan:
+        configure_fast_scan()
+    configure_parse_budget(
+        int(args.max_parse_mb * 1024 * 1024), args.max_parse_nodes)
+
+    configure_http(args.http_pool_size, args.http_timeout, args.http_retries)
+    configure_rate_control(args.rate_limit, args.max_concurrency, enabled=not args.no_rate_control)
+    if args.http_cache:
+        configure_http_cache(args.http_cache, args.http_cache_ttl, args.offline)
+    elif args.offline:
+        print("Error: --offline needs an --http-cache directory.")
+        sys.exit(1)
+    configure_max_archive_size(args.max_archive_mb * 1024 * 1024)
+    configure_prefer_wheels(args.prefer_wheels)
+    if args.package_source:
+        try:
+            configure_package_source(args.package_source)
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+    if args.artifact_cache:
+        configure_artifact_cache(
+            args.artifact_cache,
+            args.artifact_cache_size * 1024 * 1024 if args.artifact_cache_size else None,
+            args.negative_cache_days * 24 * 3600 if args.negative_cache_days is not None else None)
+    if args.fetch_concurrency:
+        configure_fetch_concurrency(args.fetch_concurrency)
+    if args.download_workers:
+        configure_download_workers(args.download_workers)
+    # The parallel pipeline hands every package's files to the parse processes,
+    # since its analyzing threads would otherwise parse under one GIL
+    configure_parse_workers(args.parse_workers, 0 if args.parallel else None)
+    if args.function_index:
+        configure_function_index(args.function_index)
+    if args.parse_cache:
+        configure_parse_cache(
+            args.parse_cache,
+            args.parse_cache_size * 1024 * 1024 if args.parse_cache_size else None)
+
+
+def init_isolated_worker(args: argparse.Namespace) -> None:
+    """Configures a worker process the way the main process was configured."""
+    configure(args)
+    # Workers parse in-process; running several of them is what makes the analysis parallel
+    configure_parse_workers(1)
 
 
 if __name__ == "__main__":
@@ -310,23 +728,181 @@ if __name__ == "__main__":
     parser.add_argument(
         "--parallel", action="store_true", help="Analyze packages in parallel."
     )
+    parser.add_argument('--download-workers', type=int,
+                        help="Threads downloading packages with --parallel (default: 16).")
+    parser.add_argument('--parse-workers', type=int,
+                        help="Processes parsing source files (default: one per CPU).")
+    parser.add_argument('--http-pool-size', type=int,
+                        help="Connections kept open per host for PyPI requests.")
+    parser.add_argument('--http-timeout', type=float, metavar='SECONDS',
+                        help="Read timeout for each PyPI request.")
+    parser.add_argument('--http-retries', type=int,
+                        help="Times to retry a PyPI request on connection errors, 429 and 5xx responses.")
+    parser.add_argument('--http-cache', type=str, metavar='DIR',
+                        help="Cache PyPI metadata and the typeshed stats in this directory, revalidating with ETags.")
+    parser.add_argument('--http-cache-ttl', type=float, metavar='SECONDS',
+                        help="Serve cached responses younger than this without revalidating them.")
+    parser.add_argument('--offline', action='store_true',
+                        help="Serve cached responses however old they are and fetch no metadata.")
+    parser.add_argument('--artifact-cache', type=str, metavar='DIR',
+                        help="Keep downloaded sdists in this directory by sha256 digest, and remember packages without one.")
+    parser.add_argument('--artifact-cache-size', type=int, metavar='MB',
+                        help="Maximum size of the artifact cache in MB before old archives are evicted.")
+    parser.add_argument('--negative-cache-days', type=float,
+                        help="Days to remember that a package has no sdist or no -stubs project.")
+    parser.add_argument('--rate-limit', type=float, metavar='PER_SECOND',
+                        help="Most requests sent per second (default 200, 0 for no limit).")
+    parser.add_argument('--max-concurrency', type=int,
+                        help="Most requests in flight at once; the limit adapts below this to latency and throttling.")
+    parser.add_argument('--no-rate-control', action='store_true',
+                        help="Send requests as fast as threads and tasks issue them, without pacing or a circuit breaker.")
+    parser.add_argument('--resume', action='store_true',
+                        help="Skip the packages an interrupted top N run already analyzed, reusing their reports.")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Reuse the last package_report.json's reports of packages whose archives, "
+                             "typeshed stubs, analyzer version and parse settings haven't changed. "
+                             "Implies --prefetch-metadata.")
+    parser.add_argument('--async-fetch', action='store_true',
+                        help="Download packages concurrently with asyncio while analyzing finished ones.")
+    parser.add_argument('--fetch-concurrency', type=int,
+                        help="Packages the async fetch stage downloads at once.")
+    parser.add_argument('--prefetch-metadata', action='store_true',
+                        help="Resolve the PyPI metadata of every package concurrently before analyzing any.")
+    parser.add_argument('--max-archive-mb', type=int, default=512,
+                        help="Skip packages whose sdist is larger than this.")
+    parser.add_argument('--package-source', type=str, metavar='URL_OR_DIR',
+                        help="Fetch packages from a PEP 503/691 simple index at this URL, or from a directory of archives, instead of PyPI.")
+    parser.add_argument('--prefer-wheels', action='store_true',
+                        help="Analyze a pure-Python (or else the smallest) wheel when there is one, falling back to the sdist.")
+    parser.add_argument('--in-memory', action='store_true',
+                        help="Read package archives in memory instead of extracting them to disk.")
+    parser.add_argument('--parse-cache', type=str, metavar='DIR',
+                        help="Reuse per-file coverage records across runs from this cache directory.")
+    parser.add_argument('--parse-cache-size', type=int, metavar='MB',
+                        help="Maximum size of the parse cache in MB before old entries are evicted.")
+    parser.add_argument('--max-parse-mb', type=float, default=2,
+                        help="Files larger than this are scanned with the tokenizer instead of parsed.")
+    parser.add_argument('--max-parse-nodes', type=int, default=1_000_000,
+                        help="Files estimated to parse into more AST nodes than this are scanned instead.")
+    parser.add_argument('--function-index', type=str, metavar='DB',
+                        help="Record every analyzed function in this SQLite index for cross-package queries.")
+    parser.add_argument('--least-annotated', type=int, metavar='N',
+                        help="List the N functions in the --function-index with the lowest annotation coverage.")
+    parser.add_argument('--unannotated', type=str, metavar='NAME',
+                        help="List the functions and methods called NAME in the --function-index with no annotations.")
+    parser.add_argument('--max-rank', type=int,
+                        help="Only query packages ranked this high or higher.")
+    parser.add_argument('--include-private', action='store_true',
+                        help="Include underscore-private functions in --least-annotated.")
+    parser.add_argument('--fast-scan', action='store_true',
+                        help="Find functions with the tokenizer instead of building an AST.")
+    parser.add_argument('--shard', type=str, metavar='I/N',
+                        help="Analyze only the I-th of N size-balanced shards of the top N packages, "
+                             "writing package_report.shardI-of-N.json.")
+    parser.add_argument('--merge-shards', type=str, nargs='+', metavar='FILE',
+                        help="Combine shard reports into package_report.json and index.html.")
+    parser.add_argument('--job-queue', type=str, metavar='DB',
+                        help="Queue the top N packages in the SQLite job queue DB for --worker processes "
+                             "on the same host.")
+    parser.add_argument('--worker', action='store_true',
+                        help="Analyze packages from the --job-queue until none are left.")
+    parser.add_argument('--assemble', action='store_true',
+                        help="Write package_report.json and index.html from the finished jobs in the --job-queue.")
+    parser.add_argument('--lease-seconds', type=float,
+                        help="How long a worker may go without renewing its lease before its job is "
+                             "handed to another worker (default: 300).")
+    parser.add_argument('--isolate', action='store_true',
+                        help="Analyze each package in a supervised worker process with time and memory limits.")
+    parser.add_argument('--package-timeout', type=float, default=DEFAULT_TIMEOUT_SECONDS, metavar='SECONDS',
+                        help="With --isolate, give up on a package after this long (default: 900).")
+    parser.add_argument('--max-worker-rss-mb', type=int, default=DEFAULT_MAX_RSS_BYTES // (1024 * 1024), metavar='MB',
+                        help="With --isolate, give up on a package once its worker uses this much memory (default: 4096).")
+    parser.add_argument('--packages-per-worker', type=int, default=DEFAULT_TASKS_PER_WORKER,
+                        help="With --isolate, replace each worker process after this many packages (default: 100).")
+    parser.add_argument('--verify-fast-scan', type=str, metavar='PATH',
+                        help="Compare the fast scan with the AST engine on the Python files under PATH.")
     args = parser.parse_args()
 
+    if args.verify_fast_scan:
+        sys.exit(1 if verify_fast_scan(args.verify_fast_scan) else 0)
+    if args.least_annotated or args.unannotated:
+        if not args.function_index:
+            print("Error: --least-annotated and --unannotated query the index given with --function-index.")
+            sys.exit(1)
+        query_function_index(args.function_index, args.least_annotated, args.unannotated,
+                             args.max_rank, args.include_private)
+        sys.exit(0)
+    if args.merge_shards:
+        write_reports(merge_shard_reports(args.merge_shards),
+                      write_json=True, write_html=True, create_daily=args.create_daily)
+        sys.exit(0)
+    shard = None
+    if args.shard:
+        try:
+            shard = parse_shard(args.shard)
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        if args.create_daily or args.package_name or not args.top_n:
+            print("Error: --shard needs a top N and can't be combined with --create-daily; "
+                  "run --merge-shards --create-daily on the shard reports instead.")
+            sys.exit(1)
+    configure(args)
+    if args.isolate:
+        configure_isolation(
+            args.package_timeout,
+            args.max_worker_rss_mb * 1024 * 1024 if args.max_worker_rss_mb else None,
+            args.packages_per_worker,
+            initializer=init_isolated_worker,
+            initargs=(args,),
+        )
+
+    if args.job_queue:
+        if not (args.worker or args.assemble):
+            # Checked before the queue is opened, so a bad top N leaves whatever it held alone
+            if args.top_n is None:
+                print("Error: --job-queue needs a top N to queue, --worker or --assemble.")
+                sys.exit(1)
+            if not (1 <= args.top_n <= 8000):
+                print("Error: <top_n> must be an integer between 1 and 8000.")
+                sys.exit(1)
+        job_queue = JobQueue(args.job_queue, lease_seconds=args.lease_seconds or DEFAULT_LEASE_SECONDS)
+        if args.worker:
+            print(f"Analyzed {run_worker(job_queue, args.in_memory)} packages.")
+        elif args.assemble:
+            write_reports(assemble_reports(job_queue),
+                          write_json=True, write_html=True, create_daily=args.create_daily)
+        else:
+            enqueue_packages(job_queue, args.top_n)
+        job_queue.close()
+        sys.exit(0)
+
     if args.create_daily:
         main(top_n=(args.top_n or 8000), package_name=args.package_name,
-             write_json=True, write_html=True, create_daily=True)
+             write_json=True, write_html=True, create_daily=True,
+             in_memory=args.in_memory, async_fetch=args.async_fetch,
+             prefetch=args.prefetch_metadata, resume=args.resume,
+             incremental=args.incremental)
     elif args.package_name:
         main(package_name=args.package_name,
-             write_json=args.write_json, write_html=args.write_html)
+             write_json=args.write_json, write_html=args.write_html,
+             in_memory=args.in_memory)
     elif args.top_n:
         if not (1 <= args.top_n <= 8000):
             print("Error: <top_n> must be an integer between 1 and 8000.")
             sys.exit(1)
         main(
             top_n=args.top_n,
-            write_json=args.write_json,
-            write_html=args.write_html,
+            # A shard's JSON report is always written, for merging
+            write_json=args.write_json or shard is not None,
+            write_html=args.write_html and shard is None,
             parallel=args.parallel,
+            in_memory=args.in_memory,
+            async_fetch=args.async_fetch,
+            prefetch=args.prefetch_metadata,
+            resume=args.resume,
+            incremental=args.incremental,
+            shard=shard,
         )
     else:
         print("Error: Either provide a top N number or a package name.")
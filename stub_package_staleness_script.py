@@ -3,7 +3,7 @@
 from typing import Any
 import json
 
-import requests
+from analyzer import http_client
 
 from datetime import datetime
 format_str = "%Y-%m-%dT%H:%M:%S"
@@ -12,7 +12,7 @@ format_str = "%Y-%m-%dT%H:%M:%S"
 def get_latest_release_time_for_package(package_name: str) -> tuple[datetime, int]:
     # Fetch the package metadata from PyPI
     pypi_url = f"https://pypi.org/pypi/{package_name}/json"
-    response = requests.get(pypi_url)
+    response = http_client.cached_get(pypi_url)
     response.raise_for_status()
 
     # The API returns a JSON response, so 'data' is a dictionary
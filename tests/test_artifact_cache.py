@@ -0,0 +1,61 @@
+import hashlib
+import os
+import time
+from pathlib import Path
+
+import pytest
+
+from analyzer.artifact_cache import NO_SDIST, NOT_FOUND, ArtifactCache
+
+
+def test_store_and_lookup(tmp_path: Path) -> None:
+    cache = ArtifactCache(str(tmp_path / "cache"))
+    content = b"archive bytes"
+    digest = hashlib.sha256(content).hexdigest()
+    assert cache.lookup(digest) is None
+
+    archive = tmp_path / "pkg-1.0.tar.gz"
+    archive.write_bytes(content)
+    cache.store(digest, str(archive))
+    path = cache.lookup(digest)
+    assert path is not None
+    assert Path(path).read_bytes() == content
+
+
+def test_store_rejects_digest_mismatch(tmp_path: Path) -> None:
+    cache = ArtifactCache(str(tmp_path))
+    digest = hashlib.sha256(b"expected").hexdigest()
+    with pytest.raises(ValueError):
+        cache.store_bytes(digest, b"tampered")
+    assert cache.lookup(digest) is None
+
+
+def test_evicts_least_recently_used(tmp_path: Path) -> None:
+    cache = ArtifactCache(str(tmp_path), max_bytes=250)
+    digests: list[str] = []
+    for i in range(3):
+        content = bytes([i]) * 100
+        digest = hashlib.sha256(content).hexdigest()
+        digests.append(digest)
+        if i < 2:
+            cache.store_bytes(digest, content)
+    # Make the first archive the most recently used
+    path = cache.lookup(digests[1])
+    assert path is not None
+    os.utime(path, (time.time() - 60, time.time() - 60))
+    cache.lookup(digests[0])
+
+    cache.store_bytes(digests[2], bytes([2]) * 100)
+    assert cache.lookup(digests[0]) is not None
+    assert cache.lookup(digests[1]) is None
+    assert cache.lookup(digests[2]) is not None
+
+
+def test_negative_entries_expire(tmp_path: Path) -> None:
+    cache = ArtifactCache(str(tmp_path), negative_ttl=60)
+    assert cache.negative("pkg-stubs", NOT_FOUND) is None
+    cache.add_negative("pkg-stubs", NOT_FOUND, "Package 'pkg-stubs' not found on PyPI.")
+    assert cache.negative("pkg-stubs", NOT_FOUND) == "Package 'pkg-stubs' not found on PyPI."
+    # Kinds are kept apart: a project with no sdist still exists
+    assert cache.negative("pkg-stubs", NO_SDIST) is None
+    assert ArtifactCache(str(tmp_path), negative_ttl=0).negative("pkg-stubs", NOT_FOUND) is None
@@ -0,0 +1,196 @@
+import functools
+import gzip
+import io
+import json
+import tarfile
+import threading
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterator
+
+import aiohttp
+import pytest
+
+import analyzer.http_client
+from analyzer.async_fetch import FetchedPackage, iter_fetched_packages, prefetch_metadata, read_fetched_sources
+from analyzer.http_client import configure_http_cache
+from analyzer.package_analyzer import Artifact
+from analyzer.rate_control import CircuitOpenError, RequestController
+
+
+@functools.cache
+def create_sdist(name: str) -> bytes:
+    archive = io.BytesIO()
+    # A zero mtime in the gzip header, so the same sdist is served on every request
+    with gzip.GzipFile(fileobj=archive, mode="wb", mtime=0) as gz, tarfile.open(fileobj=gz, mode="w") as tar:
+        content = b"def f(x: int) -> int: ..."
+        info = tarfile.TarInfo(name=f"{name}-1.0/{name}/__init__.py")
+        info.size = len(content)
+        tar.addfile(info, io.BytesIO(content))
+    return archive.getvalue()
+
+
+class FakeIndexHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    # Distributions with an sdist on the fake index
+    sdists = {"alpha", "beta", "beta-stubs"}
+    # Distributions with metadata but no sdist
+    wheel_only = {"gamma"}
+
+    requests: list[str] = []
+
+    def do_GET(self) -> None:
+        FakeIndexHandler.requests.append(self.path)
+        status, body = 404, b""
+        parts = self.path.strip("/").split("/")
+        if parts[0] == "pypi" and parts[1] in self.sdists | self.wheel_only:
+            urls = [{"packagetype": "sdist",
+                     "url": f"http://{self.headers['Host']}/packages/{parts[1]}-1.0.tar.gz"}]
+            status = 200
+            body = json.dumps({"urls": urls if parts[1] in self.sdists else []}).encode()
+        elif parts[0] == "packages":
+            status, body = 200, create_sdist(parts[1].removesuffix("-1.0.tar.gz"))
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: object) -> None:
+        pass
+
+
+@pytest.fixture
+def fake_index(monkeypatch: pytest.MonkeyPatch) -> Iterator[None]:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeIndexHandler)
+    thread = threading.Thread(target=server.serve_forever, args=(0.01,), daemon=True)
+    thread.start()
+    monkeypatch.setattr(
+        "analyzer.async_fetch.PYPI_JSON_URL",
+        f"http://127.0.0.1:{server.server_address[1]}/pypi/{{}}/json")
+    def check_typeshed(name: str) -> bool:
+        return name == "alpha"
+
+    monkeypatch.setattr("analyzer.async_fetch.check_typeshed", check_typeshed)
+    monkeypatch.setattr(analyzer.http_client, "BACKOFF_BASE", 0.0)
+    monkeypatch.setattr(analyzer.http_client, "http_cache", None)
+    monkeypatch.setattr(analyzer.http_client, "request_controller", RequestController())
+    FakeIndexHandler.requests = []
+    yield
+    server.shutdown()
+    server.server_close()
+
+
+def test_iter_fetched_packages(fake_index: None, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr("analyzer.async_fetch.fetch_concurrency", 2)
+    fetched = {
+        package.name: package
+        for package in iter_fetched_packages([("alpha", False), ("beta", False), ("gamma", True), ("delta", False)])
+    }
+    assert set(fetched) == {"alpha", "beta", "gamma", "delta"}
+
+    # alpha is in typeshed, so no -stubs package is looked up
+    assert set(fetched["alpha"].archives) == {"alpha"}
+    assert fetched["alpha"].stub_package_url is None
+    assert fetched["alpha"].errors == {}
+    sources, has_py_typed = read_fetched_sources(fetched["alpha"], "alpha") or ({}, True)
+    assert list(sources.values()) == [b"def f(x: int) -> int: ..."]
+    assert not has_py_typed
+
+    # beta isn't in typeshed, and its -stubs package is found and downloaded
+    assert set(fetched["beta"].archives) == {"beta", "beta-stubs"}
+    assert fetched["beta"].stub_package_url == "https://pypi.org/project/beta-stubs/"
+
+    # gamma has no sdist, and its listed stub package doesn't exist
+    assert set(fetched["gamma"].errors) == {"gamma", "gamma-stubs"}
+    assert read_fetched_sources(fetched["gamma"], "gamma") == ({}, False)
+
+    assert "delta" in fetched["delta"].errors
+
+
+def test_read_fetched_sources_skips_distributions_not_fetched() -> None:
+    assert read_fetched_sources(FetchedPackage("alpha", {}, {}, None), "alpha-stubs") is None
+
+
+def test_iter_fetched_packages_stops_early(fake_index: None) -> None:
+    packages = iter_fetched_packages([("alpha", False)] * 50)
+    assert next(packages).name == "alpha"
+    packages.close()
+
+
+def test_iter_fetched_packages_enforces_max_archive_size(
+    fake_index: None, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr("analyzer.package_analyzer.max_archive_bytes", 10)
+    [fetched] = iter_fetched_packages([("alpha", False)])
+    assert fetched.archives == {}
+    assert "maximum archive size" in fetched.errors["alpha"]
+
+
+def test_iter_fetched_packages_records_disk_errors(
+    fake_index: None, monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    def local_archive(artifact: Artifact) -> str:
+        return str(tmp_path / "missing.tar.gz")
+
+    monkeypatch.setattr("analyzer.async_fetch.local_archive", local_archive)
+    [fetched] = iter_fetched_packages([("alpha", False)])
+    assert fetched.archives == {}
+    assert "missing.tar.gz" in fetched.errors["alpha"]
+
+
+def test_iter_fetched_packages_stops_on_connection_errors(
+    fake_index: None, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    class OpenCircuit(RequestController):
+        async def acquire_async(self) -> None:
+            raise CircuitOpenError("PyPI keeps failing.")
+
+    monkeypatch.setattr(analyzer.http_client, "request_controller", OpenCircuit())
+    with pytest.raises(CircuitOpenError):
+        list(iter_fetched_packages([("beta", False), ("gamma", False)]))
+
+    # Nothing listens on the port once the server is closed
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeIndexHandler)
+    server.server_close()
+    monkeypatch.setattr(
+        "analyzer.async_fetch.PYPI_JSON_URL", f"http://127.0.0.1:{server.server_address[1]}/pypi/{{}}/json")
+    monkeypatch.setattr(analyzer.http_client, "request_controller", None)
+    monkeypatch.setattr(analyzer.http_client, "max_retries", 1)
+    with pytest.raises(aiohttp.ClientConnectionError):
+        list(iter_fetched_packages([("beta", False)]))
+
+
+def test_iter_fetched_packages_uses_http_cache(fake_index: None, tmp_path: Path) -> None:
+    configure_http_cache(str(tmp_path))
+    first = list(iter_fetched_packages([("beta", False), ("gamma", False)]))
+    metadata_requests = {path for path in FakeIndexHandler.requests if path.startswith("/pypi/")}
+    assert len(metadata_requests) == 4
+
+    # Metadata, including the missing gamma-stubs, now comes from the cache; sdists are downloaded again
+    FakeIndexHandler.requests = []
+    second = list(iter_fetched_packages([("beta", False), ("gamma", False)]))
+    assert set(FakeIndexHandler.requests) == {"/packages/beta-1.0.tar.gz", "/packages/beta-stubs-1.0.tar.gz"}
+    assert sorted(first) == sorted(second)
+
+
+def test_prefetch_metadata(fake_index: None, monkeypatch: pytest.MonkeyPatch) -> None:
+    manifest = prefetch_metadata([("alpha", False), ("beta", False), ("gamma", True), ("delta", False)])
+    # alpha is in typeshed, so alpha-stubs isn't probed
+    assert set(manifest) == {
+        "alpha", "beta", "beta-stubs", "gamma", "gamma-stubs", "delta", "delta-stubs"}
+    assert manifest["beta"].archive is not None
+    assert manifest["beta"].archive.url.endswith("/packages/beta-1.0.tar.gz")
+    assert manifest["gamma"].found and manifest["gamma"].archive is None
+    assert not manifest["delta"].found
+
+    # The analysis phase then only downloads archives
+    monkeypatch.setattr("analyzer.package_analyzer.metadata_manifest", manifest)
+    FakeIndexHandler.requests = []
+    fetched = {
+        package.name: package
+        for package in iter_fetched_packages([("alpha", False), ("beta", False), ("gamma", True)])
+    }
+    assert all(path.startswith("/packages/") for path in FakeIndexHandler.requests)
+    assert set(fetched["beta"].archives) == {"beta", "beta-stubs"}
+    assert "not found" in fetched["gamma"].errors["gamma-stubs"]
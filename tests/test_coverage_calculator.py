@@ -1,5 +1,17 @@
+import ast
+from pathlib import Path
 import pytest
+import analyzer.coverage_calculator
 from analyzer.coverage_calculator import (
+    FileRecord,
+    analyze_file,
+    calculate_coverage_counts,
+    collect_file_records,
+    configure_parse_cache,
+    estimate_node_count,
+    iter_function_defs,
+    merge_function_records,
+    split_files_by_size,
     calculate_parameter_coverage,
     calculate_return_type_coverage,
     calculate_overall_coverage,
@@ -44,6 +56,150 @@ def test_calculate_return_type_coverage():
     assert skipped_files == 0
 
 
+def test_calculate_coverage_counts():
+    # A single pass yields the same tallies as the separate parameter and return passes
+    files = ["tests/test_files/annotated_function.py",
+             "tests/test_files/non_annotated_function.py",
+             "tests/test_files/class_with_init.py",
+             "tests/test_files/syntax_error.py"]
+    counts = calculate_coverage_counts(files)
+    assert (counts.total_params, counts.annotated_params,
+            counts.skipped_files) == calculate_parameter_coverage(files)
+    assert (counts.total_returns, counts.annotated_returns,
+            counts.skipped_files) == calculate_return_type_coverage(files)
+    assert counts == (6, 4, 3, 2, 1, 0)
+
+
+def test_analyze_file():
+    assert analyze_file("tests/test_files/class_with_init.py") == {
+        "MyClass.__init__": (2, 2, False),
+        "MyClass.greet": (0, 0, True),
+    }
+    assert analyze_file("tests/test_files/syntax_error.py") is None
+
+
+def test_iter_function_defs_matches_ast_walk():
+    with open("tests/test_files/nested_scopes.py") as f:
+        tree = ast.parse(f.read())
+
+    # Reference: every FunctionDef in ast.walk order, qualified by a direct ClassDef parent
+    parent_map = {child: node for node in ast.walk(tree)
+                  for child in ast.iter_child_nodes(node)}
+    expected = [
+        (node, parent.name if isinstance(
+            parent := parent_map[node], ast.ClassDef) else None)
+        for node in ast.walk(tree) if isinstance(node, ast.FunctionDef)
+    ]
+    assert list(iter_function_defs(tree)) == expected
+
+    # Module-level and nested functions with the same name keep the shallowest one
+    file_record = analyze_file("tests/test_files/nested_scopes.py")
+    assert file_record is not None
+    assert file_record["helper"] == (2, 0, False)
+    assert file_record["guarded"] == (1, 0, False)
+    assert file_record["conditional"] == (1, 0, False)
+    assert file_record["Outer.method"] == (1, 1, True)
+    assert file_record["Inner.method"] == (1, 1, True)
+    assert file_record["method"] == (1, 0, False)
+    assert "Outer.conditional" not in file_record
+
+
+def test_calculate_coverage_counts_reuses_file_records():
+    file_records: dict[str, FileRecord | None] = {}
+    files = ["tests/test_files/embedded_pyi.py"]
+    calculate_coverage_counts(files, file_records)
+    assert set(file_records) == {"tests/test_files/embedded_pyi.py"}
+
+    # Records that are already present are used as-is, without reading the file
+    file_records["missing/embedded_pyi.pyi"] = {"function_in_code": (2, 2, True)}
+    counts = calculate_coverage_counts(
+        files + ["missing/embedded_pyi.pyi"], file_records)
+    assert counts == (2, 2, 1, 1, 0, 0)
+
+
+def test_merge_function_records_prefers_pyi():
+    file_records: dict[str, FileRecord | None] = {
+        "a/mod.py": {"f": (1, 0, False), "g": (1, 0, False)},
+        "b/mod.py": {"g": (2, 0, False), "h": (1, 1, True)},
+        "a/mod.pyi": {"f": (1, 1, True)},
+        "broken.py": None,
+    }
+    functions = merge_function_records(list(file_records), file_records)
+    assert functions == {
+        "mod.f": ("a/mod.pyi", (1, 1, True)),
+        "mod.g": ("a/mod.py", (1, 0, False)),
+        "mod.h": ("b/mod.py", (1, 1, True)),
+    }
+
+
+def test_split_files_by_size():
+    sizes = {"a.py": 10, "b.py": 6, "c.py": 5, "d.py": 1}
+    chunks = split_files_by_size(list(sizes), sizes, 2)
+    assert sorted(chunks) == [["a.py", "d.py"], ["b.py", "c.py"]]
+    assert split_files_by_size(["a.py"], sizes, 4) == [["a.py"]]
+
+
+def test_collect_file_records_in_process_pool(monkeypatch: pytest.MonkeyPatch):
+    files = ["tests/test_files/class_methods.py",
+             "tests/test_files/complex_types.py",
+             "tests/test_files/embedded_pyi.py",
+             "tests/test_files/embedded_pyi.pyi",
+             "tests/test_files/syntax_error.py"]
+    in_process: dict[str, FileRecord | None] = {}
+    collect_file_records(files, in_process)
+
+    monkeypatch.setattr(
+        analyzer.coverage_calculator, "parallel_parse_min_bytes", 0)
+    monkeypatch.setattr(analyzer.coverage_calculator, "parse_workers", 2)
+    monkeypatch.setattr(analyzer.coverage_calculator, "_parse_pool", None)
+    pooled: dict[str, FileRecord | None] = {}
+    collect_file_records(files, pooled)
+    analyzer.coverage_calculator.get_parse_pool().shutdown()
+    assert pooled == in_process
+    assert calculate_coverage_counts(files, pooled) == calculate_coverage_counts(
+        files, in_process)
+
+
+def test_calculate_coverage_counts_with_parse_cache(monkeypatch: pytest.MonkeyPatch, tmp_path: Path):
+    files = ["tests/test_files/class_with_init.py",
+             "tests/test_files/embedded_pyi.py",
+             "tests/test_files/embedded_pyi.pyi",
+             "tests/test_files/syntax_error.py"]
+    expected = calculate_coverage_counts(files)
+
+    monkeypatch.setattr(analyzer.coverage_calculator, "parse_cache", None)
+    configure_parse_cache(str(tmp_path))
+    assert calculate_coverage_counts(files) == expected
+
+    # A second run is answered entirely from the cache
+    def fail_to_parse(source: bytes, filename: str) -> None:
+        raise AssertionError(f"{filename} was parsed again")
+    monkeypatch.setattr(
+        analyzer.coverage_calculator, "analyze_source", fail_to_parse)
+    assert calculate_coverage_counts(files) == expected
+
+
+def test_oversized_files_are_scanned(monkeypatch: pytest.MonkeyPatch):
+    files = ["tests/test_files/class_methods.py",
+             "tests/test_files/complex_types.py",
+             "tests/test_files/syntax_error.py"]
+    parsed: dict[str, FileRecord | None] = {}
+    expected = calculate_coverage_counts(files, parsed)
+
+    monkeypatch.setattr(analyzer.coverage_calculator, "max_parse_bytes", 0)
+    scanned: dict[str, FileRecord | None] = {}
+    counts = calculate_coverage_counts(files, scanned)
+    assert scanned == parsed
+    # The file with a syntax error still counts as skipped, not oversized
+    assert counts == expected._replace(oversized_files=2)
+
+
+def test_estimate_node_count_is_close_to_real_count():
+    source = Path("tests/test_files/complex_types.py").read_bytes()
+    real = sum(1 for _ in ast.walk(ast.parse(source)))
+    assert real / 2 <= estimate_node_count(source) <= real * 2
+
+
 def test_calculate_overall_coverage():
     # Test with a mix of files
     files = ["tests/test_files/annotated_function.py",
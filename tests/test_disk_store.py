@@ -0,0 +1,64 @@
+import os
+import time
+from pathlib import Path
+
+import pytest
+
+from analyzer.disk_store import STALE_TEMP_SECONDS, LruStore, atomic_write
+
+
+def test_atomic_write(tmp_path: Path) -> None:
+    path = tmp_path / "sub" / "entry"
+    with atomic_write(str(path)) as f:
+        f.write(b"first")
+    assert path.read_bytes() == b"first"
+
+    # A write that fails leaves the old file and no temp file behind
+    with pytest.raises(ValueError):
+        with atomic_write(str(path)) as f:
+            f.write(b"second")
+            raise ValueError("bad content")
+    assert path.read_bytes() == b"first"
+    assert os.listdir(path.parent) == ["entry"]
+
+
+def test_lru_store_evicts_least_recently_used(tmp_path: Path) -> None:
+    store = LruStore(str(tmp_path), max_bytes=250)
+    paths = [str(tmp_path / "entries" / str(i)) for i in range(3)]
+    for i, path in enumerate(paths[:2]):
+        with store.write(path) as f:
+            f.write(b"x" * 100)
+        past = time.time() - 100 + i
+        os.utime(path, (past, past))
+    assert store.touch(paths[0])
+
+    with store.write(paths[2]) as f:
+        f.write(b"x" * 100)
+    assert [os.path.exists(path) for path in paths] == [True, False, True]
+    assert not store.touch(paths[1])
+
+
+def test_lru_store_counts_rewrites_once(tmp_path: Path) -> None:
+    store = LruStore(str(tmp_path), max_bytes=250)
+    path = str(tmp_path / "entry")
+    for _ in range(10):
+        with store.write(path) as f:
+            f.write(b"x" * 100)
+    other = str(tmp_path / "other")
+    with store.write(other) as f:
+        f.write(b"x" * 100)
+    assert os.path.exists(path) and os.path.exists(other)
+
+
+def test_lru_store_evicts_stale_temp_files(tmp_path: Path) -> None:
+    stale = tmp_path / "dead-writer.tmp"
+    stale.write_bytes(b"x" * 200)
+    past = time.time() - STALE_TEMP_SECONDS - 1
+    os.utime(stale, (past, past))
+    fresh = tmp_path / "live-writer.tmp"
+    fresh.write_bytes(b"x" * 10)
+
+    store = LruStore(str(tmp_path), max_bytes=100)
+    store.evict()
+    assert not stale.exists()
+    assert fresh.exists()
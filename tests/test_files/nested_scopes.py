@@ -0,0 +1,37 @@
+def helper(a, b): ...
+
+
+class Outer:
+    def method(self, x: int) -> int:
+        def helper(c: int) -> int:
+            return c
+        return helper(x)
+
+    if True:
+        def conditional(self, y): ...
+    else:
+        def conditional(self, y: int) -> None: ...
+
+    class Inner:
+        def method(self, z: str) -> str:
+            return z
+
+
+try:
+    def guarded(a): ...
+except ImportError:
+    def guarded(a: int) -> int: ...
+    def fallback(b): ...
+finally:
+    pass
+
+match 1:
+    case 1:
+        def matched(m: int) -> None: ...
+    case _:
+        pass
+
+if False:
+    pass
+elif True:
+    def method(q): ...
@@ -0,0 +1,84 @@
+import sqlite3
+import threading
+from pathlib import Path
+
+from analyzer.function_index import FunctionIndex, IndexedFunction, is_public
+
+
+def test_is_public() -> None:
+    assert is_public("pkg-1.0/pkg/module.py", "Class.method")
+    assert is_public("pkg-1.0/pkg/__init__.py", "Class.__call__")
+    assert not is_public("pkg-1.0/pkg/_internal.py", "function")
+    assert not is_public("pkg-1.0/pkg/module.py", "_Class.method")
+    assert not is_public("pkg-1.0/pkg/module.py", "Class._method")
+
+
+def test_queries(tmp_path: Path) -> None:
+    index = FunctionIndex(str(tmp_path / "functions.db"))
+    index.add_package("package_a", 1, [
+        ("a-1.0/a/core.py", "Model.__call__", (1, 0, False)),
+        ("a-1.0/a/core.py", "Model.__init__", (2, 2, False)),
+        ("a-1.0/a/core.py", "typed", (1, 1, True)),
+        ("a-1.0/a/_private.py", "helper", (3, 0, False)),
+    ])
+    index.add_package("package_b", 2, [
+        ("b-1.0/b/api.py", "half", (1, 0, True)),
+        ("b-1.0/b/api.py", "Handler.__call__", (2, 0, False)),
+    ])
+
+    least = index.least_annotated(3)
+    # __init__ isn't expected to annotate its return, so it counts as fully annotated
+    assert [function.qualname for function in least] == [
+        "Handler.__call__", "Model.__call__", "half"]
+    assert least[0] == IndexedFunction(
+        "package_b", 2, "b-1.0/b/api.py", "Handler.__call__", 2, 0, False)
+    assert [function.qualname for function in index.least_annotated(1, public_only=False)] == [
+        "helper"]
+    assert [function.package for function in index.least_annotated(10, max_rank=1)] == [
+        "package_a", "package_a", "package_a"]
+
+    assert [function.package for function in index.unannotated("__call__")] == [
+        "package_a", "package_b"]
+    assert index.unannotated("__call__", max_rank=1)[0].path == "a-1.0/a/core.py"
+
+    # Indexing a package again replaces its previous functions
+    index.add_package("package_a", 1, [("a-1.0/a/core.py", "Model.__call__", (1, 1, True))])
+    assert [function.package for function in index.unannotated("__call__")] == ["package_b"]
+    assert len(index.least_annotated(10, public_only=False)) == 3
+    index.close()
+
+
+def test_concurrent_writers(tmp_path: Path) -> None:
+    path = str(tmp_path / "functions.db")
+    FunctionIndex(path).close()
+
+    def write(worker: int) -> None:
+        # A connection of its own, as each isolated worker process has
+        index = FunctionIndex(path)
+        for i in range(20):
+            index.add_package(f"package_{worker}_{i}", i, [
+                (f"p-1.0/p/module{j}.py", "function", (1, 0, False)) for j in range(20)])
+        index.close()
+
+    threads = [threading.Thread(target=write, args=(worker,)) for worker in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    index = FunctionIndex(path)
+    assert len(index.unannotated("function")) == 4 * 20 * 20
+    index.close()
+
+
+def test_index_of_an_older_schema_is_rebuilt(tmp_path: Path) -> None:
+    path = str(tmp_path / "functions.db")
+    with sqlite3.connect(path) as connection:
+        connection.execute("CREATE TABLE files (id INTEGER PRIMARY KEY, package TEXT, path TEXT)")
+        connection.execute("CREATE TABLE functions (file_id INTEGER, rank INTEGER, qualname TEXT)")
+    connection.close()
+
+    index = FunctionIndex(path)
+    index.add_package("package_a", 1, [("a-1.0/a/core.py", "run", (1, 0, False))])
+    assert [function.qualname for function in index.unannotated("run")] == ["run"]
+    index.close()
@@ -0,0 +1,48 @@
+import os
+from pathlib import Path
+
+from analyzer.http_cache import HttpCache
+
+
+def test_store_and_load(tmp_path: Path) -> None:
+    cache = HttpCache(str(tmp_path))
+    url = "https://pypi.org/pypi/attrs/json"
+    assert cache.load(url) is None
+
+    cache.store(url, 200, b'{"info": {}}', {"ETag": '"abc"', "Last-Modified": "Mon, 01 Jan 2024 00:00:00 GMT"})
+    cached = cache.load(url)
+    assert cached is not None
+    assert (cached.status, cached.body, cached.etag) == (200, b'{"info": {}}', '"abc"')
+    assert cache.is_fresh(cached)
+    assert cache.conditional_headers(cached) == {
+        "If-None-Match": '"abc"', "If-Modified-Since": "Mon, 01 Jan 2024 00:00:00 GMT"}
+
+
+def test_only_cacheable_statuses_are_stored(tmp_path: Path) -> None:
+    cache = HttpCache(str(tmp_path))
+    assert cache.store("https://pypi.org/pypi/missing-stubs/json", 404, b"", {}) is not None
+    assert cache.store("https://pypi.org/pypi/flaky/json", 503, b"", {}) is None
+    assert cache.load("https://pypi.org/pypi/flaky/json") is None
+    # There is nothing to revalidate a 404 against
+    assert cache.conditional_headers(cache.load("https://pypi.org/pypi/missing-stubs/json")) == {}
+
+
+def test_ttl_refresh_and_offline(tmp_path: Path) -> None:
+    url = "https://pypi.org/pypi/attrs/json"
+    cache = HttpCache(str(tmp_path), ttl=60)
+    cached = cache.store(url, 200, b"{}", {"ETag": '"abc"'})
+    assert cached is not None
+    stale = cached._replace(fetched_at=cached.fetched_at - 120)
+    assert not cache.is_fresh(stale)
+    assert cache.is_fresh(cache.refresh(url, stale))
+    assert HttpCache(str(tmp_path), ttl=60, offline=True).is_fresh(stale)
+
+
+def test_load_ignores_corrupt_entries(tmp_path: Path) -> None:
+    cache = HttpCache(str(tmp_path))
+    url = "https://pypi.org/pypi/attrs/json"
+    cache.store(url, 200, b"{}", {})
+    [entry_dir] = [d for d in tmp_path.iterdir() if d.is_dir()]
+    [entry] = os.listdir(entry_dir)
+    (entry_dir / entry).write_bytes(b"not json")
+    assert cache.load(url) is None
@@ -0,0 +1,123 @@
+import threading
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterator
+
+import pytest
+
+import analyzer.http_client
+from analyzer.http_client import backoff_delay, cached_get, configure_http_cache, get
+from analyzer.rate_control import CircuitOpenError, RequestController
+
+
+class FakeIndexHandler(BaseHTTPRequestHandler):
+    # Keep connections alive between requests
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    # Statuses to answer with before succeeding, consumed in order
+    failures: list[int] = []
+    connections: set[int] = set()
+    requests: list[str] = []
+
+    def do_GET(self) -> None:
+        FakeIndexHandler.connections.add(self.client_address[1])
+        FakeIndexHandler.requests.append(self.path)
+        status = FakeIndexHandler.failures.pop(0) if FakeIndexHandler.failures else 200
+        body = b'{"info": {}}'
+        if status == 200 and self.headers.get("If-None-Match") == '"v1"':
+            status, body = 304, b""
+        self.send_response(status)
+        if status == 429:
+            self.send_header("Retry-After", "0")
+        self.send_header("ETag", '"v1"')
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: object) -> None:
+        pass
+
+
+@pytest.fixture
+def server_url(monkeypatch: pytest.MonkeyPatch) -> Iterator[str]:
+    monkeypatch.setattr(analyzer.http_client, "_session", None)
+    monkeypatch.setattr(analyzer.http_client, "BACKOFF_BASE", 0.0)
+    monkeypatch.setattr(analyzer.http_client, "http_cache", None)
+    monkeypatch.setattr(analyzer.http_client, "request_controller", RequestController())
+    FakeIndexHandler.failures = []
+    FakeIndexHandler.connections = set()
+    FakeIndexHandler.requests = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeIndexHandler)
+    thread = threading.Thread(target=server.serve_forever, args=(0.01,), daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_get_reuses_connections(server_url: str) -> None:
+    for _ in range(5):
+        assert get(f"{server_url}/pypi/example/json").json() == {"info": {}}
+    assert len(FakeIndexHandler.connections) == 1
+
+
+def test_get_retries_server_errors(server_url: str) -> None:
+    FakeIndexHandler.failures = [503, 429, 500]
+    assert get(f"{server_url}/pypi/example/json").status_code == 200
+    assert FakeIndexHandler.failures == []
+
+
+def test_get_returns_last_response_after_retries(
+    server_url: str, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(analyzer.http_client, "max_retries", 1)
+    FakeIndexHandler.failures = [502, 502, 502]
+    assert get(f"{server_url}/pypi/example/json").status_code == 502
+    assert FakeIndexHandler.failures == [502]
+
+
+def test_get_fails_fast_once_circuit_opens(server_url: str, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(analyzer.http_client, "request_controller", RequestController(failure_threshold=2))
+    FakeIndexHandler.failures = [503] * 5
+    with pytest.raises(CircuitOpenError):
+        get(f"{server_url}/pypi/example/json")
+    # Later requests aren't sent at all
+    with pytest.raises(CircuitOpenError):
+        get(f"{server_url}/pypi/other/json")
+    assert len(FakeIndexHandler.requests) == 2
+
+
+def test_get_does_not_retry_not_found(server_url: str) -> None:
+    FakeIndexHandler.failures = [404, 500]
+    assert get(f"{server_url}/pypi/example-stubs/json").status_code == 404
+    assert FakeIndexHandler.failures == [500]
+
+
+def test_backoff_delay_is_capped() -> None:
+    assert 0 <= backoff_delay(0) <= analyzer.http_client.BACKOFF_BASE
+    assert backoff_delay(100) <= analyzer.http_client.BACKOFF_MAX
+
+
+def test_cached_get_revalidates_with_etag(server_url: str, tmp_path: Path) -> None:
+    url = f"{server_url}/pypi/example/json"
+    configure_http_cache(str(tmp_path), ttl=0)
+    assert cached_get(url).json() == {"info": {}}
+    # Stale at once with a zero TTL, so revalidated; the server answers 304
+    response = cached_get(url)
+    assert response.status_code == 200
+    assert response.json() == {"info": {}}
+    assert len(FakeIndexHandler.requests) == 2
+
+    configure_http_cache(str(tmp_path), ttl=3600)
+    assert cached_get(url).json() == {"info": {}}
+    assert len(FakeIndexHandler.requests) == 2
+
+
+def test_cached_get_offline(server_url: str, tmp_path: Path) -> None:
+    url = f"{server_url}/pypi/example/json"
+    configure_http_cache(str(tmp_path), ttl=0)
+    cached_get(url)
+    configure_http_cache(str(tmp_path), ttl=0, offline=True)
+    assert cached_get(url).json() == {"info": {}}
+    assert cached_get(f"{server_url}/pypi/never-fetched/json").status_code == 504
+    assert len(FakeIndexHandler.requests) == 1
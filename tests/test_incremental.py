@@ -0,0 +1,75 @@
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from analyzer.incremental import analysis_provenance, carry_forward, is_unchanged
+from analyzer.package_analyzer import Artifact, DistributionMetadata
+
+
+def artifact(name: str, version: str) -> Artifact:
+    return Artifact(f"https://example.com/{name}-{version}.tar.gz", f"{name}-{version}-digest", 100, "sdist", version)
+
+
+@pytest.fixture
+def typeshed(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> Path:
+    stubs_dir = tmp_path / "typeshed" / "stubs" / "typed"
+    stubs_dir.mkdir(parents=True)
+    (stubs_dir / "__init__.pyi").write_text("def f(x: int) -> int: ...")
+    monkeypatch.setattr("analyzer.typeshed_checker.TYPESHED_DIR", str(tmp_path / "typeshed"))
+    return stubs_dir
+
+
+def set_releases(monkeypatch: pytest.MonkeyPatch, releases: dict[str, str]) -> None:
+    manifest = {
+        name: DistributionMetadata(name, True, version, artifact(name, version), None)
+        for name, version in releases.items()
+    }
+    for name in ("pkg-stubs", "typed-stubs"):
+        manifest.setdefault(name, DistributionMetadata(name, False, None, None, "not found"))
+    monkeypatch.setattr("analyzer.package_analyzer.metadata_manifest", manifest)
+
+
+def test_is_unchanged(monkeypatch: pytest.MonkeyPatch, typeshed: Path) -> None:
+    previous: dict[str, Any] = {
+        "pkg": {"Provenance": analysis_provenance("pkg", {"pkg": artifact("pkg", "1.0")})},
+        "typed": {"Provenance": analysis_provenance("typed", {"typed": artifact("typed", "2.0")})},
+    }
+    set_releases(monkeypatch, {"pkg": "1.0", "typed": "2.0"})
+    assert is_unchanged("pkg", previous["pkg"], False)
+    assert is_unchanged("typed", previous["typed"], False)
+    assert not is_unchanged("new", None, False)
+
+    # A different engine or parse budget
+    monkeypatch.setattr("analyzer.coverage_calculator.fast_scan", True)
+    assert not is_unchanged("pkg", previous["pkg"], False)
+    monkeypatch.setattr("analyzer.coverage_calculator.fast_scan", False)
+    monkeypatch.setattr("analyzer.coverage_calculator.max_parse_nodes", 1000)
+    assert not is_unchanged("pkg", previous["pkg"], False)
+    monkeypatch.setattr("analyzer.coverage_calculator.max_parse_nodes", 1_000_000)
+    assert is_unchanged("pkg", previous["pkg"], False)
+
+    # A new release
+    set_releases(monkeypatch, {"pkg": "1.1", "typed": "2.0"})
+    assert not is_unchanged("pkg", previous["pkg"], False)
+    # A new stub package
+    set_releases(monkeypatch, {"pkg": "1.0", "pkg-stubs": "1.0", "typed": "2.0"})
+    assert not is_unchanged("pkg", previous["pkg"], False)
+    # Changed typeshed stubs
+    (typeshed / "__init__.pyi").write_text("def f(x: int) -> str: ...")
+    assert not is_unchanged("typed", previous["typed"], False)
+    # A new analyzer
+    monkeypatch.setattr("analyzer.incremental.ANALYZER_VERSION", "next")
+    assert not is_unchanged("pkg", previous["pkg"], False)
+
+
+def test_carry_forward() -> None:
+    previous = {"DownloadCount": 10, "DownloadRanking": 5, "TypeshedData": {}, "CoverageData": {"parameter_coverage": 50.0}}
+    report = carry_forward("pkg", previous, 3, 20, {"pkg": {"typeshed_coverage": 85.0}})
+    assert report == {
+        "DownloadCount": 20,
+        "DownloadRanking": 3,
+        "TypeshedData": {"typeshed_coverage": 85.0},
+        "CoverageData": {"parameter_coverage": 50.0},
+    }
+    assert previous["DownloadRanking"] == 5
@@ -0,0 +1,88 @@
+import threading
+from pathlib import Path
+
+from analyzer.job_queue import JobQueue
+
+
+def fill(job_queue: JobQueue, count: int) -> None:
+    job_queue.enqueue([
+        (f"package{rank}", rank, 1000 - rank, False, {"typeshed_coverage": 85.0} if rank == 1 else None)
+        for rank in range(1, count + 1)
+    ])
+
+
+def test_lease_and_complete(tmp_path: Path) -> None:
+    job_queue = JobQueue(str(tmp_path / "jobs.db"))
+    fill(job_queue, 2)
+
+    first = job_queue.lease("worker-a")
+    second = job_queue.lease("worker-b")
+    assert first is not None and second is not None
+    assert (first.package, first.rank, first.typeshed_data) == ("package1", 1, {"typeshed_coverage": 85.0})
+    assert second.package == "package2"
+    assert job_queue.lease("worker-c") is None
+    assert job_queue.in_progress() == 2
+
+    job_queue.complete(second, {"DownloadRanking": 2})
+    job_queue.complete(first, {"DownloadRanking": 1})
+    assert list(job_queue.reports()) == ["package1", "package2"]
+    assert job_queue.counts() == {"done": 2, "remaining": 0, "failed": 0}
+    job_queue.close()
+
+
+def test_expensive_jobs_are_leased_first(tmp_path: Path) -> None:
+    job_queue = JobQueue(str(tmp_path / "jobs.db"))
+    job_queue.enqueue(
+        [(f"package{rank}", rank, None, False, None) for rank in range(1, 5)],
+        {"package3": 500, "package4": 100})
+
+    leased: list[str] = []
+    while (job := job_queue.lease("worker-a")) is not None:
+        leased.append(job.package)
+        job_queue.complete(job, {"DownloadRanking": job.rank})
+    assert leased == ["package3", "package4", "package1", "package2"]
+    assert list(job_queue.reports()) == ["package1", "package2", "package3", "package4"]
+    job_queue.close()
+
+
+def test_expired_leases_are_handed_out_again(tmp_path: Path) -> None:
+    job_queue = JobQueue(str(tmp_path / "jobs.db"), lease_seconds=10, max_attempts=2)
+    fill(job_queue, 1)
+
+    job = job_queue.lease("worker-a", now=0)
+    assert job is not None
+    assert job_queue.lease("worker-b", now=5) is None
+    # worker-a stopped renewing its lease
+    retried = job_queue.lease("worker-b", now=11)
+    assert retried is not None and retried.attempts == 2
+    assert not job_queue.renew(job, "worker-a")
+
+    job_queue.release(retried, "worker-b")
+    # Out of attempts
+    assert job_queue.lease("worker-c", now=12) is None
+    assert job_queue.counts() == {"done": 0, "remaining": 0, "failed": 1}
+    job_queue.close()
+
+
+def test_workers_share_jobs(tmp_path: Path) -> None:
+    path = str(tmp_path / "jobs.db")
+    job_queue = JobQueue(path)
+    fill(job_queue, 50)
+    leased: list[str] = []
+
+    def work(worker: str) -> None:
+        job_queue = JobQueue(path)
+        while (job := job_queue.lease(worker)) is not None:
+            leased.append(job.package)
+            job_queue.complete(job, {"worker": worker})
+        job_queue.close()
+
+    workers = [threading.Thread(target=work, args=(f"worker-{i}",)) for i in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert sorted(leased) == sorted(f"package{rank}" for rank in range(1, 51))
+    assert len(job_queue.reports()) == 50
+    job_queue.close()
@@ -0,0 +1,28 @@
+from pathlib import Path
+
+from analyzer.journal import ReportJournal
+
+
+def test_journal_resume(tmp_path: Path) -> None:
+    path = str(tmp_path / "package_report.journal")
+    journal = ReportJournal(path)
+    journal.record("package_a", {"DownloadRanking": 1})
+    journal.record("package_b", {"DownloadRanking": 2})
+    journal.close()
+    # Cut short while writing a third report
+    with open(path, "a") as f:
+        f.write('{"package": "package_c", "report": {"Downl')
+
+    journal = ReportJournal(path, resume=True)
+    assert journal.reports == {"package_a": {"DownloadRanking": 1}, "package_b": {"DownloadRanking": 2}}
+    journal.record("package_c", {"DownloadRanking": 3})
+    journal.close()
+
+    journal = ReportJournal(path, resume=True)
+    assert journal.reports["package_c"] == {"DownloadRanking": 3}
+    journal.close()
+    # Without resume a new run starts
+    ReportJournal(path).close()
+    journal = ReportJournal(path, resume=True)
+    assert journal.reports == {}
+    journal.close()
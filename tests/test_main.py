@@ -1,13 +1,32 @@
-from main import main, analyze_package
+from main import (
+    analyze_package,
+    analyze_package_isolated,
+    assemble_reports,
+    enqueue_packages,
+    main,
+    merge_shard_reports,
+    query_function_index,
+    run_worker,
+    write_reports,
+)
+from analyzer.async_fetch import FetchedPackage
+from analyzer.function_index import FunctionIndex, IndexedFunction, configure_function_index, get_function_index
+from analyzer.job_queue import JobQueue
+from analyzer.report_generator import generate_report_html
+from analyzer.supervisor import TIMED_OUT, IsolationLimits, Outcome, close_supervisors
+from analyzer.package_analyzer import Artifact, DistributionMetadata
+import analyzer.http_client
 import pytest
 from unittest.mock import Mock
 from io import BytesIO
 import tarfile
 import tempfile
+import json
 import os
 import sys
 import requests
-from typing import Any, Optional
+from pathlib import Path
+from typing import Any, Iterator, Optional
 
 # Add the directory containing main.py to sys.path
 sys.path.insert(0, os.path.abspath(
@@ -22,6 +41,49 @@ def mock_download_typeshed_csv() -> dict[str, Any]:
     }
 
 
+@pytest.fixture
+def top_packages(monkeypatch: pytest.MonkeyPatch) -> list[dict[str, Any]]:
+    """Ranks package_a and package_b as the top packages, returning the list for a test to replace."""
+    packages: list[dict[str, Any]] = [
+        {"download_count": 1000, "project": "package_a"},
+        {"download_count": 500, "project": "package_b"},
+    ]
+
+    def mock_load_and_sort_top_packages(json_file: str) -> list[dict[str, Any]]:
+        return packages
+
+    monkeypatch.setattr("main.load_and_sort_top_packages",
+                        mock_load_and_sort_top_packages)
+    monkeypatch.setattr("main.download_typeshed_csv",
+                        mock_download_typeshed_csv)
+    return packages
+
+
+@pytest.fixture
+def json_report_file(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> str:
+    """Writes the report and its journal to a temp directory, returning the report's path."""
+    json_file = str(tmp_path / 'package_report.json')
+    monkeypatch.setattr("main.JSON_REPORT_FILE", json_file)
+    monkeypatch.setattr("main.JOURNAL_FILE", str(tmp_path / 'package_report.journal'))
+    return json_file
+
+
+def not_in_typeshed(package_name: str) -> bool:
+    return False
+
+
+def in_typeshed(package_name: str) -> bool:
+    return True
+
+
+def no_stub_package(package_name: str) -> Optional[str]:
+    return None
+
+
+def no_stub_files(package_name: str) -> list[str]:
+    return []
+
+
 def create_mock_tar_gz() -> bytes:
     # Create a mock tar.gz file in memory
     tar_bytes = BytesIO()
@@ -62,76 +124,58 @@ def mock_get(url: str, *args: Any, **kwargs: Any) -> Any:
                 return create_mock_tar_gz()
             return b""
 
-    return MockResponse(url)
+        headers: dict[str, str] = {}
 
+        def iter_content(self, chunk_size: int) -> list[bytes]:
+            return [self.content]
 
-def test_main_with_write_json_and_write_html(monkeypatch: pytest.MonkeyPatch) -> None:
-    def mock_load_and_sort_top_packages(json_file: str) -> list[dict[str, Any]]:
-        return [
-            {"download_count": 1000, "project": "package_a"},
-            {"download_count": 500, "project": "package_b"},
-        ]
+        def close(self) -> None:
+            pass
 
+    return MockResponse(url)
+
+
+@pytest.mark.usefixtures("top_packages")
+def test_main_with_write_json_and_write_html(monkeypatch: pytest.MonkeyPatch, json_report_file: str) -> None:
     mock_generate_report = Mock()
     mock_generate_report_html = Mock()
 
-    monkeypatch.setattr("main.load_and_sort_top_packages",
-                        mock_load_and_sort_top_packages)
     monkeypatch.setattr("main.generate_report", mock_generate_report)
     monkeypatch.setattr("main.generate_report_html", mock_generate_report_html)
-    monkeypatch.setattr("main.download_typeshed_csv",
-                        mock_download_typeshed_csv)
-    monkeypatch.setattr("requests.get", mock_get)
-
-    with tempfile.TemporaryDirectory() as temp_dir:
-        json_file = os.path.join(temp_dir, 'package_report.json')
-        monkeypatch.setattr("main.JSON_REPORT_FILE", json_file)
+    monkeypatch.setattr("analyzer.http_client.get", mock_get)
 
-        # Test when --write-json and --write-html flags are passed
-        main(top_n=2, write_json=True, write_html=True)
+    # Test when --write-json and --write-html flags are passed
+    main(top_n=2, write_json=True, write_html=True)
 
-        # Check that the JSON file was created
-        assert os.path.exists(json_file)
+    # Check that the JSON file was created
+    assert os.path.exists(json_report_file)
 
-        # Check that the HTML report was generated
-        mock_generate_report_html.assert_called_once()
+    # Check that the HTML report was generated
+    mock_generate_report_html.assert_called_once()
 
 
-def test_main_without_write_json_and_write_html(monkeypatch: pytest.MonkeyPatch) -> None:
-    def mock_load_and_sort_top_packages(json_file: str) -> list[dict[str, Any]]:
-        return [
-            {"download_count": 1000, "project": "package_a"},
-            {"download_count": 500, "project": "package_b"},
-        ]
-
+@pytest.mark.usefixtures("top_packages")
+def test_main_without_write_json_and_write_html(monkeypatch: pytest.MonkeyPatch, json_report_file: str) -> None:
     mock_generate_report = Mock()
     mock_generate_report_html = Mock()
 
-    monkeypatch.setattr("main.load_and_sort_top_packages",
-                        mock_load_and_sort_top_packages)
     monkeypatch.setattr("main.generate_report", mock_generate_report)
     monkeypatch.setattr("main.generate_report_html", mock_generate_report_html)
-    monkeypatch.setattr("main.download_typeshed_csv",
-                        mock_download_typeshed_csv)
-    monkeypatch.setattr("requests.get", mock_get)
-
-    with tempfile.TemporaryDirectory() as temp_dir:
-        json_file = os.path.join(temp_dir, 'package_report.json')
-        monkeypatch.setattr("main.JSON_REPORT_FILE", json_file)
+    monkeypatch.setattr("analyzer.http_client.get", mock_get)
 
-        # Test when --write-json and --write-html flags are not passed
-        main(top_n=2, write_json=False, write_html=False)
+    # Test when --write-json and --write-html flags are not passed
+    main(top_n=2, write_json=False, write_html=False)
 
-        # Check that the JSON file was NOT created
-        assert not os.path.exists(json_file)
+    # Check that the JSON file was NOT created
+    assert not os.path.exists(json_report_file)
 
-        # Check that the HTML report generation was NOT called
-        mock_generate_report_html.assert_not_called()
+    # Check that the HTML report generation was NOT called
+    mock_generate_report_html.assert_not_called()
 
 
 def test_main_analyze_package(monkeypatch: pytest.MonkeyPatch) -> None:
     with tempfile.TemporaryDirectory() as temp_dir:  # Create a temp directory here
-        def mock_extract_files(package_name: str, temp_dir: str) -> tuple[list[str], bool]:
+        def mock_extract_files(package_name: str, temp_dir: str, artifacts: Any = None) -> tuple[list[str], bool]:
             return [
                 f"{temp_dir}/package_a/module.py",
                 f"{temp_dir}/package_a/tests/test_module.py"
@@ -146,13 +190,14 @@ def test_main_analyze_package(monkeypatch: pytest.MonkeyPatch) -> None:
         def mock_merge_files_with_stubs(non_test_files: list[str], stub_files: list[str]) -> list[str]:
             return non_test_files + stub_files
 
-        def mock_calculate_overall_coverage(files: list[str]) -> dict[str, float]:
+        def mock_calculate_overall_coverage(files: list[str], file_records: Any = None) -> dict[str, float]:
             # Check if the files are test or non-test files based on path
             if any("tests" in file for file in files):
                 return {
                     "parameter_coverage": 50.0,  # Test files have lower coverage
                     "return_type_coverage": 50.0,
                     "skipped_files": 1,
+                    "oversized_files": 0,
                     "surface_area": 100,
                 }
             else:
@@ -160,6 +205,7 @@ def test_main_analyze_package(monkeypatch: pytest.MonkeyPatch) -> None:
                     "parameter_coverage": 80.0,  # Non-test files have higher coverage
                     "return_type_coverage": 80.0,
                     "skipped_files": 1,
+                    "oversized_files": 0,
                     "surface_area": 100,
                 }
         mock_generate_report = Mock()
@@ -173,7 +219,7 @@ def test_main_analyze_package(monkeypatch: pytest.MonkeyPatch) -> None:
         monkeypatch.setattr("main.calculate_overall_coverage",
                             mock_calculate_overall_coverage)
         monkeypatch.setattr("main.generate_report", mock_generate_report)
-        monkeypatch.setattr("requests.get", mock_get)
+        monkeypatch.setattr("analyzer.http_client.get", mock_get)
 
         # Test with a single package analysis
         package_report = analyze_package(
@@ -190,7 +236,7 @@ def test_main_analyze_package(monkeypatch: pytest.MonkeyPatch) -> None:
 
 def test_main_analyze_package_with_non_typeshed_stubs(monkeypatch: pytest.MonkeyPatch) -> None:
     with tempfile.TemporaryDirectory() as temp_dir:
-        def mock_extract_files(package_name: str, temp_dir: str) -> tuple[list[str], bool]:
+        def mock_extract_files(package_name: str, temp_dir: str, artifacts: Any = None) -> tuple[list[str], bool]:
             if package_name == "package_a-stubs":
                 return [f"{temp_dir}/package_a/module.pyi"], True
             else:
@@ -213,13 +259,14 @@ def test_main_analyze_package_with_non_typeshed_stubs(monkeypatch: pytest.Monkey
         def mock_merge_files_with_stubs(non_test_files: list[str], stub_files: list[str]) -> list[str]:
             return non_test_files + stub_files
 
-        def mock_calculate_overall_coverage(files: list[str]) -> dict[str, float]:
+        def mock_calculate_overall_coverage(files: list[str], file_records: Any = None) -> dict[str, float]:
             if any("tests" in file for file in files):
                 # Test files coverage
                 return {
                     "parameter_coverage": 50.0,
                     "return_type_coverage": 50.0,
                     "skipped_files": 1,
+                    "oversized_files": 0,
                     "surface_area": 100,
                 }
             elif any("module.pyi" in file for file in files):
@@ -228,6 +275,7 @@ def test_main_analyze_package_with_non_typeshed_stubs(monkeypatch: pytest.Monkey
                     "parameter_coverage": 80.0,
                     "return_type_coverage": 80.0,
                     "skipped_files": 0,
+                    "oversized_files": 0,
                     "surface_area": 100,
                 }
             else:
@@ -236,6 +284,7 @@ def test_main_analyze_package_with_non_typeshed_stubs(monkeypatch: pytest.Monkey
                     "parameter_coverage": 70.0,
                     "return_type_coverage": 70.0,
                     "skipped_files": 0,
+                    "oversized_files": 0,
                     "surface_area": 100,
                 }
 
@@ -250,7 +299,7 @@ def test_main_analyze_package_with_non_typeshed_stubs(monkeypatch: pytest.Monkey
         monkeypatch.setattr("main.calculate_overall_coverage",
                             mock_calculate_overall_coverage)
         monkeypatch.setattr("main.generate_report", mock_generate_report)
-        monkeypatch.setattr("requests.get", mock_get)
+        monkeypatch.setattr("analyzer.http_client.get", mock_get)
 
         # Test with a package that has non-typeshed stubs
         package_report = analyze_package(
@@ -266,3 +315,405 @@ def test_main_analyze_package_with_non_typeshed_stubs(monkeypatch: pytest.Monkey
         assert package_report["CoverageData"]["return_coverage_with_tests"] == 50.0
         assert package_report["CoverageData"]["skipped_files"] == 1
         mock_generate_report.assert_called_once()
+
+
+def test_main_analyze_package_in_memory(monkeypatch: pytest.MonkeyPatch) -> None:
+    def mock_extract_sources(package_name: str, artifacts: Any = None) -> tuple[dict[str, bytes], bool]:
+        return {
+            "package_a-1.0.tar.gz/package_a-1.0/package_a/module.py":
+                b"def f(x: int, y) -> int: ...",
+            "package_a-1.0.tar.gz/package_a-1.0/tests/test_module.py":
+                b"def test_f(a, b): ...",
+        }, True
+
+    def mock_extract_files(package_name: str, temp_dir: str, artifacts: Any = None) -> tuple[list[str], bool]:
+        raise AssertionError("in-memory analysis should not extract to disk")
+
+    monkeypatch.setattr("main.extract_sources", mock_extract_sources)
+    monkeypatch.setattr("main.extract_files", mock_extract_files)
+    monkeypatch.setattr("main.check_typeshed", not_in_typeshed)
+    monkeypatch.setattr("main.find_stub_package", no_stub_package)
+    monkeypatch.setattr("main.generate_report", Mock())
+
+    package_report = analyze_package(
+        "package_a", rank=1, download_count=1000, in_memory=True)
+
+    assert package_report["HasPyTypedFile"] is True
+    assert package_report["CoverageData"]["parameter_coverage"] == 50.0
+    assert package_report["CoverageData"]["return_type_coverage"] == 100.0
+    assert package_report["CoverageData"]["param_coverage_with_tests"] == 25.0
+    assert package_report["CoverageData"]["return_coverage_with_tests"] == 50.0
+    assert package_report["CoverageData"]["skipped_files"] == 0
+
+
+def test_main_analyze_package_records_function_index(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    def mock_extract_sources(package_name: str, artifacts: Any = None) -> tuple[dict[str, bytes], bool]:
+        return {
+            "package_a-1.0.tar.gz/package_a-1.0/package_a/module.py":
+                b"class A:\n    def __call__(self, x): ...\n",
+            "package_a-1.0.tar.gz/package_a-1.0/tests/test_module.py":
+                b"def test_f(a, b): ...",
+        }, False
+
+    monkeypatch.setattr("main.extract_sources", mock_extract_sources)
+    monkeypatch.setattr("main.check_typeshed", not_in_typeshed)
+    monkeypatch.setattr("main.find_stub_package", no_stub_package)
+    monkeypatch.setattr("main.generate_report", Mock())
+    monkeypatch.setattr("analyzer.function_index.function_index", None)
+    configure_function_index(str(tmp_path / "functions.db"))
+
+    analyze_package("package_a", rank=3, in_memory=True)
+
+    # Only the non-test files are indexed, by their path inside the archive
+    function_index = get_function_index()
+    assert function_index is not None
+    assert function_index.unannotated("__call__") == [IndexedFunction(
+        "package_a", 3, "package_a-1.0/package_a/module.py", "A.__call__", 1, 0, False)]
+    assert function_index.least_annotated(10, public_only=False) == function_index.unannotated("__call__")
+    function_index.close()
+
+
+@pytest.mark.usefixtures("top_packages")
+def test_main_async_fetch(monkeypatch: pytest.MonkeyPatch, json_report_file: str) -> None:
+    def mock_iter_fetched_packages(packages: list[tuple[str, bool]]) -> Iterator[FetchedPackage]:
+        # Finished out of rank order
+        for name, _ in reversed(packages):
+            archive = BytesIO()
+            with tarfile.open(fileobj=archive, mode="w:gz") as tar:
+                info = tarfile.TarInfo(name=f"{name}-1.0/{name}.py")
+                info.size = len(b"def f(x: int) -> None: ...")
+                tar.addfile(info, BytesIO(b"def f(x: int) -> None: ..."))
+            yield FetchedPackage(
+                name, {name: (Artifact(f"https://example.com/{name}-1.0.tar.gz", None, None, "sdist"),
+                              archive.getvalue())}, {}, None)
+
+    def mock_extract_sources(package_name: str, artifacts: Any = None) -> tuple[dict[str, bytes], bool]:
+        raise AssertionError("fetched packages should not be downloaded again")
+
+    monkeypatch.setattr("main.iter_fetched_packages", mock_iter_fetched_packages)
+    monkeypatch.setattr("main.extract_sources", mock_extract_sources)
+    monkeypatch.setattr("main.check_typeshed", in_typeshed)
+    monkeypatch.setattr("main.find_stub_files", no_stub_files)
+    monkeypatch.setattr("main.generate_report", Mock())
+
+    main(top_n=2, write_json=True, async_fetch=True)
+    with open(json_report_file) as f:
+        package_report = json.load(f)
+
+    assert list(package_report) == ["package_a", "package_b"]
+    assert package_report["package_b"]["DownloadRanking"] == 2
+    assert package_report["package_a"]["CoverageData"]["parameter_coverage"] == 100.0
+    assert package_report["package_a"]["AnalyzedArtifact"] == {
+        "filename": "package_a-1.0.tar.gz", "packagetype": "sdist", "size": None,
+        "version": None, "sha256": None}
+    assert package_report["package_a"]["Provenance"]["artifacts"] == {
+        "package_a": "https://example.com/package_a-1.0.tar.gz"}
+
+
+@pytest.mark.usefixtures("top_packages")
+def test_main_resume(monkeypatch: pytest.MonkeyPatch, tmp_path: Path, json_report_file: str) -> None:
+    analyzed: list[str] = []
+
+    def mock_analyze_package(package_name: str, **kwargs: Any) -> dict[str, Any]:
+        analyzed.append(package_name)
+        return {"DownloadRanking": kwargs["rank"], "CoverageData": {}}
+
+    monkeypatch.setattr("main.analyze_package", mock_analyze_package)
+
+    # A run that stopped after package_a, partway through writing package_b
+    with open(tmp_path / 'package_report.journal', "w") as f:
+        f.write(json.dumps({"package": "package_a", "report": {"DownloadRanking": 1, "Resumed": True}}) + "\n")
+        f.write('{"package": "package_b", "rep')
+
+    main(top_n=2, write_json=True, resume=True)
+    with open(json_report_file) as f:
+        package_report = json.load(f)
+
+    assert analyzed == ["package_b"]
+    assert list(package_report) == ["package_a", "package_b"]
+    assert package_report["package_a"]["Resumed"]
+    assert package_report["package_b"]["DownloadRanking"] == 2
+
+
+@pytest.mark.usefixtures("top_packages")
+def test_main_sequential_passes_stub_packages(monkeypatch: pytest.MonkeyPatch, json_report_file: str) -> None:
+    has_stub_package: dict[str, bool] = {}
+
+    def mock_analyze_package(package_name: str, **kwargs: Any) -> dict[str, Any]:
+        has_stub_package[package_name] = kwargs["has_stub_package"]
+        return {"DownloadRanking": kwargs["rank"], "CoverageData": {}}
+
+    def mock_get_packages_with_stubs() -> set[str]:
+        return {"package_b"}
+
+    monkeypatch.setattr("main.get_packages_with_stubs", mock_get_packages_with_stubs)
+    monkeypatch.setattr("main.analyze_package", mock_analyze_package)
+
+    main(top_n=2)
+
+    assert has_stub_package == {"package_a": False, "package_b": True}
+
+
+@pytest.mark.usefixtures("top_packages")
+def test_main_incremental(monkeypatch: pytest.MonkeyPatch, json_report_file: str) -> None:
+    analyzed: list[str] = []
+
+    def mock_analyze_package(package_name: str, **kwargs: Any) -> dict[str, Any]:
+        analyzed.append(package_name)
+        return {"DownloadRanking": kwargs["rank"], "CoverageData": {}}
+
+    def mock_prefetch_metadata(packages: list[tuple[str, bool]]) -> dict[str, Any]:
+        return {}
+
+    def mock_is_unchanged(package_name: str, previous: dict[str, Any], has_stub_package: bool) -> bool:
+        # package_a has no new release since the last run
+        return package_name == "package_a"
+
+    monkeypatch.setattr("main.analyze_package", mock_analyze_package)
+    monkeypatch.setattr("main.prefetch_metadata", mock_prefetch_metadata)
+    monkeypatch.setattr("main.is_unchanged", mock_is_unchanged)
+
+    with open(json_report_file, "w") as f:
+        json.dump({"package_a": {"DownloadCount": 900, "DownloadRanking": 2,
+                                 "CoverageData": {"parameter_coverage": 50.0}}}, f)
+
+    main(top_n=2, write_json=True, incremental=True)
+    with open(json_report_file) as f:
+        package_report = json.load(f)
+
+    assert analyzed == ["package_b"]
+    assert package_report["package_a"] == {
+        "DownloadCount": 1000, "DownloadRanking": 1,
+        "CoverageData": {"parameter_coverage": 50.0},
+        "TypeshedData": {"typeshed_coverage": 85.0},
+    }
+
+
+def test_main_parallel_starts_biggest_first(
+    monkeypatch: pytest.MonkeyPatch, top_packages: list[dict[str, Any]], json_report_file: str
+) -> None:
+    top_packages[:] = [{"download_count": 1000 - i, "project": f"package_{i}"} for i in range(4)]
+
+    dispatched: list[str] = []
+
+    def mock_parallel_analyze_packages(
+        ranked_packages: dict[str, tuple[int, Optional[int]]], typeshed_data: dict[str, Any],
+        packages_with_stubs: set[str], journal: Any = None,
+    ) -> dict[str, Any]:
+        for name, (rank, _) in ranked_packages.items():
+            dispatched.append(name)
+            journal.record(name, {"DownloadRanking": rank, "CoverageData": {}})
+        return {}
+
+    monkeypatch.setattr("main.parallel_analyze_packages", mock_parallel_analyze_packages)
+
+    with open(json_report_file, "w") as f:
+        json.dump({"package_2": {"AnalyzedArtifact": {"size": 5000}},
+                   "package_3": {"AnalyzedArtifact": {"size": 100}}}, f)
+
+    main(top_n=4, write_json=True, parallel=True)
+    with open(json_report_file) as f:
+        package_report = json.load(f)
+
+    # Packages without a known size are taken to be of the median size
+    assert dispatched == ["package_2", "package_0", "package_1", "package_3"]
+    assert list(package_report) == [f"package_{i}" for i in range(4)]
+
+
+@pytest.mark.usefixtures("top_packages")
+def test_main_incremental_sequential_carries_forward_stub_packages(
+    monkeypatch: pytest.MonkeyPatch, json_report_file: str
+) -> None:
+    def artifact(name: str) -> Artifact:
+        return Artifact(f"https://example.com/{name}-1.0.tar.gz", f"{name}-digest", 100, "sdist", "1.0")
+
+    analyzed: list[str] = []
+
+    def mock_extract_files(package_name: str, temp_dir: str, artifacts: Any = None) -> tuple[list[str], bool]:
+        analyzed.append(package_name)
+        artifacts[package_name] = artifact(package_name)
+        return [f"{temp_dir}/{package_name}/module.py"], False
+
+    def mock_calculate_overall_coverage(files: list[str], file_records: Any = None) -> dict[str, float]:
+        return {"parameter_coverage": 50.0, "return_type_coverage": 50.0,
+                "skipped_files": 0, "oversized_files": 0, "surface_area": 1}
+
+    prefetched: list[list[tuple[str, bool]]] = []
+
+    def mock_prefetch_metadata(packages: list[tuple[str, bool]]) -> dict[str, Any]:
+        prefetched.append(packages)
+        return {}
+
+    def mock_get_packages_with_stubs() -> set[str]:
+        return {"package_a"}
+
+    def mock_stub_files_digest(package_name: str) -> str:
+        return "stubs"
+
+    monkeypatch.setattr("main.get_packages_with_stubs", mock_get_packages_with_stubs)
+    monkeypatch.setattr("main.prefetch_metadata", mock_prefetch_metadata)
+    monkeypatch.setattr("main.extract_files", mock_extract_files)
+    monkeypatch.setattr("main.calculate_overall_coverage", mock_calculate_overall_coverage)
+    monkeypatch.setattr("main.check_typeshed", in_typeshed)
+    monkeypatch.setattr("main.find_stub_files", no_stub_files)
+    monkeypatch.setattr("main.generate_report", Mock())
+    monkeypatch.setattr("analyzer.incremental.check_typeshed", in_typeshed)
+    monkeypatch.setattr("analyzer.incremental.find_archive", artifact)
+    monkeypatch.setattr("analyzer.incremental.stub_files_digest", mock_stub_files_digest)
+
+    main(top_n=2, write_json=True, incremental=True)
+    assert analyzed == ["package_a", "package_a-stubs", "package_b"]
+
+    # Nothing changed, so the second run analyzes nothing, including package_a and its stub package
+    analyzed.clear()
+    main(top_n=2, write_json=True, incremental=True)
+    with open(json_report_file) as f:
+        package_report = json.load(f)
+
+    assert analyzed == []
+    assert list(package_report) == ["package_a", "package_b"]
+    # The metadata is resolved up front, without --prefetch-metadata
+    assert prefetched[0] == [("package_a", True), ("package_b", False)]
+
+
+def test_query_function_index(tmp_path: Path, capsys: pytest.CaptureFixture[str]) -> None:
+    path = str(tmp_path / "functions.db")
+    function_index = FunctionIndex(path)
+    function_index.add_package("package_a", 1, [
+        ("a-1.0/a/core.py", "run", (2, 0, False)),
+        ("a-1.0/a/core.py", "_helper", (1, 0, False)),
+        ("a-1.0/a/core.py", "Client.get", (2, 2, True)),
+    ])
+    function_index.add_package("package_b", 7, [("b-1.0/b/cli.py", "run", (1, 0, False))])
+    function_index.close()
+
+    assert [function.qualname for function in query_function_index(path, least_annotated=10)] == [
+        "run", "run", "Client.get"]
+    assert [function.qualname for function in query_function_index(
+        path, least_annotated=10, include_private=True, max_rank=1)] == ["run", "_helper", "Client.get"]
+    assert [function.package for function in query_function_index(path, unannotated="run")] == [
+        "package_a", "package_b"]
+    assert [function.package for function in query_function_index(
+        path, unannotated="run", max_rank=5)] == ["package_a"]
+
+    output = capsys.readouterr().out
+    assert "    1  package_a  a-1.0/a/core.py  run  params 0/2 annotated, return unannotated" in output
+    assert "1 functions." in output
+
+
+def test_main_shards_and_merge(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path, top_packages: list[dict[str, Any]], json_report_file: str
+) -> None:
+    top_packages[:] = [{"download_count": 1000 - i, "project": f"package_{i}"} for i in range(5)]
+
+    def mock_analyze_package(package_name: str, **kwargs: Any) -> dict[str, Any]:
+        return {"DownloadRanking": kwargs["rank"], "CoverageData": {}}
+
+    mock_generate_report_html = Mock()
+    monkeypatch.setattr("main.analyze_package", mock_analyze_package)
+    monkeypatch.setattr("main.generate_report_html", mock_generate_report_html)
+
+    for index in (1, 2):
+        main(top_n=5, write_json=True, shard=(index, 2))
+    shard_files = [
+        str(tmp_path / f'package_report.shard{index}-of-2.json') for index in (1, 2)]
+    shard_reports: list[dict[str, Any]] = []
+    for shard_file in shard_files:
+        with open(shard_file) as f:
+            shard_reports.append(json.load(f))
+    assert not os.path.exists(json_report_file)
+
+    write_reports(merge_shard_reports(shard_files[::-1]), write_json=True, write_html=True,
+                  json_report_file=json_report_file)
+    with open(json_report_file) as f:
+        package_report = json.load(f)
+
+    assert sorted(len(shard_report) for shard_report in shard_reports) == [2, 3]
+    assert not set(shard_reports[0]) & set(shard_reports[1])
+    assert list(package_report) == [f"package_{i}" for i in range(5)]
+    mock_generate_report_html.assert_called_once()
+
+
+@pytest.mark.usefixtures("top_packages")
+def test_job_queue_workers(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    attempts: list[str] = []
+
+    def mock_analyze_package(package_name: str, **kwargs: Any) -> dict[str, Any]:
+        attempts.append(package_name)
+        if attempts.count("package_b") == 1:
+            raise requests.ConnectionError("connection reset")
+        return {"DownloadRanking": kwargs["rank"], "TypeshedData": kwargs["typeshed_data"].get(package_name, {})}
+
+    monkeypatch.setattr("main.analyze_package", mock_analyze_package)
+
+    job_queue = JobQueue(str(tmp_path / "jobs.db"))
+    enqueue_packages(job_queue, 2)
+    # A failed package is given back and retried
+    assert run_worker(job_queue) == 2
+    assert attempts == ["package_a", "package_b", "package_b"]
+
+    package_report = assemble_reports(job_queue)
+    job_queue.close()
+    assert list(package_report) == ["package_a", "package_b"]
+    assert package_report["package_a"]["TypeshedData"] == {"typeshed_coverage": 85.0}
+
+
+def test_analyze_package_isolated_records_limit_violations(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    class TimingOutSupervisor:
+        def run(self, func: Any, *args: Any, **kwargs: Any) -> Outcome:
+            return Outcome(TIMED_OUT, None, "Analysis took longer than 900 seconds.")
+
+    monkeypatch.setattr("main.get_supervisor", lambda: TimingOutSupervisor())
+    monkeypatch.setattr("main.check_typeshed", not_in_typeshed)
+    report = analyze_package_isolated(
+        "package_a", rank=1, download_count=1000,
+        typeshed_data=mock_download_typeshed_csv(), has_stub_package=False)
+
+    assert report == {
+        "DownloadCount": 1000,
+        "DownloadRanking": 1,
+        "AnalysisStatus": "timeout",
+        "AnalysisError": "Analysis took longer than 900 seconds.",
+        "CoverageData": {},
+        "HasTypeShed": False,
+        "HasStubsPackage": False,
+        "TypeshedData": {"typeshed_coverage": 85.0},
+    }
+    html_file = tmp_path / "index.html"
+    monkeypatch.setattr("analyzer.report_generator.HTML_REPORT_FILE", str(html_file))
+    generate_report_html({"package_a": report})
+    assert "Analysis timed out" in html_file.read_text()
+
+
+def forbid_requests() -> None:
+    """Makes every HTTP request in a worker process raise."""
+    def get(url: str, **kwargs: Any) -> Any:
+        raise RuntimeError(f"Requested {url}")
+
+    analyzer.http_client.get = get
+
+
+def test_analyze_package_isolated_uses_the_metadata_manifest(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    archive = tmp_path / "package_a-1.0.tar.gz"
+    archive.write_bytes(create_mock_tar_gz())
+    monkeypatch.setattr("analyzer.package_analyzer.metadata_manifest", {
+        "package_a": DistributionMetadata(
+            "package_a", True, "1.0", Artifact(archive.as_uri(), None, None, "sdist", "1.0"), None),
+        "package_a-stubs": DistributionMetadata(
+            "package_a-stubs", False, None, None, "Package 'package_a-stubs' not found on PyPI."),
+    })
+    monkeypatch.setattr("analyzer.supervisor.isolation", IsolationLimits(60.0, None, None, forbid_requests, ()))
+    try:
+        # The worker would raise if it looked up package_a or package_a-stubs on PyPI
+        report = analyze_package_isolated(
+            "package_a", rank=1, download_count=1000, typeshed_data={}, has_stub_package=False, parallel=True)
+    finally:
+        close_supervisors()
+    assert "AnalysisStatus" not in report
+    assert report["Provenance"]["artifacts"] == {"package_a": archive.as_uri()}
@@ -1,11 +1,26 @@
 from io import BytesIO
+import hashlib
 import tarfile
 import tempfile
 import os
+import zipfile
 from typing import Any
 import pytest
 from unittest.mock import Mock, patch
-from analyzer.package_analyzer import download_package, extract_files, find_stub_package
+from analyzer.package_analyzer import (
+    Artifact,
+    DistributionMetadata,
+    configure_artifact_cache,
+    configure_package_source,
+    download_package,
+    extract_files,
+    extract_sources,
+    fetch_archive,
+    find_archive,
+    find_stub_package,
+    read_archive_sources,
+    select_archive,
+)
 
 
 def test_download_package(monkeypatch: pytest.MonkeyPatch) -> None:
@@ -22,6 +37,8 @@ def test_download_package(monkeypatch: pytest.MonkeyPatch) -> None:
 
     def mock_get(*args: Any, **kwargs: Any) -> Any:
         class MockResponse:
+            status_code = 200
+
             def raise_for_status(self) -> None:
                 pass
 
@@ -35,9 +52,17 @@ def test_download_package(monkeypatch: pytest.MonkeyPatch) -> None:
                 # Return a valid tar.gz file content
                 return create_mock_tar_gz()
 
+            headers: dict[str, str] = {}
+
+            def iter_content(self, chunk_size: int) -> list[bytes]:
+                return [self.content]
+
+            def close(self) -> None:
+                pass
+
         return MockResponse()
 
-    monkeypatch.setattr("requests.get", mock_get)
+    monkeypatch.setattr("analyzer.http_client.get", mock_get)
 
     # Test the download and extraction
     with tempfile.TemporaryDirectory() as temp_dir:
@@ -46,7 +71,7 @@ def test_download_package(monkeypatch: pytest.MonkeyPatch) -> None:
 
 
 def test_extract_files(monkeypatch: pytest.MonkeyPatch) -> None:
-    def mock_download_package(package_name: str, temp_dir: str) -> str:
+    def mock_download_package(package_name: str, temp_dir: str, artifacts: Any = None) -> str:
         os.makedirs(f"{temp_dir}/fake_package_dir", exist_ok=True)
         with open(f"{temp_dir}/fake_package_dir/test.py", "w") as f:
             f.write("# Example Python file")
@@ -63,9 +88,10 @@ def test_extract_files(monkeypatch: pytest.MonkeyPatch) -> None:
 
 def test_find_stub_package_success() -> None:
     # Mock a successful response for an existing stub package
-    with patch("requests.get") as mock_get:
+    with patch("analyzer.http_client.get") as mock_get:
         mock_response = Mock()
         mock_response.status_code = 200
+        mock_response.json.return_value = {"urls": []}
         mock_get.return_value = mock_response
 
         package_name = "example_package"
@@ -79,7 +105,7 @@ def test_find_stub_package_success() -> None:
 
 def test_find_stub_package_not_found() -> None:
     # Mock a 404 response for a non-existing stub package
-    with patch("requests.get") as mock_get:
+    with patch("analyzer.http_client.get") as mock_get:
         mock_response = Mock()
         mock_response.status_code = 404
         mock_get.return_value = mock_response
@@ -90,3 +116,212 @@ def test_find_stub_package_not_found() -> None:
         assert stub_url is None
         mock_get.assert_called_once_with(
             f"https://pypi.org/pypi/{package_name}-stubs/json")
+
+
+def test_read_archive_sources() -> None:
+    members = {
+        "pkg-1.0/pkg/__init__.py": b"def f(x: int) -> int: ...",
+        "pkg-1.0/pkg/stubs.pyi": b"def g() -> None: ...",
+        "pkg-1.0/pkg/py.typed": b"",
+        "pkg-1.0/README.md": b"# pkg",
+    }
+
+    tar_bytes = BytesIO()
+    with tarfile.open(fileobj=tar_bytes, mode='w:gz') as tar:
+        for name, content in members.items():
+            info = tarfile.TarInfo(name=name)
+            info.size = len(content)
+            tar.addfile(info, BytesIO(content))
+    sources, has_py_typed_file = read_archive_sources(
+        "https://example.com/pkg-1.0.tar.gz", tar_bytes.getvalue())
+    assert sources == {
+        "pkg-1.0.tar.gz/pkg-1.0/pkg/__init__.py": b"def f(x: int) -> int: ...",
+        "pkg-1.0.tar.gz/pkg-1.0/pkg/stubs.pyi": b"def g() -> None: ...",
+    }
+    assert has_py_typed_file
+
+    zip_bytes = BytesIO()
+    with zipfile.ZipFile(zip_bytes, "w") as zip_file:
+        zip_file.writestr("pkg-1.0/pkg/__init__.py", b"def f(): ...")
+    sources, has_py_typed_file = read_archive_sources(
+        "https://example.com/pkg-1.0.zip", zip_bytes.getvalue())
+    assert sources == {"pkg-1.0.zip/pkg-1.0/pkg/__init__.py": b"def f(): ..."}
+    assert not has_py_typed_file
+
+    with pytest.raises(ValueError):
+        read_archive_sources("https://example.com/pkg-1.0.egg", b"")
+
+
+def mock_sdist_get(sdist: bytes, headers: dict[str, str], sha256: str = "") -> Any:
+    def mock_get(url: str, *args: Any, **kwargs: Any) -> Any:
+        response = Mock()
+        response.headers = headers if url.endswith(".tar.gz") else {}
+        response.json.return_value = {
+            "urls": [{
+                "packagetype": "sdist",
+                "url": "https://example.com/pkg-1.0.tar.gz",
+                "digests": {"sha256": sha256},
+            }]
+        }
+        # Arrives in two chunks
+        response.iter_content.return_value = [sdist[:10], sdist[10:]]
+        return response
+    return mock_get
+
+
+def test_download_package_extracts_only_sources(monkeypatch: pytest.MonkeyPatch) -> None:
+    members = {
+        "pkg-1.0/pkg/__init__.py": b"def f(x: int) -> int: ...",
+        "pkg-1.0/pkg/py.typed": b"",
+        "pkg-1.0/pkg/data.csv": b"a,b",
+        "../outside.py": b"def g(): ...",
+    }
+    tar_bytes = BytesIO()
+    with tarfile.open(fileobj=tar_bytes, mode='w:gz') as tar:
+        for name, content in members.items():
+            info = tarfile.TarInfo(name=name)
+            info.size = len(content)
+            tar.addfile(info, BytesIO(content))
+    monkeypatch.setattr("analyzer.http_client.get", mock_sdist_get(tar_bytes.getvalue(), {}))
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        package_dir = os.path.join(temp_dir, "package")
+        os.mkdir(package_dir)
+        download_package("pkg", package_dir)
+        extracted = sorted(
+            os.path.relpath(os.path.join(root, file), package_dir)
+            for root, _, files in os.walk(package_dir) for file in files)
+        # The archive itself is removed once extracted
+        assert extracted == ["pkg-1.0/pkg/__init__.py", "pkg-1.0/pkg/py.typed"]
+        assert os.listdir(temp_dir) == ["package"]
+
+
+def fetch_archive_url(package_name: str) -> tuple[str, bytes]:
+    artifact, content = fetch_archive(package_name)
+    return artifact.url, content
+
+
+def test_fetch_archive_enforces_max_archive_size(monkeypatch: pytest.MonkeyPatch) -> None:
+    sdist = b"x" * 100
+    monkeypatch.setattr("analyzer.package_analyzer.max_archive_bytes", 50)
+
+    # Rejected up front from Content-Length
+    monkeypatch.setattr("analyzer.http_client.get", mock_sdist_get(sdist, {"Content-Length": "100"}))
+    with pytest.raises(ValueError, match="maximum archive size"):
+        fetch_archive("pkg")
+
+    # Or while streaming when there is no Content-Length
+    monkeypatch.setattr("analyzer.http_client.get", mock_sdist_get(sdist, {}))
+    with pytest.raises(ValueError, match="maximum archive size"):
+        fetch_archive("pkg")
+
+    monkeypatch.setattr("analyzer.package_analyzer.max_archive_bytes", 100)
+    assert fetch_archive_url("pkg") == ("https://example.com/pkg-1.0.tar.gz", sdist)
+
+
+def test_fetch_archive_uses_artifact_cache(monkeypatch: pytest.MonkeyPatch, tmp_path: Any) -> None:
+    sdist = b"x" * 100
+    monkeypatch.setattr("analyzer.package_analyzer.artifact_cache", None)
+    configure_artifact_cache(str(tmp_path))
+    mock_get = Mock(side_effect=mock_sdist_get(sdist, {}, hashlib.sha256(sdist).hexdigest()))
+    monkeypatch.setattr("analyzer.http_client.get", mock_get)
+
+    assert fetch_archive_url("pkg") == ("https://example.com/pkg-1.0.tar.gz", sdist)
+    assert mock_get.call_count == 2
+    # The second time only the metadata is fetched
+    assert fetch_archive_url("pkg") == ("https://example.com/pkg-1.0.tar.gz", sdist)
+    assert mock_get.call_count == 3
+
+    # An archive that doesn't match its digest is rejected and not cached
+    monkeypatch.setattr("analyzer.http_client.get", mock_sdist_get(b"y" * 100, {}, "0" * 64))
+    with pytest.raises(ValueError, match="sha256"):
+        fetch_archive("pkg")
+
+
+def test_missing_distributions_are_remembered(monkeypatch: pytest.MonkeyPatch, tmp_path: Any) -> None:
+    monkeypatch.setattr("analyzer.package_analyzer.artifact_cache", None)
+    configure_artifact_cache(str(tmp_path))
+    with patch("analyzer.http_client.get") as mock_get:
+        mock_get.return_value.status_code = 404
+        assert find_stub_package("pkg") is None
+        assert find_stub_package("pkg") is None
+        mock_get.assert_called_once_with("https://pypi.org/pypi/pkg-stubs/json")
+
+    with patch("analyzer.http_client.get") as mock_get:
+        mock_get.return_value.json.return_value = {"urls": [{"packagetype": "bdist_wheel", "url": "x"}]}
+        for _ in range(2):
+            with pytest.raises(ValueError, match="Source distribution"):
+                fetch_archive("pkg")
+        mock_get.assert_called_once_with("https://pypi.org/pypi/pkg/json")
+
+
+def test_select_archive_prefers_wheels(monkeypatch: pytest.MonkeyPatch) -> None:
+    def url_info(filename: str, size: int) -> dict[str, Any]:
+        packagetype = "bdist_wheel" if filename.endswith(".whl") else "sdist"
+        return {"packagetype": packagetype, "url": f"https://example.com/{filename}", "filename": filename, "size": size}
+
+    sdist = url_info("pkg-1.0.tar.gz", 300)
+    linux = url_info("pkg-1.0-cp312-cp312-manylinux_2_17_x86_64.whl", 200)
+    windows = url_info("pkg-1.0-cp312-cp312-win_amd64.whl", 100)
+    pure = url_info("pkg-1.0-py3-none-any.whl", 250)
+
+    data = {"urls": [sdist, linux, windows, pure]}
+    assert select_archive("pkg", data).packagetype == "sdist"
+
+    monkeypatch.setattr("analyzer.package_analyzer.prefer_wheels", True)
+    assert select_archive("pkg", data).url == pure["url"]
+    assert select_archive("pkg", {"urls": [sdist, linux, windows]}).url == windows["url"]
+    assert select_archive("pkg", {"urls": [sdist]}).url == sdist["url"]
+    with pytest.raises(ValueError, match="No wheel or source distribution"):
+        select_archive("pkg", {"urls": []})
+
+    # A wheel not named to the spec counts as a platform wheel
+    unnamed = url_info("pkg.whl", 50)
+    assert select_archive("pkg", {"urls": [sdist, unnamed, pure]}).url == pure["url"]
+
+
+def test_read_archive_sources_from_wheel() -> None:
+    wheel = BytesIO()
+    with zipfile.ZipFile(wheel, "w") as zip_file:
+        zip_file.writestr("pkg/__init__.py", b"def f(): ...")
+        zip_file.writestr("pkg/py.typed", b"")
+        zip_file.writestr("pkg-1.0.dist-info/METADATA", b"Name: pkg")
+    sources, has_py_typed_file = read_archive_sources(
+        "https://example.com/pkg-1.0-py3-none-any.whl", wheel.getvalue())
+    assert sources == {"pkg-1.0-py3-none-any.whl/pkg/__init__.py": b"def f(): ..."}
+    assert has_py_typed_file
+
+
+def test_lookups_use_metadata_manifest(monkeypatch: pytest.MonkeyPatch) -> None:
+    artifact = Artifact("https://example.com/pkg-1.0.tar.gz", None, 100, "sdist")
+    monkeypatch.setattr("analyzer.package_analyzer.metadata_manifest", {
+        "pkg": DistributionMetadata("pkg", True, "1.0", artifact, None),
+        "pkg-stubs": DistributionMetadata("pkg-stubs", False, None, None, "not found"),
+        "wheels-only": DistributionMetadata("wheels-only", True, "2.0", None, "no sdist"),
+    })
+    with patch("analyzer.http_client.get") as mock_get:
+        assert find_archive("pkg") == artifact
+        assert find_stub_package("pkg") is None
+        with pytest.raises(ValueError, match="no sdist"):
+            find_archive("wheels-only")
+        mock_get.assert_not_called()
+
+
+def test_directory_package_source(monkeypatch: pytest.MonkeyPatch, tmp_path: Any) -> None:
+    with tarfile.open(tmp_path / "pkg-1.0.tar.gz", mode="w:gz") as tar:
+        content = b"def f(x: int) -> int: ..."
+        info = tarfile.TarInfo(name="pkg-1.0/pkg/__init__.py")
+        info.size = len(content)
+        tar.addfile(info, BytesIO(content))
+    monkeypatch.setattr("analyzer.package_analyzer.package_source", None)
+    configure_package_source(str(tmp_path))
+
+    with patch("analyzer.http_client.get") as mock_get:
+        assert extract_sources("pkg") == ({"pkg-1.0.tar.gz/pkg-1.0/pkg/__init__.py": content}, False)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            files, _ = extract_files("pkg", temp_dir)
+            assert [os.path.relpath(file, temp_dir) for file in files] == ["pkg-1.0/pkg/__init__.py"]
+        assert find_stub_package("pkg") is None
+        mock_get.assert_not_called()
+    # The archive is read in place
+    assert os.listdir(tmp_path) == ["pkg-1.0.tar.gz"]
@@ -0,0 +1,74 @@
+import json
+from pathlib import Path
+
+from packaging.version import Version
+
+from analyzer.package_source import ArchiveDirectory, IndexFile, SimpleIndex, parse_filename, release_metadata
+
+
+def test_parse_filename() -> None:
+    assert parse_filename("Foo_Bar-1.0.tar.gz") == ("foo-bar", Version("1.0"), "sdist")
+    assert parse_filename("foo_bar-stubs-2.0.tgz") == ("foo-bar-stubs", Version("2.0"), "sdist")
+    assert parse_filename("foo_bar-1.0-py3-none-any.whl") == ("foo-bar", Version("1.0"), "bdist_wheel")
+    assert parse_filename("foo_bar-1.0.exe") is None
+    assert parse_filename("README.md") is None
+
+
+def test_release_metadata_picks_latest_final_release() -> None:
+    files = [
+        IndexFile("pkg-1.0.tar.gz", "https://files/pkg-1.0.tar.gz", "a" * 64, 10),
+        IndexFile("pkg-1.10.tar.gz", "https://files/pkg-1.10.tar.gz", None, None),
+        IndexFile("pkg-1.10-py3-none-any.whl", "https://files/pkg-1.10-py3-none-any.whl", None, 5),
+        IndexFile("pkg-2.0rc1.tar.gz", "https://files/pkg-2.0rc1.tar.gz", None, None),
+        IndexFile("pkg_stubs-3.0.tar.gz", "https://files/pkg_stubs-3.0.tar.gz", None, None),
+    ]
+    metadata = release_metadata("pkg", files)
+    assert metadata is not None
+    assert metadata["info"]["version"] == "1.10"
+    assert [url["packagetype"] for url in metadata["urls"]] == ["sdist", "bdist_wheel"]
+
+    assert release_metadata("pkg", files[3:4])["info"]["version"] == "2.0rc1"  # type: ignore[index]
+    assert release_metadata("other", files) is None
+
+
+def test_simple_index_reads_json_and_html_pages() -> None:
+    index = SimpleIndex("http://mirror/simple")
+    page_url = index.page_url("Foo.Bar")
+    assert page_url == "http://mirror/simple/foo-bar/"
+
+    json_page = json.dumps({"meta": {"api-version": "1.1"}, "name": "foo-bar", "files": [
+        {"filename": "foo_bar-1.0.tar.gz", "url": "../../files/foo_bar-1.0.tar.gz",
+         "hashes": {"sha256": "b" * 64}, "size": 42},
+        {"filename": "foo_bar-1.1.tar.gz", "url": "../../files/foo_bar-1.1.tar.gz",
+         "hashes": {}, "yanked": "broken"},
+    ]}).encode()
+    metadata = index.metadata("Foo.Bar", page_url, json_page)
+    assert metadata is not None
+    assert metadata["urls"] == [{
+        "filename": "foo_bar-1.0.tar.gz", "url": "http://mirror/files/foo_bar-1.0.tar.gz",
+        "packagetype": "sdist", "digests": {"sha256": "b" * 64}, "size": 42,
+    }]
+
+    html_page = (
+        b'<!DOCTYPE html><html><body>'
+        b'<a href="../../files/foo_bar-1.0.tar.gz#sha256=' + b"c" * 64 + b'">foo_bar-1.0.tar.gz</a>'
+        b'<a href="../../files/foo_bar-1.1.tar.gz" data-yanked="">foo_bar-1.1.tar.gz</a>'
+        b'</body></html>'
+    )
+    assert index.parse_page(page_url, html_page) == [
+        IndexFile("foo_bar-1.0.tar.gz", "http://mirror/files/foo_bar-1.0.tar.gz", "c" * 64, None)]
+
+
+def test_archive_directory(tmp_path: Path) -> None:
+    (tmp_path / "foo-bar").mkdir()
+    (tmp_path / "foo-bar" / "foo_bar-1.0.tar.gz").write_bytes(b"x" * 7)
+    (tmp_path / "foo_bar-0.9.tar.gz").write_bytes(b"")
+    (tmp_path / "notes.txt").write_text("")
+
+    directory = ArchiveDirectory(str(tmp_path))
+    metadata = directory.metadata("Foo_Bar")
+    assert metadata is not None
+    [url] = metadata["urls"]
+    assert url["url"] == (tmp_path / "foo-bar" / "foo_bar-1.0.tar.gz").as_uri()
+    assert url["size"] == 7
+    assert directory.metadata("foo-bar-stubs") is None
@@ -0,0 +1,92 @@
+import os
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+from analyzer.disk_store import LruStore
+from analyzer.parse_cache import ParseCache
+
+
+def test_store_and_load(tmp_path: Path) -> None:
+    cache = ParseCache(str(tmp_path), "1")
+    key = cache.key(b"def f(x: int) -> int: ...")
+    with pytest.raises(KeyError):
+        cache.load(key)
+
+    cache.store(key, {"f": [1, 1, True]})
+    assert cache.load(key) == {"f": [1, 1, True]}
+
+    # Unparseable files are cached too
+    none_key = cache.key(b"def broken(")
+    cache.store(none_key, None)
+    assert cache.load(none_key) is None
+
+
+def test_key_depends_on_content_and_version(tmp_path: Path) -> None:
+    cache = ParseCache(str(tmp_path), "1")
+    assert cache.key(b"a") == cache.key(b"a")
+    assert cache.key(b"a") != cache.key(b"b")
+    assert cache.key(b"a") != ParseCache(str(tmp_path), "2").key(b"a")
+
+
+def test_key_depends_on_python_version(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    cache = ParseCache(str(tmp_path), "1")
+    key = cache.key(b"a")
+    monkeypatch.setattr("analyzer.parse_cache.sys", SimpleNamespace(version_info=(3, 99, 0)))
+    assert cache.key(b"a") != key
+
+
+def test_rewriting_an_entry_does_not_grow_the_cache(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    cache = ParseCache(str(tmp_path), "1", max_bytes=1000)
+    evictions: list[None] = []
+
+    def evict(self: LruStore) -> None:
+        evictions.append(None)
+
+    monkeypatch.setattr(LruStore, "evict", evict)
+    key = cache.key(b"a")
+    for _ in range(20):
+        cache.store(key, "x" * 200)
+    assert evictions == []
+
+
+def test_evicts_least_recently_used(tmp_path: Path) -> None:
+    cache = ParseCache(str(tmp_path), "1", max_bytes=1000)
+    keys = [cache.key(str(i).encode()) for i in range(4)]
+    for i, key in enumerate(keys):
+        cache.store(key, "x" * 200)
+        # Make modification times strictly increasing
+        past = time.time() - 100 + i
+        os.utime(cache._path(key), (past, past))  # type: ignore[reportPrivateUsage]
+
+    # Reading the oldest entry makes it the most recently used
+    cache.load(keys[0])
+    cache.store(cache.key(b"new"), "x" * 200)
+
+    cache.load(keys[0])
+    for key in keys[1:3]:
+        with pytest.raises(KeyError):
+            cache.load(key)
+    cache.load(keys[3])
+
+
+def test_concurrent_writers(tmp_path: Path) -> None:
+    cache = ParseCache(str(tmp_path), "1")
+    key = cache.key(b"shared")
+
+    def write(i: int) -> None:
+        for _ in range(50):
+            cache.store(key, {"writer": i})
+
+    threads = [threading.Thread(target=write, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert cache.load(key)["writer"] in range(8)
+    assert [f for f in os.listdir(os.path.dirname(cache._path(key)))  # type: ignore[reportPrivateUsage]
+            if f.endswith(".tmp")] == []
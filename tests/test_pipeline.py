@@ -0,0 +1,89 @@
+import threading
+import time
+from typing import Optional
+
+import pytest
+
+from analyzer.async_fetch import FetchedPackage
+from analyzer.package_analyzer import Artifact
+from analyzer.pipeline import download_package_archives, run_pipeline
+
+
+def fake_fetch_archive(name: str) -> tuple[Artifact, bytes]:
+    if name == "missing":
+        raise ValueError(f"Package {name} not found on PyPI.")
+    return Artifact(f"https://example.com/{name}-1.0.tar.gz", None, None, "sdist"), name.encode()
+
+
+@pytest.fixture
+def fake_downloads(monkeypatch: pytest.MonkeyPatch) -> None:
+    def check_typeshed(name: str) -> bool:
+        return False
+
+    monkeypatch.setattr("analyzer.pipeline.fetch_archive", fake_fetch_archive)
+    monkeypatch.setattr("analyzer.pipeline.check_typeshed", check_typeshed)
+
+    def find_stub_package(name: str) -> Optional[str]:
+        return "https://pypi.org/project/beta-stubs/" if name == "beta" else None
+
+    monkeypatch.setattr("analyzer.pipeline.find_stub_package", find_stub_package)
+    monkeypatch.setattr("analyzer.coverage_calculator.parse_workers", 2)
+
+
+def test_download_package_archives(fake_downloads: None) -> None:
+    fetched = download_package_archives("beta", False)
+    assert set(fetched.archives) == {"beta", "beta-stubs"}
+    assert fetched.stub_package_url == "https://pypi.org/project/beta-stubs/"
+
+    fetched = download_package_archives("missing", False)
+    assert fetched.archives == {}
+    assert "not found" in fetched.errors["missing"]
+
+
+def test_run_pipeline(fake_downloads: None) -> None:
+    results = dict(run_pipeline(
+        [("alpha", False), ("beta", False), ("missing", False)],
+        lambda fetched: sorted(fetched.archives)))
+    assert results == {"alpha": ["alpha"], "beta": ["beta", "beta-stubs"], "missing": []}
+
+
+def test_run_pipeline_backpressure(fake_downloads: None, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr("analyzer.pipeline.QUEUED_PER_PARSE_WORKER", 1)
+    monkeypatch.setattr("analyzer.pipeline.download_workers", 2)
+    downloaded: list[str] = []
+
+    def fetch_archive(name: str) -> tuple[Artifact, bytes]:
+        downloaded.append(name)
+        return fake_fetch_archive(name)
+
+    monkeypatch.setattr("analyzer.pipeline.fetch_archive", fetch_archive)
+    # Nothing is parsed until the downloads have had time to run ahead
+    release = threading.Event()
+    downloaded_before_release: list[int] = []
+
+    def analyze(fetched: FetchedPackage) -> str:
+        release.wait()
+        return fetched.name
+
+    def start_parsing() -> None:
+        downloaded_before_release.append(len(downloaded))
+        release.set()
+
+    names = [f"package{i}" for i in range(20)]
+    results = run_pipeline([(name, False) for name in names], analyze)
+    threading.Timer(0.5, start_parsing).start()
+    first = next(results)
+    assert sorted([first, *results]) == sorted((name, name) for name in names)
+    # Two packages being parsed, two queued, and one per download worker waiting for room
+    assert downloaded_before_release == [6]
+
+
+def test_run_pipeline_error(fake_downloads: None) -> None:
+    def analyze(fetched: FetchedPackage) -> str:
+        if fetched.name == "beta":
+            raise RuntimeError("parse failed")
+        time.sleep(0.01)
+        return fetched.name
+
+    with pytest.raises(RuntimeError, match="parse failed"):
+        list(run_pipeline([(f"package{i}", False) for i in range(10)] + [("beta", False)], analyze))
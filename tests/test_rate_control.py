@@ -0,0 +1,80 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from analyzer.rate_control import INITIAL_CONCURRENCY, CircuitOpenError, RequestController
+
+
+def test_token_bucket_limits_rate() -> None:
+    controller = RequestController(rate=10.0, burst=2)
+    now = time.monotonic()
+    assert controller.try_acquire(now) == 0
+    assert controller.try_acquire(now) == 0
+    # The burst is spent, so the next token is a tenth of a second away
+    assert controller.try_acquire(now) == pytest.approx(0.1)
+    assert controller.try_acquire(now + 0.1) == 0
+    assert controller.in_flight == 3
+
+
+def test_concurrency_limit_adapts(monkeypatch: pytest.MonkeyPatch) -> None:
+    controller = RequestController(rate=None, max_concurrency=64)
+    assert controller.limit == INITIAL_CONCURRENCY
+
+    def request(latency: float, status: int) -> None:
+        assert controller.try_acquire() == 0
+        controller.release(latency, status)
+
+    # Additive increase: about one per limit's worth of healthy responses
+    for _ in range(INITIAL_CONCURRENCY):
+        request(0.05, 200)
+    assert controller.limit == pytest.approx(INITIAL_CONCURRENCY + 1, abs=0.1)
+
+    # Multiplicative decrease on throttling, once per interval
+    request(0.05, 429)
+    limit = controller.limit
+    assert limit == pytest.approx((INITIAL_CONCURRENCY + 1) / 2, abs=0.1)
+    request(0.05, 429)
+    assert controller.limit == limit
+
+    # Slow responses count as congestion too, once the interval has passed
+    monkeypatch.setattr("analyzer.rate_control.DECREASE_INTERVAL", 0.0)
+    for _ in range(10):
+        request(1.0, 200)
+    assert controller.limit < limit
+
+
+def test_requests_wait_for_a_free_slot() -> None:
+    controller = RequestController(rate=None, max_concurrency=1)
+    controller.acquire()
+    assert controller.try_acquire() > 0
+
+    async def acquire() -> float:
+        started = time.monotonic()
+        await controller.acquire_async()
+        return time.monotonic() - started
+
+    threading.Timer(0.05, controller.release, (0.01, 200)).start()
+    waited = asyncio.run(acquire())
+    assert 0.04 < waited < 0.5
+    assert controller.in_flight == 1
+
+
+def test_circuit_breaker() -> None:
+    controller = RequestController(rate=None, failure_threshold=3, open_seconds=30.0)
+    for _ in range(3):
+        controller.acquire()
+        controller.release(0.01, None)
+    assert controller.circuit_open
+    with pytest.raises(CircuitOpenError):
+        controller.try_acquire()
+
+    # Once open_seconds pass, a single probe goes through
+    later = time.monotonic() + 30.0
+    assert controller.try_acquire(later) == 0
+    with pytest.raises(CircuitOpenError):
+        controller.try_acquire(later)
+    controller.release(0.01, 200)
+    assert not controller.circuit_open
+    assert controller.try_acquire() == 0
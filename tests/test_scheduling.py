@@ -0,0 +1,46 @@
+import pytest
+
+from analyzer.scheduling import estimated_costs, longest_first, parse_shard, partition
+
+
+def test_parse_shard() -> None:
+    assert parse_shard("1/4") == (1, 4)
+    assert parse_shard("4/4") == (4, 4)
+    for spec in ("0/4", "5/4", "1", "a/b"):
+        with pytest.raises(ValueError):
+            parse_shard(spec)
+
+
+def test_estimated_costs() -> None:
+    previous_report = {
+        "small": {"AnalyzedArtifact": {"size": 10}},
+        "large": {"AnalyzedArtifact": {"size": 1000}},
+        "medium": {"AnalyzedArtifact": {"size": 100}},
+        "failed": {"AnalyzedArtifact": None},
+    }
+    assert estimated_costs(["small", "large", "medium", "failed", "new"], previous_report) == {
+        "small": 10, "large": 1000, "medium": 100, "failed": 100, "new": 100}
+    assert estimated_costs(["new"], {}) == {"new": 1}
+    # Sizes of the archives to analyze now come first
+    assert estimated_costs(["small", "new"], previous_report, {"small": 50, "new": 30}) == {"small": 50, "new": 30}
+
+
+def test_longest_first() -> None:
+    names = ["a", "b", "c", "d"]
+    costs = {"a": 1, "b": 5, "c": 1, "d": 3}
+    assert longest_first(names, costs) == ["b", "d", "a", "c"]
+
+
+def test_partition() -> None:
+    names = [f"package{i}" for i in range(10)]
+    costs = {name: 1 for name in names}
+    costs["package5"] = 5
+    shards = partition(names, costs, 3)
+
+    assert shards == partition(names, costs, 3)
+    assert sorted(name for shard in shards for name in shard) == sorted(names)
+    # The expensive package gets a shard with less else to do
+    loads = sorted(sum(costs[name] for name in shard) for shard in shards)
+    assert loads == [4, 5, 5]
+    for shard in shards:
+        assert shard == sorted(shard, key=names.index)
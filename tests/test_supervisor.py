@@ -0,0 +1,62 @@
+import os
+import time
+
+import pytest
+
+from analyzer.supervisor import CRASHED, OK, OVER_MEMORY_LIMIT, TIMED_OUT, IsolationLimits, Supervisor
+
+
+def square(x: int) -> tuple[int, int]:
+    return x * x, os.getpid()
+
+
+def sleep(seconds: float) -> None:
+    time.sleep(seconds)
+
+
+def allocate(megabytes: int) -> None:
+    hog = b"x" * (megabytes * 1024 * 1024)
+    time.sleep(5)
+    del hog
+
+
+def fail() -> None:
+    raise ValueError("bad package")
+
+
+def exit_abruptly() -> None:
+    os._exit(3)
+
+
+def limits(**kwargs: object) -> IsolationLimits:
+    defaults: dict[str, object] = {
+        "timeout": 5.0, "max_rss_bytes": None, "tasks_per_worker": None, "initializer": None, "initargs": ()}
+    return IsolationLimits(**{**defaults, **kwargs})  # type: ignore[arg-type]
+
+
+def test_supervisor_runs_and_recycles_workers() -> None:
+    supervisor = Supervisor(limits(tasks_per_worker=2))
+    outcomes = [supervisor.run(square, x) for x in range(3)]
+    supervisor.close()
+
+    assert [outcome.status for outcome in outcomes] == [OK] * 3
+    assert [outcome.result[0] for outcome in outcomes] == [0, 1, 4]
+    pids = [outcome.result[1] for outcome in outcomes]
+    assert pids[0] == pids[1] != pids[2]
+    assert os.getpid() not in pids
+
+
+def test_supervisor_enforces_limits() -> None:
+    supervisor = Supervisor(limits(timeout=1.0))
+    assert supervisor.run(sleep, 10).status == TIMED_OUT
+    supervisor.close()
+
+    supervisor = Supervisor(limits(timeout=10.0, max_rss_bytes=200 * 1024 * 1024))
+    if os.path.exists("/proc/self/statm"):
+        assert supervisor.run(allocate, 400).status == OVER_MEMORY_LIMIT
+    assert supervisor.run(exit_abruptly).status == CRASHED
+    with pytest.raises(ValueError, match="bad package"):
+        supervisor.run(fail)
+    # A new worker takes over after each one that was killed
+    assert supervisor.run(square, 3).result[0] == 9
+    supervisor.close()
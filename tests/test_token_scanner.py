@@ -0,0 +1,84 @@
+import os
+
+from analyzer.coverage_calculator import analyze_source, compare_fast_scan
+from analyzer.token_scanner import scan_source
+
+TEST_FILES_DIR = "tests/test_files"
+
+
+def test_scan_source_matches_ast_engine_on_test_files() -> None:
+    files = sorted(os.path.join(TEST_FILES_DIR, file)
+                   for file in os.listdir(TEST_FILES_DIR))
+    assert compare_fast_scan(files) == []
+
+
+def test_scan_source_parameter_kinds() -> None:
+    source = b'''
+def positional_only(a, b: int, /, c, d: int = 1, *args: int, e, f: int, **kwargs): ...
+
+def defaults(a=lambda x, y: x, b: str = f"{__name__:>10} (", c={"k": [1, 2]}) -> None: ...
+
+def generic[T: (int, str)](self, x: T) -> T: ...
+
+def multiline(
+    self,  # comment
+    x: int,
+    y,
+): ...
+
+async def coroutine(a, b):
+    def inside_coroutine(c: int): ...
+'''
+    assert scan_source(source, "kinds.py") == {
+        "positional_only": (2, 1, False),
+        "defaults": (3, 1, True),
+        "generic": (1, 1, True),
+        "multiline": (2, 1, False),
+        "inside_coroutine": (1, 1, False),
+    }
+    assert scan_source(source, "kinds.py") == analyze_source(source, "kinds.py")
+
+
+def test_scan_source_scopes_and_duplicates() -> None:
+    source = b'''
+class A:
+    def method(self): ...
+
+    @property
+    def value(self) -> int: ...
+
+    @value.setter
+    def value(self, value: int) -> None: ...
+
+    if True:
+        def conditional(self): ...
+    elif False:
+        def conditional(self, x): ...
+    else:
+        def in_else(self): ...
+
+    class B:
+        def method(self, x: int): ...
+
+def outer():
+    def method(x): ...
+
+try:
+    def method(x: int) -> int: ...
+except ImportError:
+    pass
+
+match = 1
+'''
+    assert scan_source(source, "scopes.py") == analyze_source(source, "scopes.py")
+    record = scan_source(source, "scopes.py")
+    assert record is not None
+    assert record["A.value"] == (0, 0, True)
+    assert record["conditional"] == (0, 0, False)
+    # The nested function and the one in try are equally deep; the first one wins
+    assert record["method"] == (1, 0, False)
+
+
+def test_scan_source_unparseable() -> None:
+    assert scan_source(b"def broken(\n", "broken.py") is None
+    assert scan_source(b"if x:\n    a\n  b\n", "indent.py") is None
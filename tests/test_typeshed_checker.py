@@ -3,7 +3,8 @@ import pytest
 from analyzer.typeshed_checker import (
     check_typeshed,
     find_stub_files,
-    merge_files_with_stubs
+    merge_files_with_stubs,
+    stub_files_digest,
 )
 from pathlib import Path
 
@@ -60,6 +61,19 @@ def test_find_stub_files(mock_typeshed: str, monkeypatch: pytest.MonkeyPatch) ->
                         "stubs/mock_package/module.pyi") in stubs
 
 
+def test_stub_files_digest(mock_typeshed: str, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(
+        "analyzer.typeshed_checker.TYPESHED_DIR", os.path.join(mock_typeshed, 'typeshed'))
+
+    digest = stub_files_digest("mock_package")
+    assert digest is not None
+    assert stub_files_digest("mock_package") == digest
+    assert stub_files_digest("missing_package") is None
+
+    Path(mock_typeshed, "typeshed", "stubs", "mock_package", "module.pyi").write_text("def f() -> None: ...")
+    assert stub_files_digest("mock_package") != digest
+
+
 def test_merge_files_with_stubs() -> None:
     """Test merge_files_with_stubs function."""
     package_files = [